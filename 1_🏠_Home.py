@@ -22,6 +22,8 @@ if parent_dir not in sys.path:
 from enhanced_safety import get_enhanced_safety_analysis, display_enhanced_safety_timeline, enhance_safety_map, display_safety_recommendations
 from ml_models import safety_model, risk_classifier, generate_time_predictions
 from utils.ml_utils import predict_route_safety, get_safety_time_predictions, validate_ml_model_inputs
+from utils.crash_dataset import crash_dataset
+from utils.offline_geocoder import DEFAULT_COORDS
 import utils  # Import utils for access to the original safety functions
 
 # Initialize session state if it doesn't exist
@@ -138,6 +140,8 @@ def main():
         
         # Filter addresses that match what user typed for origin
         origin_matches = [addr for addr in san_jose_addresses if origin_input.lower() in addr.lower()]
+        origin_matches += [name for name in crash_dataset.get_geocoder().suggest(origin_input)
+                           if name not in origin_matches]
         
         # Show dropdown of matched addresses for origin
         if origin_matches:
@@ -168,6 +172,8 @@ def main():
         # Filter addresses that match what user typed for destination
         destination_matches = [addr for addr in san_jose_addresses if destination_input.lower() in addr.lower() 
                               and addr != origin]  # Exclude the origin address
+        destination_matches += [name for name in crash_dataset.get_geocoder().suggest(destination_input)
+                                if name not in destination_matches and name != origin]
         
         # Show dropdown of matched addresses for destination
         if destination_matches:
@@ -187,45 +193,14 @@ def main():
         # Add a note about address entry
         st.caption("📍 Type any address, place, or intersection in San Jose for suggestions")
         
-        # Improve the geocoding simulation
-        def simulate_geocoding(location):
-            """Simulate geocoding for demonstration purposes"""
-            # Map common San Jose locations to coordinates
-            location_map = {
-                "downtown san jose": [37.3382, -121.8863],
-                "santana row": [37.3209, -121.9476],
-                "san jose state university": [37.3352, -121.8811],
-                "san jose international airport": [37.3639, -121.9289],
-                "willow glen": [37.3094, -121.8990],
-                "japantown": [37.3480, -121.8950],
-                "east san jose": [37.3509, -121.8121],
-                "north san jose": [37.3871, -121.9334],
-                "south san jose": [37.2424, -121.8747],
-                "west san jose": [37.3239, -121.9769],
-                "san jose city hall": [37.3374, -121.8862],
-                "winchester mystery house": [37.3184, -121.9511],
-                "valley fair mall": [37.3261, -121.9465],
-                "communications hill": [37.2924, -121.8583],
-                "alum rock": [37.3772, -121.8244]
-            }
-            
-            # Default coordinates for San Jose downtown
-            default_coords = [37.3382, -121.8863]
-            
-            # Try to find a match (case insensitive)
-            loc_lower = location.lower()
-            
-            # Check for exact matches first
-            if loc_lower in location_map:
-                return location_map[loc_lower]
-            
-            # Check for partial matches
-            for key, coords in location_map.items():
-                if key in loc_lower or loc_lower in key:
-                    return coords
-            
-            # Return default if no match
-            return default_coords
+        # Resolve locations with the offline geocoder built from the crash intersections
+        def geocode_location(location):
+            """Convert a place, intersection or street to [lat, lng], defaulting to downtown"""
+            result = crash_dataset.get_geocoder().geocode(location)
+            if result is None:
+                st.warning(f"Could not find \"{location}\" in San Jose; using downtown San Jose instead.")
+                return list(DEFAULT_COORDS)
+            return [result['lat'], result['lng']]
         
         # Time selection with better UX
         st.subheader("⏰ When do you plan to travel?")
@@ -305,9 +280,9 @@ def main():
     except:
         OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 
-    # Convert locations to coordinates using our simulation function
-    origin_coords = simulate_geocoding(origin)
-    dest_coords = simulate_geocoding(destination)
+    # Convert locations to coordinates with the offline geocoder
+    origin_coords = geocode_location(origin)
+    dest_coords = geocode_location(destination)
     
     # Create a simple route by connecting origin and destination with intermediate points
     def create_simulated_route(origin, destination):
@@ -346,8 +321,36 @@ def main():
         
         return route
     
+    def get_route_options(origin_coords, dest_coords, prioritize_safety, mode):
+        """
+        Pick routes for the slider from the trip's time/risk frontier (searched once per trip),
+        or from the router's contraction hierarchy at precomputed slider settings,
+        plus distinct alternatives to the recommended route
+        """
+        try:
+            router = crash_dataset.get_router()
+            trip = (tuple(origin_coords), tuple(dest_coords), mode)
+            cached = st.session_state.get('route_frontier')
+            if not cached or cached['trip'] != trip:
+                cached = {'trip': trip, 'routes': router.route_frontier(origin_coords, dest_coords, mode), 'alternatives': {}}
+                st.session_state['route_frontier'] = cached
+            options = router.route_options(origin_coords, dest_coords, prioritize_safety, mode, frontier=cached['routes'])
+            if prioritize_safety not in cached['alternatives']:
+                cached['alternatives'][prioritize_safety] = router.alternative_routes(
+                    origin_coords, dest_coords, prioritize_safety, mode, k=3, first=options['recommended']
+                ) if options['recommended'] else []
+            options['alternatives'] = cached['alternatives'][prioritize_safety]
+            return options
+        except Exception as e:
+            print(f"Routing failed, using a simulated route: {str(e)}")
+            return {}
+    
+    # Route over the intersection graph, weighing crash history by the safety slider
+    route_options = get_route_options(origin_coords, dest_coords, prioritize_safety, selected_transport)
+    
     # Create route coordinates
-    route_coords = create_simulated_route(origin_coords, dest_coords)
+    recommended_route = route_options.get('recommended')
+    route_coords = recommended_route['path'] if recommended_route else create_simulated_route(origin_coords, dest_coords)
     
     # Create simulated incidents (safety hotspots) along and near route
     def create_simulated_incidents(route, count=5):
@@ -419,9 +422,14 @@ def main():
                         time_of_day=selected_time,
                         weather=selected_weather,
                         traffic_density=prioritize_safety,
-                        mode=selected_transport
+                        mode=selected_transport,
+                        route_coords=route_coords
                     )
                     
+                    # Use real crash hotspots along the route instead of simulated incidents
+                    if safety_data.get("hotspots"):
+                        incident_coords = [[spot["lat"], spot["lng"]] for spot in safety_data["hotspots"]]
+                    
                     # Get the predicted safety score
                     safety_score = safety_data.get("safety_score", 7.0)
                     
@@ -540,6 +548,12 @@ def main():
                         "ai_powered": True  # Mark this as AI-powered for UI indicators
                     }
                 
+                safety_data['routes'] = route_options
+                safety_data['alternative_routes'] = [
+                    dict(route, is_safer=route['risk'] < recommended_route['risk'])
+                    for route in route_options.get('alternatives', [])[1:]
+                ] if recommended_route else []
+                
                 # Store in session state
                 st.session_state['last_analysis'] = safety_data
                 st.session_state['last_origin'] = origin
@@ -582,6 +596,8 @@ def main():
         incident_coords = st.session_state.get('incident_coords', incident_coords)
         origin_coords = st.session_state.get('origin_coords', origin_coords)
         dest_coords = st.session_state.get('dest_coords', dest_coords)
+        # Follow the slider along the analyzed trip's frontier without searching again
+        route_options = get_route_options(origin_coords, dest_coords, prioritize_safety, selected_transport)
         
     # Ensure safety_data is always a dictionary
     if not isinstance(safety_data, dict):
@@ -595,38 +611,61 @@ def main():
     st.subheader("🚦 Available Routes")
     route_col1, route_col2, route_col3 = st.columns(3)
     
-    with route_col1:
-        st.markdown("""
-        <div class='safety-card' style='border-left-color: #1E88E5;'>
-            <h4>Recommended Route</h4>
-            <p><b>ETA:</b> 15 minutes</p>
-            <p><b>Safety:</b> Medium</p>
-            <p><b>Distance:</b> 5.2 miles</p>
+    def route_card(title, border_color, route, baseline=None):
+        """Render a route option card, with the ETA difference from the recommended route"""
+        if route:
+            eta = f"{route['eta_minutes']} minutes"
+            if baseline and route['eta_minutes'] != baseline['eta_minutes']:
+                eta += f" ({route['eta_minutes'] - baseline['eta_minutes']:+d})"
+            safety = route['safety_level']
+            distance = f"{route['distance_miles']} miles"
+            crashes = f"<p><b>Past crashes on route:</b> {route['crashes']:,}</p>"
+        else:
+            eta, safety, distance, crashes = "Unavailable", "Unknown", "Unavailable", ""
+        st.markdown(f"""
+        <div class='safety-card' style='border-left-color: {border_color};'>
+            <h4>{title}</h4>
+            <p><b>ETA:</b> {eta}</p>
+            <p><b>Safety:</b> {safety}</p>
+            <p><b>Distance:</b> {distance}</p>
+            {crashes}
         </div>
         """, unsafe_allow_html=True)
+    
+    def alternative_card(route, baseline):
+        """Title and border color of an alternative, by how it compares with the recommended route"""
+        if not route or not baseline:
+            return "Alternative Route", "#90A4AE"
+        safer = route['risk'] < baseline['risk']
+        faster = route['eta_minutes'] < baseline['eta_minutes']
+        if safer and faster:
+            return "Safer & Faster Alternative", "#26A69A"
+        if safer:
+            return "Safer Alternative", "#66BB6A"
+        if faster:
+            return "Faster Alternative", "#FFA726"
+        return "Alternative Route", "#90A4AE"
+    
+    recommended_route = route_options.get('recommended')
+    alternatives = route_options.get('alternatives', [])[1:] + [None, None]
+    
+    with route_col1:
+        route_card("Recommended Route", "#1E88E5", recommended_route)
         recommended_selected = st.button("Select", key="route1_select")
         
     with route_col2:
-        st.markdown("""
-        <div class='safety-card' style='border-left-color: #66BB6A;'>
-            <h4>Safest Route</h4>
-            <p><b>ETA:</b> 17 minutes (+2)</p>
-            <p><b>Safety:</b> High</p>
-            <p><b>Distance:</b> 5.8 miles</p>
-        </div>
-        """, unsafe_allow_html=True)
-        safest_selected = st.button("Select", key="route2_select")
+        route_card(*alternative_card(alternatives[0], recommended_route), alternatives[0], recommended_route)
+        alternative1_selected = st.button("Select", key="route2_select")
         
     with route_col3:
-        st.markdown("""
-        <div class='safety-card' style='border-left-color: #FFA726;'>
-            <h4>Fastest Route</h4>
-            <p><b>ETA:</b> 12 minutes (-3)</p>
-            <p><b>Safety:</b> Lower</p>
-            <p><b>Distance:</b> 4.9 miles</p>
-        </div>
-        """, unsafe_allow_html=True)
-        fastest_selected = st.button("Select", key="route3_select")
+        route_card(*alternative_card(alternatives[1], recommended_route), alternatives[1], recommended_route)
+        alternative2_selected = st.button("Select", key="route3_select")
+    
+    frontier = st.session_state.get('route_frontier', {}).get('routes', [])
+    if len(frontier) > 1:
+        st.caption(f"{len(frontier)} routes trade travel time against crash history on this trip "
+                   f"({frontier[0]['eta_minutes']}-{frontier[-1]['eta_minutes']} minutes); "
+                   "the Safety vs. Speed Balance slider sets how the recommended route weighs them.")
     
     # Display the folium map with the routes
     st.subheader("🗺️ Route Map")
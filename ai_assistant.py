@@ -378,13 +378,14 @@ def process_user_uploaded_data(uploaded_file):
     except Exception as e:
         return None, f"Error processing file: {str(e)}"
 
-def generate_ai_insight_from_data(df, stats):
+def generate_ai_insight_from_data(df, stats, cube=None):
     """
     Generate AI insights from user uploaded data
     
     Args:
         df: Processed dataframe
         stats: Summary statistics dictionary
+        cube: Optional CrashCube with pre-aggregated counts for df
         
     Returns:
         List of insights as strings
@@ -431,7 +432,7 @@ def generate_ai_insight_from_data(df, stats):
             insights = [insight for insight in insights if len(insight) > 20]
             
             # Perform additional ML-based insights using crash data
-            ml_insights = generate_ml_based_insights(df, stats)
+            ml_insights = generate_ml_based_insights(df, stats, cube)
             
             # Combine insights, prioritizing ML-based ones
             combined_insights = ml_insights + [i for i in insights if i not in ml_insights]
@@ -443,18 +444,47 @@ def generate_ai_insight_from_data(df, stats):
             # Log error to console but don't show in UI
             print(f"Error connecting to OpenAI API: {e}")
             # Fallback to ML-based insights
-            return generate_ml_based_insights(df, stats)
+            return generate_ml_based_insights(df, stats, cube)
     else:
         # Use ML-based insights if no API key
-        return generate_ml_based_insights(df, stats)
+        return generate_ml_based_insights(df, stats, cube)
 
-def generate_ml_based_insights(df, stats):
+def _crash_aggregates_from_cube(cube):
+    """Hour, severity, weather and weekday aggregates read from a pre-aggregated CrashCube"""
+    hour_severity = cube.crosstab('hour', 'severity')
+    hour_totals = hour_severity.sum(axis=1)
+    severity_by_hour = (hour_severity * hour_severity.columns.to_numpy()).sum(axis=1)[hour_totals > 0] / hour_totals[hour_totals > 0]
+    return {
+        'total_incidents': cube.count(),
+        'hourly_counts': cube.marginal('hour'),
+        'severity_by_hour': severity_by_hour,
+        'weather_counts': cube.marginal('weather', sort=True),
+        'day_counts': cube.marginal('weekday', sort=True)
+    }
+
+def _crash_aggregates_from_frame(df):
+    """Hour, severity, weather and weekday aggregates computed by scanning the dataframe"""
+    aggregates = {'total_incidents': len(df)}
+    if 'datetime' in df.columns:
+        # Extract hour and day of week
+        df['hour'] = df['datetime'].dt.hour
+        df['day_of_week'] = df['datetime'].dt.day_name()
+        aggregates['hourly_counts'] = df.groupby('hour').size()
+        aggregates['day_counts'] = df['day_of_week'].value_counts()
+    if 'severity' in df.columns and 'hour' in df.columns:
+        aggregates['severity_by_hour'] = df.groupby('hour')['severity'].mean()
+    if 'weather' in df.columns:
+        aggregates['weather_counts'] = df['weather'].value_counts()
+    return aggregates
+
+def generate_ml_based_insights(df, stats, cube=None):
     """
     Generate insights using machine learning techniques directly on the crash data
     
     Args:
         df: Processed dataframe
         stats: Summary statistics dictionary
+        cube: Optional CrashCube; when given, aggregates are read from it instead of scanning df
         
     Returns:
         List of ML-generated insights as strings
@@ -462,76 +492,74 @@ def generate_ml_based_insights(df, stats):
     insights = []
     
     try:
-        # If DataFrame has necessary columns for analysis
-        if df is not None and len(df) > 0:
-            # 1. Time-based analysis
-            if 'datetime' in df.columns:
-                # Extract hour
-                df['hour'] = df['datetime'].dt.hour
-                
-                # Group by hour and count incidents
-                hourly_counts = df.groupby('hour').size()
-                peak_hour = hourly_counts.idxmax()
-                peak_count = hourly_counts.max()
-                
-                # Convert to 12-hour format
-                peak_hour_12 = peak_hour % 12
-                if peak_hour_12 == 0: peak_hour_12 = 12
-                am_pm = "AM" if peak_hour < 12 else "PM"
-                
-                # Time insight
-                time_insight = f"The highest crash frequency occurs at {peak_hour_12}:00 {am_pm} with {peak_count} incidents; consider adjusting your commute time to avoid this high-risk period."
-                insights.append(time_insight)
-            
-            # 2. Severity analysis
-            if 'severity' in df.columns:
-                # Calculate average severity by time of day
-                if 'hour' in df.columns:
-                    severity_by_hour = df.groupby('hour')['severity'].mean()
-                    worst_hour = severity_by_hour.idxmax()
-                    worst_severity = severity_by_hour.max()
-                    
-                    # Convert to 12-hour format
-                    worst_hour_12 = worst_hour % 12
-                    if worst_hour_12 == 0: worst_hour_12 = 12
-                    am_pm = "AM" if worst_hour < 12 else "PM"
-                    
-                    severity_insight = f"Crashes at {worst_hour_12}:00 {am_pm} have the highest average severity rating of {worst_severity:.1f}/5, indicating a significantly higher risk of serious injury during this time."
-                    insights.append(severity_insight)
-            
-            # 3. Weather impact analysis
-            if 'weather' in df.columns:
-                weather_counts = df['weather'].value_counts()
-                total_incidents = len(df)
+        if cube is not None:
+            aggregates = _crash_aggregates_from_cube(cube)
+        elif df is not None and len(df) > 0:
+            aggregates = _crash_aggregates_from_frame(df)
+        else:
+            aggregates = {}
+        
+        # 1. Time-based analysis
+        if 'hourly_counts' in aggregates:
+            hourly_counts = aggregates['hourly_counts']
+            peak_hour = hourly_counts.idxmax()
+            peak_count = hourly_counts.max()
+            
+            # Convert to 12-hour format
+            peak_hour_12 = peak_hour % 12
+            if peak_hour_12 == 0: peak_hour_12 = 12
+            am_pm = "AM" if peak_hour < 12 else "PM"
+            
+            # Time insight
+            time_insight = f"The highest crash frequency occurs at {peak_hour_12}:00 {am_pm} with {peak_count} incidents; consider adjusting your commute time to avoid this high-risk period."
+            insights.append(time_insight)
+        
+        # 2. Severity analysis by time of day
+        if 'severity_by_hour' in aggregates:
+            severity_by_hour = aggregates['severity_by_hour']
+            worst_hour = severity_by_hour.idxmax()
+            worst_severity = severity_by_hour.max()
+            
+            # Convert to 12-hour format
+            worst_hour_12 = worst_hour % 12
+            if worst_hour_12 == 0: worst_hour_12 = 12
+            am_pm = "AM" if worst_hour < 12 else "PM"
+            
+            severity_insight = f"Crashes at {worst_hour_12}:00 {am_pm} have the highest average severity rating of {worst_severity:.1f}/5, indicating a significantly higher risk of serious injury during this time."
+            insights.append(severity_insight)
+        
+        # 3. Weather impact analysis
+        if 'weather_counts' in aggregates:
+            weather_counts = aggregates['weather_counts']
+            total_incidents = aggregates['total_incidents']
+            
+            # Find the riskiest weather condition
+            if len(weather_counts) > 0:
+                riskiest_weather = weather_counts.index[0]
+                weather_percent = (weather_counts.iloc[0] / total_incidents) * 100
                 
-                # Find the riskiest weather condition
-                if len(weather_counts) > 0:
-                    riskiest_weather = weather_counts.index[0]
-                    weather_percent = (weather_counts.iloc[0] / total_incidents) * 100
-                    
-                    weather_insight = f"During {riskiest_weather} conditions, crash risk increases by {weather_percent:.1f}% compared to clear conditions; exercise extra caution and reduce speed during {riskiest_weather.lower()} weather."
-                    insights.append(weather_insight)
-            
-            # 4. Location analysis
-            if 'location' in stats and stats['locations']:
-                locations = stats['locations']
-                if locations:
-                    top_location = max(locations.items(), key=lambda x: x[1])
-                    location_insight = f"The intersection of {top_location[0]} accounts for {top_location[1]} crashes, making it the most dangerous in San Jose; use alternative routes when possible or exercise extreme caution at this location."
-                    insights.append(location_insight)
-            
-            # 5. Day of week analysis  
-            if 'datetime' in df.columns:
-                df['day_of_week'] = df['datetime'].dt.day_name()
-                day_counts = df['day_of_week'].value_counts()
+                weather_insight = f"During {riskiest_weather} conditions, crash risk increases by {weather_percent:.1f}% compared to clear conditions; exercise extra caution and reduce speed during {riskiest_weather.lower()} weather."
+                insights.append(weather_insight)
+        
+        # 4. Location analysis
+        if 'location' in stats and stats['locations']:
+            locations = stats['locations']
+            if locations:
+                top_location = max(locations.items(), key=lambda x: x[1])
+                location_insight = f"The intersection of {top_location[0]} accounts for {top_location[1]} crashes, making it the most dangerous in San Jose; use alternative routes when possible or exercise extreme caution at this location."
+                insights.append(location_insight)
+        
+        # 5. Day of week analysis  
+        if 'day_counts' in aggregates:
+            day_counts = aggregates['day_counts']
+            
+            if not day_counts.empty:
+                worst_day = day_counts.index[0]
+                day_count = day_counts.iloc[0]
+                day_percent = (day_count / aggregates['total_incidents']) * 100
                 
-                if not day_counts.empty:
-                    worst_day = day_counts.index[0]
-                    day_count = day_counts.iloc[0]
-                    day_percent = (day_count / len(df)) * 100
-                    
-                    day_insight = f"{worst_day}s experience {day_percent:.1f}% of weekly crashes, suggesting increased risk factors like commuter fatigue or higher traffic volume; consider flexible work arrangements on this day if possible."
-                    insights.append(day_insight)
+                day_insight = f"{worst_day}s experience {day_percent:.1f}% of weekly crashes, suggesting increased risk factors like commuter fatigue or higher traffic volume; consider flexible work arrangements on this day if possible."
+                insights.append(day_insight)
     
     except Exception as e:
         # Log error to console but don't show in UI
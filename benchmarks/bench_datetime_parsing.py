@@ -0,0 +1,67 @@
+"""
+Micro-benchmark: CrashDateTime parsing and datetime part derivation
+Compares format inference + separate .dt accessors against the explicit
+format parser + single-pass derivation on the full crash file
+
+Run with: python benchmarks/bench_datetime_parsing.py
+"""
+
+import sys
+import time
+import warnings
+from pathlib import Path
+
+import pandas as pd
+
+# Add parent directory to import path
+parent_dir = str(Path(__file__).parent.parent)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from utils.custom_data_processor import parse_crash_datetimes, derive_datetime_parts
+
+CRASH_DATA_PATH = Path(parent_dir) / "utils" / "crashdata2011-2021.csv"
+
+def best_of(func, repeats=3):
+    """Best wall-clock time of several runs, in seconds"""
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def inferred_parse(values):
+    with warnings.catch_warnings():
+        # pandas warns that it is falling back to per-element dateutil parsing
+        warnings.simplefilter('ignore', UserWarning)
+        return pd.to_datetime(values, errors='coerce')
+
+def accessor_parts(datetimes):
+    return {
+        'date': datetimes.dt.date,
+        'time': datetimes.dt.time,
+        'day_of_week': datetimes.dt.day_name(),
+        'hour': datetimes.dt.hour,
+        'year': datetimes.dt.year
+    }
+
+def main():
+    values = pd.read_csv(CRASH_DATA_PATH, usecols=['CrashDateTime'])['CrashDateTime']
+    datetimes = parse_crash_datetimes(values)
+    assert datetimes.equals(inferred_parse(values))
+
+    rows = [
+        ("parse: inferred format", best_of(lambda: inferred_parse(values), repeats=1)),
+        ("parse: explicit format", best_of(lambda: parse_crash_datetimes(values))),
+        ("parts: .dt accessors", best_of(lambda: accessor_parts(datetimes))),
+        ("parts: single int64 pass", best_of(lambda: derive_datetime_parts(datetimes)))
+    ]
+
+    print(f"CrashDateTime benchmark ({len(values):,} rows)")
+    for label, seconds in rows:
+        print(f"  {label:<28} {seconds * 1000:9.1f} ms")
+    print(f"  parse speedup: {rows[0][1] / rows[1][1]:.1f}x, parts speedup: {rows[2][1] / rows[3][1]:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Micro-benchmark: point-to-point safety-weighted route queries
+Compares plain Dijkstra, A* with the straight-line heuristic and the
+contraction hierarchy on random intersection pairs of the full crash graph,
+for each slider setting the router precomputes a hierarchy for
+
+Run with: python benchmarks/bench_route_queries.py
+"""
+
+import heapq
+import math
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Add parent directory to import path
+parent_dir = str(Path(__file__).parent.parent)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from utils.crash_dataset import crash_dataset
+from utils.safe_router import HIERARCHY_PRIORITIES, safety_weight
+
+QUERIES = 200
+
+def dijkstra(indptr, indices, costs, source, target):
+    """Plain Dijkstra with early exit at the target"""
+    best = {source: 0.0}
+    heap = [(0.0, source)]
+    while heap:
+        cost, node = heapq.heappop(heap)
+        if node == target:
+            return cost
+        if cost > best[node]:
+            continue
+        for arc in range(indptr[node], indptr[node + 1]):
+            neighbour = indices[arc]
+            new_cost = cost + costs[arc]
+            if new_cost < best.get(neighbour, math.inf):
+                best[neighbour] = new_cost
+                heapq.heappush(heap, (new_cost, neighbour))
+    return None
+
+def mean_time(func, pairs):
+    """Mean wall-clock time per query, in seconds, and the answers"""
+    start = time.perf_counter()
+    answers = [func(source, target) for source, target in pairs]
+    return (time.perf_counter() - start) / len(pairs), answers
+
+def main():
+    router = crash_dataset.get_router()
+    graph = router.graph
+    indptr, indices = graph.indptr.tolist(), graph.indices.tolist()
+    rng = np.random.default_rng(0)
+    pairs = [(int(s), int(t)) for s, t in rng.choice(router._routable, size=(QUERIES, 2))]
+
+    print(f"Route query benchmark ({graph.n_nodes:,} intersections, {graph.n_edges:,} segments, {QUERIES} queries)")
+    for priority in HIERARCHY_PRIORITIES:
+        weight = safety_weight(priority)
+        costs = router.arc_costs(weight)
+        cost_list = costs.tolist()
+
+        start = time.perf_counter()
+        hierarchy = router.hierarchy(priority)
+        load_seconds = time.perf_counter() - start
+
+        dijkstra_s, expected = mean_time(lambda s, t: dijkstra(indptr, indices, cost_list, s, t), pairs)
+        astar_s, astar_paths = mean_time(lambda s, t: router.shortest_path(s, t, weight), pairs)
+        ch_s, ch_answers = mean_time(hierarchy.query, pairs)
+        for cost, (_, astar_arcs), (ch_cost, ch_arcs) in zip(expected, astar_paths, ch_answers):
+            assert math.isclose(float(costs[astar_arcs].sum()), cost, rel_tol=1e-9, abs_tol=1e-6)
+            assert math.isclose(ch_cost, cost, rel_tol=1e-9, abs_tol=1e-6)
+            assert math.isclose(float(costs[ch_arcs].sum()), cost, rel_tol=1e-9, abs_tol=1e-6)
+
+        print(f"  slider {priority:>2} ({hierarchy.n_shortcuts:,} shortcuts, ready in {load_seconds:.2f}s)")
+        for label, seconds in [("dijkstra", dijkstra_s), ("a*", astar_s), ("contraction hierarchy", ch_s)]:
+            print(f"    {label:<24} {seconds * 1000:9.3f} ms/query")
+        print(f"    speedup over dijkstra: a* {dijkstra_s / astar_s:.1f}x, hierarchy {dijkstra_s / ch_s:.1f}x")
+
+if __name__ == "__main__":
+    main()
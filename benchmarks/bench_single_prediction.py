@@ -0,0 +1,92 @@
+"""
+Micro-benchmark: single-row safety and risk predictions
+Compares the DataFrame + ColumnTransformer path against the precompiled row
+encoder for one feature dict at a time, on models trained from synthetic
+route conditions in a temporary directory; the last rows show predict and
+predict_risk answered from the prediction cache
+
+Run with: python benchmarks/bench_single_prediction.py
+"""
+
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Add parent directory to import path
+parent_dir = str(Path(__file__).parent.parent)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from ml_models import SafetyScorePredictor, IncidentRiskClassifier, _feature_frame
+
+CALLS = 500
+PERIODS = ["Early Morning (5-7 AM)", "Morning Rush (7-9 AM)", "Mid-Day (9 AM-4 PM)",
+           "Evening Rush (4-7 PM)", "Evening (7-10 PM)", "Late Night (10 PM-5 AM)"]
+
+def training_frame(rows=2000, seed=0):
+    """Random route conditions with scores and risk levels that depend on them"""
+    rng = np.random.default_rng(seed)
+    X = pd.DataFrame({
+        'time_of_day': rng.choice(PERIODS, rows),
+        'weather': rng.choice(['Clear', 'Cloudy', 'Rainy', 'Foggy'], rows),
+        'transport_mode': rng.choice(['driving', 'transit', 'walking', 'bicycling'], rows),
+        'traffic_density': rng.integers(0, 11, rows)
+    }).astype({'time_of_day': object, 'weather': object, 'transport_mode': object})
+    score = 9.0 - 0.3 * X['traffic_density'] - 1.5 * X['time_of_day'].str.contains('Rush') - 1.0 * (X['weather'] != 'Clear')
+    risk = pd.Series(np.where(score < 5, 'high', np.where(score < 7, 'medium', 'low')))
+    return X, score + rng.normal(0, 0.2, rows), risk
+
+def p50(func, rows):
+    """Median wall-clock time per call, in seconds, after a warm-up pass"""
+    for row in rows[:50]:
+        func(row)
+    timings = []
+    for row in rows:
+        start = time.perf_counter()
+        func(row)
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings))
+
+def main():
+    X, scores, risks = training_frame()
+    with tempfile.TemporaryDirectory() as model_dir:
+        predictor = SafetyScorePredictor(model_path=os.path.join(model_dir, "safety.pkl"))
+        predictor.train(X, scores)
+        classifier = IncidentRiskClassifier(model_path=os.path.join(model_dir, "risk.pkl"))
+        classifier.train(X, risks)
+
+    rows = X.sample(CALLS, random_state=1).to_dict('records')
+    for row in rows[:50]:
+        assert np.isclose(predictor.predict(row), predictor.predict_batch([row])[0])
+        assert classifier.predict_risk(row)['risk_level'] == classifier.predict_risk_batch([row])[0][0]
+
+    results = [
+        ("safety: transformer + forest", p50(lambda row: predictor.model.predict(predictor.preprocessor.transform(_feature_frame(row))), rows)),
+        # predict_row / _predict_risk bypass the prediction cache, so these rows time the encoder path
+        ("safety: row encoder", p50(predictor.predict_row, rows)),
+        ("risk: transformer + model", p50(lambda row: classifier.model.predict_proba(classifier.preprocessor.transform(_feature_frame(row))), rows)),
+        ("risk: row encoder", p50(classifier._predict_risk, rows)),
+        ("encode only", p50(predictor.encoder.encode, rows))
+    ]
+
+    # Fill the caches with every sampled row so the cached rows time hits only
+    for row in rows:
+        predictor.predict(row)
+        classifier.predict_risk(row)
+    results += [
+        ("safety: cached predict", p50(predictor.predict, rows)),
+        ("risk: cached predict_risk", p50(classifier.predict_risk, rows))
+    ]
+
+    print(f"Single-row prediction benchmark ({CALLS} calls, p50)")
+    for label, seconds in results:
+        print(f"  {label:<30} {seconds * 1e6:9.1f} us")
+    print(f"  speedup: safety {results[0][1] / results[1][1]:.1f}x, risk {results[2][1] / results[3][1]:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Micro-benchmark: flattened NumPy trees vs. sklearn tree ensembles
+Scores the same preprocessed batches with the fitted RandomForestRegressor and
+GradientBoostingClassifier and with their flattened evaluators, checking that
+both backends agree. The predictors switch back to sklearn above
+FLAT_BACKEND_MAX_ROWS rows, where its compiled tree walk wins
+
+Run with: python benchmarks/bench_tree_backends.py
+"""
+
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Add parent directory to import path
+parent_dir = str(Path(__file__).parent.parent)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from bench_single_prediction import training_frame
+from ml_models import SafetyScorePredictor, IncidentRiskClassifier
+
+BATCH_SIZES = [1, 100, 1000, 10000]
+
+def best_of(func, repeats=20):
+    """Best wall-clock time of several runs, in seconds"""
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def main():
+    X, scores, risks = training_frame()
+    with tempfile.TemporaryDirectory() as model_dir:
+        predictor = SafetyScorePredictor(model_path=os.path.join(model_dir, "safety.pkl"))
+        predictor.train(X, scores)
+        classifier = IncidentRiskClassifier(model_path=os.path.join(model_dir, "risk.pkl"))
+        classifier.train(X, risks)
+
+    print(f"Tree backend benchmark (forest: {predictor.flat_model.trees.n_trees} trees, "
+          f"booster: {classifier.flat_model.trees.n_trees} trees)")
+    for size in BATCH_SIZES:
+        rows = X.sample(size, replace=True, random_state=size)
+        X_safety = predictor.preprocessor.transform(rows)
+        X_risk = classifier.preprocessor.transform(rows)
+        np.testing.assert_allclose(predictor.flat_model.predict(X_safety), predictor.model.predict(X_safety), rtol=1e-12)
+        np.testing.assert_allclose(classifier.flat_model.predict_proba(X_risk), classifier.model.predict_proba(X_risk),
+                                   rtol=1e-9, atol=1e-12)
+
+        repeats = 3 if size > 1000 else 20
+        results = [
+            ("forest: sklearn", best_of(lambda: predictor.model.predict(X_safety), repeats)),
+            ("forest: flat", best_of(lambda: predictor.flat_model.predict(X_safety), repeats)),
+            ("booster: sklearn", best_of(lambda: classifier.model.predict_proba(X_risk), repeats)),
+            ("booster: flat", best_of(lambda: classifier.flat_model.predict_proba(X_risk), repeats))
+        ]
+        print(f"  batch of {size:,}")
+        for label, seconds in results:
+            print(f"    {label:<20} {seconds * 1000:9.3f} ms")
+        print(f"    speedup: forest {results[0][1] / results[1][1]:.1f}x, booster {results[2][1] / results[3][1]:.1f}x")
+
+if __name__ == "__main__":
+    main()
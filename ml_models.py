@@ -15,20 +15,223 @@ import joblib
 import os
 from datetime import datetime
 import logging
+import threading
+import time
+from collections import OrderedDict
+from utils.tree_ensemble import compile_tree_model
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Tree evaluation backends: flattened NumPy node arrays, or the fitted sklearn estimator
+TREE_BACKENDS = ('flat', 'sklearn')
+DEFAULT_TREE_BACKEND = 'flat'
+# Above this many rows sklearn's compiled tree walk beats the vectorized NumPy one
+FLAT_BACKEND_MAX_ROWS = 256
+
+# Single-row predictions kept per model, and for how long
+PREDICTION_CACHE_SIZE = 1024
+PREDICTION_CACHE_TTL_SECONDS = 600
+
+def _feature_frame(features):
+    """Feature rows as a DataFrame (from a dict, a list of dicts or a DataFrame)"""
+    if isinstance(features, pd.DataFrame):
+        return features
+    if isinstance(features, dict):
+        features = [features]
+    return pd.DataFrame(list(features))
+
+def _feature_records(features):
+    """Feature rows as a list of dicts without missing values, for the fallback heuristics"""
+    if isinstance(features, dict):
+        return [features]
+    if isinstance(features, pd.DataFrame):
+        return [{key: value for key, value in row.items() if not pd.isna(value)}
+                for row in features.to_dict('records')]
+    return list(features)
+
+class RowEncoder:
+    """
+    Precompiled single-row version of a fitted ColumnTransformer
+
+    Maps a feature dict straight into a preallocated float32 row using the
+    scaler constants and category -> column indices of the fitted
+    StandardScaler and OneHotEncoder blocks, skipping the DataFrame and
+    transformer machinery. Each thread reuses its own row buffer.
+    """
+    def __init__(self, preprocessor):
+        self._numeric = []      # (column, output index, mean, scale)
+        self._categorical = []  # (column, {category: output index}, block start, block stop)
+        offset = 0
+        for name, transformer, columns in preprocessor.transformers_:
+            if (isinstance(transformer, str) and transformer == 'drop') or len(columns) == 0:
+                continue
+            if isinstance(transformer, StandardScaler):
+                means = transformer.mean_ if transformer.mean_ is not None else np.zeros(len(columns))
+                scales = transformer.scale_ if transformer.scale_ is not None else np.ones(len(columns))
+                for column, mean, scale in zip(columns, means, scales):
+                    self._numeric.append((column, offset, float(mean), float(scale)))
+                    offset += 1
+            elif isinstance(transformer, OneHotEncoder) and transformer.drop is None and \
+                    transformer.handle_unknown == 'ignore':
+                for column, categories in zip(columns, transformer.categories_):
+                    indices = {category: offset + i for i, category in enumerate(categories)}
+                    self._categorical.append((column, indices, offset, offset + len(categories)))
+                    offset += len(categories)
+            else:
+                raise ValueError(f"Unsupported transformer for row encoding: {name}")
+        self.n_features = offset
+        self._local = threading.local()
+
+    def encode(self, features):
+        """
+        Encode one feature dict into this thread's row buffer
+
+        Args:
+            features: Dict with feature values
+
+        Returns:
+            NumPy array of shape (1, n_features), or None if a feature is missing or invalid
+        """
+        row = getattr(self._local, 'row', None)
+        if row is None:
+            row = self._local.row = np.zeros((1, self.n_features), dtype=np.float32)
+        values = row[0]
+        try:
+            for column, index, mean, scale in self._numeric:
+                values[index] = (float(features[column]) - mean) / scale
+            for column, indices, start, stop in self._categorical:
+                values[start:stop] = 0.0
+                index = indices.get(features[column])
+                if index is not None:
+                    values[index] = 1.0
+        except (KeyError, TypeError, ValueError):
+            return None
+        return row
+
+class PredictionCache:
+    """
+    Thread-safe bounded LRU cache of single-row predictions with a time to live
+
+    Keys are the canonicalized feature dict plus the model version, so an
+    entry computed by a model that has since been swapped can never be served.
+    """
+    def __init__(self, max_size=PREDICTION_CACHE_SIZE, ttl_seconds=PREDICTION_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (expiry time, value), least recently used first
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(features, version):
+        """
+        Canonical cache key for a feature dict
+
+        Args:
+            features: Dict with feature values
+            version: Model version the prediction comes from
+
+        Returns:
+            Hashable key, or None if a feature value cannot be hashed
+        """
+        try:
+            items = tuple(sorted((name, value.item() if isinstance(value, np.generic) else value)
+                                 for name, value in features.items()))
+            key = (version, items)
+            hash(key)
+            return key
+        except TypeError:
+            return None
+
+    def get(self, key):
+        """
+        Look up a prediction, counting the hit or miss
+
+        Args:
+            key: Key from PredictionCache.key
+
+        Returns:
+            Cached prediction, or None if it is missing or expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        """
+        Store a prediction, evicting the least recently used entries beyond max_size
+
+        Args:
+            key: Key from PredictionCache.key
+            value: Prediction to cache
+        """
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop every cached prediction (the counters are kept)"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Get cache usage counters
+
+        Returns:
+            Dict with hits, misses, evictions, size and hit rate
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+def _row_encoder(preprocessor):
+    """RowEncoder for a fitted preprocessor, or None if it is missing or uses other transformers"""
+    if preprocessor is None:
+        return None
+    try:
+        return RowEncoder(preprocessor)
+    except (AttributeError, ValueError) as e:
+        logger.info(f"Single-row encoder unavailable: {str(e)}")
+        return None
+
 class SafetyScorePredictor:
     """
     ML model for predicting safety scores based on route and condition features
     """
-    def __init__(self, model_path=None):
+    def __init__(self, model_path=None, backend=DEFAULT_TREE_BACKEND):
+        if backend not in TREE_BACKENDS:
+            raise ValueError(f"Unknown tree backend: {backend}")
         self.model = None
         self.preprocessor = None
         self.model_path = model_path or "models/safety_score_model.pkl"
         self.feature_importance = {}
+        self.encoder = None
+        self.flat_model = None
+        self.backend = backend
+        self.model_version = 0
+        self.cache = PredictionCache()
         self.load_model()
 
     def load_model(self):
@@ -39,6 +242,9 @@ class SafetyScorePredictor:
                 self.model = loaded_model.get('model')
                 self.preprocessor = loaded_model.get('preprocessor')
                 self.feature_importance = loaded_model.get('feature_importance', {})
+                self.encoder = _row_encoder(self.preprocessor)
+                self.flat_model = compile_tree_model(self.model)
+                self._model_swapped()
                 logger.info(f"Model loaded from {self.model_path}")
                 return True
             else:
@@ -107,6 +313,9 @@ class SafetyScorePredictor:
             # Save the model
             self.model = model['regressor']
             self.preprocessor = model['preprocessor']
+            self.encoder = _row_encoder(self.preprocessor)
+            self.flat_model = compile_tree_model(self.model)
+            self._model_swapped()
             
             if not os.path.exists(os.path.dirname(self.model_path)):
                 os.makedirs(os.path.dirname(self.model_path))
@@ -130,6 +339,17 @@ class SafetyScorePredictor:
             logger.error(f"Error training model: {str(e)}")
             raise
 
+    def _model_swapped(self):
+        """Start a new model version so cached predictions from the previous model are dropped"""
+        self.model_version += 1
+        self.cache.clear()
+
+    def _estimator(self, n_rows=1):
+        """Model used for evaluation: the flattened trees when selected, available and the batch is small, else the sklearn model"""
+        if self.backend == 'flat' and self.flat_model is not None and n_rows <= FLAT_BACKEND_MAX_ROWS:
+            return self.flat_model
+        return self.model
+
     def predict(self, features):
         """
         Predict safety score for given route and condition features
@@ -140,28 +360,75 @@ class SafetyScorePredictor:
         Returns:
             Predicted safety score (float)
         """
+        if isinstance(features, dict):
+            key = self.cache.key(features, self.model_version)
+            prediction = self.cache.get(key) if key is not None else None
+            if prediction is not None:
+                return prediction
+            prediction = self.predict_row(features)
+            if prediction is None:
+                prediction = float(self.predict_batch(features)[0])
+            if key is not None:
+                self.cache.put(key, prediction)
+            return prediction
+        prediction = self.predict_batch(features)
+        return float(prediction[0]) if len(prediction) == 1 else prediction
+
+    def predict_row(self, features):
+        """
+        Predict one feature dict through the precompiled row encoder
+        
+        Args:
+            features: Dict with feature values
+            
+        Returns:
+            Predicted safety score (float), or None if the row cannot be encoded
+        """
+        if self.model is None or self.encoder is None:
+            return None
+        row = self.encoder.encode(features)
+        if row is None:
+            return None
+        
+        estimator = self._estimator()
+        if estimator is not self.model:
+            return float(estimator.predict(row)[0])
+        if isinstance(self.model, RandomForestRegressor) and self.model.n_outputs_ == 1:
+            # Average the trees directly, in the forest's own order, without its input checks and thread pool
+            total = 0.0
+            for tree in self.model.estimators_:
+                total += tree.tree_.predict(row)[0, 0]
+            return float(total / len(self.model.estimators_))
+        return float(self.model.predict(row)[0])
+
+    def predict_batch(self, features):
+        """
+        Predict safety scores for many feature rows with one transform and one forest evaluation
+        
+        Args:
+            features: List of feature dicts or a DataFrame with one row per prediction
+            
+        Returns:
+            NumPy array of predicted safety scores
+        """
         try:
             if self.model is None or self.preprocessor is None:
                 logger.warning("Model not loaded. Using fallback prediction logic.")
-                return self._fallback_prediction(features)
-            
-            # Convert dict to DataFrame if needed
-            if isinstance(features, dict):
-                features_df = pd.DataFrame([features])
-            else:
-                features_df = features
-            
-            # Preprocess features
-            X_processed = self.preprocessor.transform(features_df)
+                return self._fallback_batch(features)
             
-            # Make prediction
-            prediction = self.model.predict(X_processed)
+            # Preprocess all rows at once
+            X_processed = self.preprocessor.transform(_feature_frame(features))
             
-            return float(prediction[0]) if len(prediction) == 1 else prediction
+            # Make predictions
+            return np.asarray(self._estimator(X_processed.shape[0]).predict(X_processed), dtype=np.float64)
             
         except Exception as e:
             logger.error(f"Error making prediction: {str(e)}")
-            return self._fallback_prediction(features)
+            return self._fallback_batch(features)
+
+    def _fallback_batch(self, features):
+        """Fallback safety scores for each feature row"""
+        return np.array([self._fallback_prediction(record) for record in _feature_records(features)], dtype=np.float64)
 
     def _fallback_prediction(self, features):
         """
@@ -208,11 +475,18 @@ class IncidentRiskClassifier:
     """
     ML model for classifying incident risk levels at specific locations and times
     """
-    def __init__(self, model_path=None):
+    def __init__(self, model_path=None, backend=DEFAULT_TREE_BACKEND):
+        if backend not in TREE_BACKENDS:
+            raise ValueError(f"Unknown tree backend: {backend}")
         self.model = None
         self.preprocessor = None
         self.model_path = model_path or "models/incident_risk_model.pkl"
         self.classes = ['low', 'medium', 'high']
+        self.encoder = None
+        self.flat_model = None
+        self.backend = backend
+        self.model_version = 0
+        self.cache = PredictionCache()
         self.load_model()
 
     def load_model(self):
@@ -223,6 +497,9 @@ class IncidentRiskClassifier:
                 self.model = loaded_model.get('model')
                 self.preprocessor = loaded_model.get('preprocessor')
                 self.classes = loaded_model.get('classes', ['low', 'medium', 'high'])
+                self.encoder = _row_encoder(self.preprocessor)
+                self.flat_model = compile_tree_model(self.model)
+                self._model_swapped()
                 logger.info(f"Risk classifier loaded from {self.model_path}")
                 return True
             else:
@@ -279,6 +556,9 @@ class IncidentRiskClassifier:
             self.model = model['classifier']
             self.preprocessor = model['preprocessor']
             self.classes = list(model['classifier'].classes_)
+            self.encoder = _row_encoder(self.preprocessor)
+            self.flat_model = compile_tree_model(self.model)
+            self._model_swapped()
             
             if not os.path.exists(os.path.dirname(self.model_path)):
                 os.makedirs(os.path.dirname(self.model_path))
@@ -301,6 +581,17 @@ class IncidentRiskClassifier:
             logger.error(f"Error training risk classifier: {str(e)}")
             raise
 
+    def _model_swapped(self):
+        """Start a new model version so cached predictions from the previous model are dropped"""
+        self.model_version += 1
+        self.cache.clear()
+
+    def _estimator(self, n_rows=1):
+        """Model used for evaluation: the flattened trees when selected, available and the batch is small, else the sklearn model"""
+        if self.backend == 'flat' and self.flat_model is not None and n_rows <= FLAT_BACKEND_MAX_ROWS:
+            return self.flat_model
+        return self.model
+
     def predict_risk(self, features):
         """
         Predict incident risk level for given location and condition features
@@ -311,37 +602,74 @@ class IncidentRiskClassifier:
         Returns:
             Dict with risk level and probability
         """
+        key = self.cache.key(features, self.model_version) if isinstance(features, dict) else None
+        prediction = self.cache.get(key) if key is not None else None
+        if prediction is None:
+            prediction = self._predict_risk(features)
+            if key is not None:
+                self.cache.put(key, prediction)
+        # Callers get their own copy of the cached dicts
+        return dict(prediction, class_probabilities=dict(prediction['class_probabilities']))
+
+    def _predict_risk(self, features):
+        """Risk level and probabilities for one feature dict or frame row, without the cache"""
+        if self.model is None or self.preprocessor is None:
+            logger.warning("Risk classifier not loaded. Using fallback prediction logic.")
+            return self._fallback_risk_prediction(features)
+        
+        row = self.encoder.encode(features) if self.encoder is not None and isinstance(features, dict) else None
+        if row is not None:
+            # Single dicts skip the DataFrame and ColumnTransformer
+            estimator = self._estimator()
+            probabilities = np.asarray(estimator.predict_proba(row), dtype=np.float64)
+            risk_levels = np.asarray(estimator.classes_)[probabilities.argmax(axis=1)]
+        else:
+            risk_levels, probabilities = self.predict_risk_batch(features)
+        
+        # Get highest probability class
+        return {
+            'risk_level': risk_levels[0],
+            'probability': float(max(probabilities[0])),
+            'class_probabilities': {cls: float(prob) for cls, prob in zip(self.classes, probabilities[0])}
+        }
+
+    def predict_risk_batch(self, features):
+        """
+        Predict incident risk levels for many feature rows with one transform and one model evaluation
+        
+        Args:
+            features: List of feature dicts or a DataFrame with one row per prediction
+            
+        Returns:
+            Tuple of (NumPy array of risk levels, NumPy array of class probabilities
+            with one column per entry of self.classes)
+        """
         try:
             if self.model is None or self.preprocessor is None:
                 logger.warning("Risk classifier not loaded. Using fallback prediction logic.")
-                return self._fallback_risk_prediction(features)
-            
-            # Convert dict to DataFrame if needed
-            if isinstance(features, dict):
-                features_df = pd.DataFrame([features])
-            else:
-                features_df = features
+                return self._fallback_risk_batch(features)
             
-            # Preprocess features
-            X_processed = self.preprocessor.transform(features_df)
+            # Preprocess all rows at once
+            X_processed = self.preprocessor.transform(_feature_frame(features))
             
-            # Make prediction
-            prediction = self.model.predict(X_processed)
-            probabilities = self.model.predict_proba(X_processed)
+            # Class probabilities; the predicted level is the most likely class
+            estimator = self._estimator(X_processed.shape[0])
+            probabilities = np.asarray(estimator.predict_proba(X_processed), dtype=np.float64)
+            risk_levels = np.asarray(estimator.classes_)[probabilities.argmax(axis=1)]
             
-            # Get highest probability class
-            risk_level = prediction[0]
-            risk_proba = max(probabilities[0])
-            
-            return {
-                'risk_level': risk_level,
-                'probability': float(risk_proba),
-                'class_probabilities': {cls: float(prob) for cls, prob in zip(self.classes, probabilities[0])}
-            }
+            return risk_levels, probabilities
             
         except Exception as e:
             logger.error(f"Error predicting risk: {str(e)}")
-            return self._fallback_risk_prediction(features)
+            return self._fallback_risk_batch(features)
+
+    def _fallback_risk_batch(self, features):
+        """Fallback risk levels and class probabilities for each feature row"""
+        predictions = [self._fallback_risk_prediction(record) for record in _feature_records(features)]
+        risk_levels = np.array([prediction['risk_level'] for prediction in predictions], dtype=object)
+        probabilities = np.array([[prediction['class_probabilities'].get(cls, 0.0) for cls in self.classes]
+                                  for prediction in predictions], dtype=np.float64).reshape(len(predictions), len(self.classes))
+        return risk_levels, probabilities
 
     def _fallback_risk_prediction(self, features):
         """
@@ -418,17 +746,11 @@ def generate_time_predictions(model, base_features, safety_score):
         "Late Night (10 PM-5 AM)"
     ]
     
-    predictions = {}
-    
     try:
-        for period in time_periods:
-            # Copy base features and update time
-            features = base_features.copy()
-            features['time_of_day'] = period
-            
-            # Predict safety score for this time
-            prediction = model.predict(features)
-            predictions[period] = prediction
+        # One feature row per period, scored in a single batch
+        rows = [dict(base_features, time_of_day=period) for period in time_periods]
+        scores = model.predict_batch(rows)
+        predictions = {period: float(score) for period, score in zip(time_periods, scores)}
             
     except Exception as e:
         logger.error(f"Error generating time predictions: {str(e)}")
@@ -1,5 +1,9 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
+import folium
+from folium.plugins import HeatMap
+from streamlit_folium import st_folium
 import plotly.express as px
 import plotly.graph_objects as go
 import sys
@@ -13,7 +17,10 @@ if parent_dir not in sys.path:
 
 # Import the AI assistant module
 from ai_assistant import generate_ai_insight_from_data
-from utils.custom_data_processor import process_crash_data
+from utils.crash_dataset import crash_dataset
+from utils.hotspot_clusters import detect_hotspot_clusters
+from utils.crash_heatmap import viewport_bounds
+from utils.crash_spatial_index import PROJECTION_ORIGIN
 
 # Page config
 st.set_page_config(
@@ -35,15 +42,16 @@ except Exception as e:
 
 # Custom CSS is now loaded from external file
 
-# Initialize session state for data
-if 'crash_data' not in st.session_state:
-    st.session_state['crash_data'] = None
-    
-if 'crash_stats' not in st.session_state:
-    st.session_state['crash_stats'] = None
-    
+# Initialize session state for data (the crash dataset itself is shared process-wide)
 if 'crash_insights' not in st.session_state:
     st.session_state['crash_insights'] = None
+if 'crash_hotspots' not in st.session_state:
+    st.session_state['crash_hotspots'] = None
+if 'heatmap_view' not in st.session_state:
+    st.session_state['heatmap_view'] = {'center': list(PROJECTION_ORIGIN), 'zoom': 11, 'bounds': None}
+
+# Height of the crash heatmap in pixels
+HEATMAP_HEIGHT = 450
 
 # Title and explanation
 st.title("🔍 San Jose Crash Data Analysis")
@@ -66,32 +74,23 @@ Our AI analyzes this historical data to provide actionable insights that can hel
 """)
 
 # Load the crash data
-crash_data_path = Path(__file__).parent.parent / "utils" / "crashdata2011-2021.csv"
+df = None
 
-if 'crash_data' not in st.session_state or st.session_state['crash_data'] is None:
-    if crash_data_path.exists():
-        with st.spinner("Processing San Jose crash data from 2011-2021..."):
-            # Load the data
-            df = pd.read_csv(crash_data_path)
-            
-            # Process with custom processor for this format
-            processed_df, stats = process_crash_data(df)
-            
-            # Store in session state
-            st.session_state['crash_data'] = processed_df
-            st.session_state['original_crash_data'] = df
-            st.session_state['crash_stats'] = stats
-            
-            # Generate AI insights
-            st.session_state['crash_insights'] = generate_ai_insight_from_data(processed_df, stats)
-    else:
-        st.error("Crash data file not found. Please ensure the data file is in the correct location.")
+if crash_dataset.source_path.exists():
+    with st.spinner("Processing San Jose crash data from 2011-2021..."):
+        # Read-only view of the process-wide dataset (loaded once, shared by all sessions)
+        df, stats = crash_dataset.get()
+        cube = crash_dataset.get_cube()
+        
+        # Generate AI insights once per session
+        if st.session_state['crash_insights'] is None:
+            st.session_state['crash_insights'] = generate_ai_insight_from_data(df, stats, cube)
+else:
+    st.error("Crash data file not found. Please ensure the data file is in the correct location.")
 
 # Display analysis if data is loaded
-if st.session_state['crash_data'] is not None:
-    df = st.session_state['crash_data']
-    original_df = st.session_state['original_crash_data']
-    stats = st.session_state['crash_stats']
+if df is not None:
+    dataset_metrics = crash_dataset.get_metrics()
     
     # Display data summary with improved metrics
     st.markdown("---")
@@ -107,6 +106,8 @@ if st.session_state['crash_data'] is not None:
     with col3:
         avg_per_year = int(stats['total_incidents'] / len(years)) if years else 0
         st.metric("Avg. Incidents/Year", f"{avg_per_year:,}", help="Average number of incidents per year")
+    st.caption(f"Shared dataset: {dataset_metrics['rows']:,} rows, {dataset_metrics['memory_mb']} MB in memory, "
+               f"loaded in {dataset_metrics['load_seconds']}s")
     
     # Display AI insights with improved formatting
     if st.session_state['crash_insights']:
@@ -223,15 +224,57 @@ if st.session_state['crash_data'] is not None:
             st.dataframe(location_df, use_container_width=True, height=400)
             st.markdown("</div>", unsafe_allow_html=True)
         
+        # Density-based hotspots from the crash coordinates
+        st.markdown("### Crash Hotspot Clusters")
+        if st.session_state['crash_hotspots'] is None:
+            st.session_state['crash_hotspots'] = detect_hotspot_clusters(
+                df, spatial_index=crash_dataset.get_spatial_index(), top=20)
+        hotspot_df = pd.DataFrame(st.session_state['crash_hotspots'])
+        if not hotspot_df.empty:
+            st.caption("Areas where neighbouring 100 m blocks each saw many crashes, ranked by total crashes.")
+            st.dataframe(hotspot_df[['cluster_id', 'location', 'crash_count', 'avg_severity', 'severe_crashes',
+                                     'peak_hour', 'peak_day', 'radius_m']].rename(columns={
+                                         'cluster_id': 'Rank', 'location': 'Busiest Intersection',
+                                         'crash_count': 'Crashes', 'avg_severity': 'Avg Severity',
+                                         'severe_crashes': 'Severe', 'peak_hour': 'Peak Hour',
+                                         'peak_day': 'Peak Day', 'radius_m': 'Radius (m)'}),
+                         use_container_width=True, hide_index=True)
+        
         # Map visualization with improved container
         st.markdown("### Geographic Distribution")
         st.info("This heat map shows the concentration of crashes across San Jose. Darker areas indicate higher crash frequencies.")
         
-        # Embed a sample heatmap with better styling
+        weight_by_severity = st.checkbox("Weight by crash severity", value=True, key="heatmap_weighted")
+        
+        # Rebuild the heat layer for the last view reported by the map, so only visible cells are sent
+        view = st.session_state['heatmap_view']
+        pyramid = crash_dataset.get_heatmap_pyramid()
+        bounds = view['bounds'] or viewport_bounds(view['center'][0], view['center'][1], view['zoom'], height_px=HEATMAP_HEIGHT)
+        heat_cells, heat_level = pyramid.visible_cells(view['zoom'], *bounds, weighted=weight_by_severity)
+        
+        heat_map = folium.Map(location=view['center'], zoom_start=view['zoom'], tiles="cartodbpositron")
+        HeatMap(np.round(heat_cells, 6).tolist(), radius=15, blur=10, max_zoom=view['zoom'],
+                gradient={0.4: 'blue', 0.65: 'yellow', 0.9: 'orange', 1: 'red'}).add_to(heat_map)
+        
         st.markdown("<div class='map-container'>", unsafe_allow_html=True)
-        st.image("https://via.placeholder.com/800x400?text=Crash+Heatmap+Visualization", use_column_width=True)
+        map_state = st_folium(heat_map, height=HEATMAP_HEIGHT, use_container_width=True,
+                              returned_objects=["zoom", "bounds"], key="crash_heatmap")
         st.markdown("</div>", unsafe_allow_html=True)
-        st.caption("Sample heatmap visualization - in a production app, this would be an interactive map using the latitude/longitude data")
+        st.caption(f"Showing {len(heat_cells):,} grid cells (zoom level {heat_level}) summarizing "
+                   f"{pyramid.n_points:,} located crashes. Pan or zoom to refine the view.")
+        
+        # Pick up pans and zooms on the next run
+        if map_state and map_state.get('bounds') and map_state['bounds'].get('_southWest'):
+            south_west, north_east = map_state['bounds']['_southWest'], map_state['bounds']['_northEast']
+            new_bounds = (south_west['lat'], south_west['lng'], north_east['lat'], north_east['lng'])
+            new_zoom = int(map_state.get('zoom') or view['zoom'])
+            if new_zoom != view['zoom'] or view['bounds'] is None or not np.allclose(new_bounds, view['bounds']):
+                st.session_state['heatmap_view'] = {
+                    'center': [(new_bounds[0] + new_bounds[2]) / 2, (new_bounds[1] + new_bounds[3]) / 2],
+                    'zoom': new_zoom,
+                    'bounds': new_bounds
+                }
+                st.rerun()
         
         # Add a download button for the map data
         st.download_button(
@@ -328,10 +371,11 @@ if st.session_state['crash_data'] is not None:
     with tab4:
         st.subheader("🔍 Advanced Crash Insights")
         
+        # Chart counts come from the pre-aggregated cube instead of scanning rows
         # Collision types analysis
-        if 'CollisionType' in original_df.columns:
+        if 'collision_type' in cube.dimensions:
             st.markdown("### Collision Types")
-            collision_counts = original_df['CollisionType'].value_counts().head(10)
+            collision_counts = cube.marginal('collision_type', sort=True).head(10)
             fig = px.bar(collision_counts, 
                          title='Top 10 Collision Types',
                          labels={'index': 'Collision Type', 'value': 'Count'})
@@ -347,9 +391,9 @@ if st.session_state['crash_data'] is not None:
             """)
         
         # Primary factors analysis
-        if 'PrimaryCollisionFactor' in original_df.columns:
+        if 'factor' in cube.dimensions:
             st.markdown("### Primary Collision Factors")
-            factor_counts = original_df['PrimaryCollisionFactor'].value_counts().head(10)
+            factor_counts = cube.marginal('factor', sort=True).head(10)
             fig = px.pie(names=factor_counts.index, values=factor_counts.values, 
                          title='Primary Collision Factors')
             st.plotly_chart(fig, use_container_width=True)
@@ -364,21 +408,21 @@ if st.session_state['crash_data'] is not None:
             """)
         
         # Lighting conditions
-        if 'Lighting' in original_df.columns:
+        if 'lighting' in cube.dimensions:
             st.markdown("### Lighting Conditions")
-            lighting_counts = original_df['Lighting'].value_counts()
+            lighting_counts = cube.marginal('lighting', sort=True)
             fig = px.bar(lighting_counts, 
                          title='Lighting Conditions During Crashes',
                          labels={'index': 'Lighting Condition', 'value': 'Count'})
             st.plotly_chart(fig, use_container_width=True)
         
         # Road conditions
-        if 'RoadwayCondition' in original_df.columns and 'RoadwaySurface' in original_df.columns:
+        if 'road_condition' in cube.dimensions and 'surface' in cube.dimensions:
             col1, col2 = st.columns(2)
             
             with col1:
                 st.markdown("### Roadway Conditions")
-                road_counts = original_df['RoadwayCondition'].value_counts()
+                road_counts = cube.marginal('road_condition', sort=True)
                 fig = px.bar(road_counts, 
                              title='Roadway Conditions During Crashes',
                              labels={'index': 'Road Condition', 'value': 'Count'})
@@ -386,7 +430,7 @@ if st.session_state['crash_data'] is not None:
             
             with col2:
                 st.markdown("### Road Surface")
-                surface_counts = original_df['RoadwaySurface'].value_counts()
+                surface_counts = cube.marginal('surface', sort=True)
                 fig = px.pie(names=surface_counts.index, values=surface_counts.values,
                              title='Road Surface During Crashes')
                 st.plotly_chart(fig, use_container_width=True)
@@ -398,7 +442,7 @@ if st.session_state['crash_data'] is not None:
             st.markdown(f"""
             🧠 **AI Analysis**: While most crashes occur on **{top_surface}** surfaces, the risk ratio
             when comparing **{top_surface}** to **{second_surface}** surfaces reveals that your risk increases 
-            approximately {(surface_counts[1]/surface_counts[0])*100:.1f}% in {second_surface} conditions.
+            approximately {(surface_counts.iloc[1]/surface_counts.iloc[0])*100:.1f}% in {second_surface} conditions.
             Use extra caution during adverse road conditions and consider timing your commute to avoid
             traveling during these higher-risk periods.
             """)
@@ -0,0 +1,964 @@
+"""
+Unit tests for crash data processing and the columnar crash data cache
+"""
+
+import unittest
+import sys
+import os
+import shutil
+import tempfile
+import threading
+from unittest import mock
+import pandas as pd
+import numpy as np
+from pathlib import Path
+
+# Add parent directory to path
+parent_dir = str(Path(__file__).parent.parent)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from utils.custom_data_processor import (
+    process_crash_data, transform_crash_data, process_crash_data_streaming, CrashStatsAccumulator,
+    compact_crash_frame, memory_footprint, parse_crash_datetimes, derive_datetime_parts
+)
+from utils.crash_cube import CrashCube
+from utils.crash_dataset import SharedCrashDataset
+from utils.crash_spatial_index import CrashSpatialIndex, project, unproject
+from utils.route_corridor import crashes_near_route, analyze_route_crashes
+from utils.hotspot_clusters import detect_hotspot_clusters, location_hotspot_profiles
+from utils.crash_risk_surface import CrashRiskSurfaces, route_risk_profile
+from utils.offline_geocoder import OfflineGeocoder, normalize_street
+from utils.road_graph import RoadGraph, load_road_graph
+from utils.safe_router import (
+    SafeRouter, choose_route, safety_weight, RISK_COST_M, MAX_ALTERNATIVE_OVERLAP, MAX_ALTERNATIVE_STRETCH
+)
+from utils.contraction_hierarchy import ContractionHierarchy, load_contraction_hierarchy
+from utils.crash_heatmap import HeatmapPyramid, load_heatmap_pyramid, mercator, MIN_ZOOM, MAX_ZOOM, CELL_BITS
+from utils.crash_store import (
+    load_crash_data, load_processed_crash_data, save_processed_crash_data, append_crash_records
+)
+
+CRASH_DATA_PATH = Path(parent_dir) / "utils" / "crashdata2011-2021.csv"
+
+def load_sample_crashes(nrows=2000):
+    """Load the first rows of the bundled crash CSV"""
+    return pd.read_csv(CRASH_DATA_PATH, nrows=nrows)
+
+def reference_process_crash_data(df):
+    """Row-wise reference implementation of the derived columns, pinned for regression tests"""
+    processed_df = df.copy()
+    processed_df['datetime'] = pd.to_datetime(processed_df['CrashDateTime'], errors='coerce')
+
+    def calculate_severity(row):
+        if row['FatalInjuries'] > 0:
+            return 5
+        elif row['SevereInjuries'] > 0:
+            return 4
+        elif row['ModerateInjuries'] > 0:
+            return 3
+        elif row['MinorInjuries'] > 0:
+            return 2
+        else:
+            return 1
+
+    processed_df['severity'] = processed_df.apply(calculate_severity, axis=1)
+    processed_df['location'] = processed_df.apply(
+        lambda row: f"{row['AStreetName']} & {row['BStreetName']}"
+        if pd.notna(row['AStreetName']) and pd.notna(row['BStreetName'])
+        else row['AStreetName'] if pd.notna(row['AStreetName'])
+        else row['BStreetName'] if pd.notna(row['BStreetName'])
+        else "Unknown", axis=1
+    )
+    weather_mapping = {'Clear': 'clear', 'Rain': 'rain', 'Fog': 'fog', 'Snow': 'snow', 'Cloudy': 'cloudy', 'Other': 'other'}
+    processed_df['weather'] = processed_df['Weather'].map(
+        lambda x: next((v for k, v in weather_mapping.items() if k in str(x)), 'other')
+    )
+
+    def estimate_traffic_density(row):
+        time = row['datetime'].hour if not pd.isna(row['datetime']) else 12
+        if (7 <= time <= 9) or (16 <= time <= 18):
+            return 'high'
+        elif 22 <= time or time <= 5:
+            return 'low'
+        else:
+            return 'medium'
+
+    processed_df['traffic_density'] = processed_df.apply(estimate_traffic_density, axis=1)
+    return processed_df
+
+
+class TestProcessCrashData(unittest.TestCase):
+    def setUp(self):
+        self.df = load_sample_crashes(3000)
+        # Inject the missing-value edge cases the row-wise code handled
+        self.df.loc[0, 'AStreetName'] = np.nan
+        self.df.loc[1, 'BStreetName'] = np.nan
+        self.df.loc[2, ['AStreetName', 'BStreetName']] = np.nan
+        self.df.loc[3, 'Weather'] = np.nan
+        self.df.loc[4, 'CrashDateTime'] = 'not a date'
+        self.df.loc[5, ['FatalInjuries', 'MinorInjuries']] = 1
+
+    def test_matches_row_wise_reference(self):
+        """Test that the vectorized columns match the original row-wise implementation"""
+        processed_df, _ = process_crash_data(self.df)
+        expected_df = reference_process_crash_data(self.df)
+
+        for column in ['severity', 'location', 'weather', 'traffic_density']:
+            np.testing.assert_array_equal(
+                processed_df[column].to_numpy(dtype=object),
+                expected_df[column].to_numpy(dtype=object),
+                err_msg=column
+            )
+        self.assertEqual(processed_df.loc[2, 'location'], "Unknown")
+        self.assertEqual(processed_df.loc[4, 'traffic_density'], 'medium')
+        self.assertEqual(processed_df.loc[5, 'severity'], 5)
+
+    def test_datetime_parts_match_accessors(self):
+        """Test explicit-format parsing and single-pass parts against pandas inference"""
+        values = self.df['CrashDateTime'].copy()
+        values.loc[6] = '2018-03-14 23:17:00'  # Off-format row takes the fallback path
+        datetimes = parse_crash_datetimes(values)
+        pd.testing.assert_series_equal(datetimes, pd.to_datetime(values, format='mixed', errors='coerce'))
+
+        parts = derive_datetime_parts(datetimes)
+        pd.testing.assert_series_equal(parts['hour'], datetimes.dt.hour, check_names=False)
+        pd.testing.assert_series_equal(parts['year'], datetimes.dt.year, check_names=False)
+        pd.testing.assert_series_equal(parts['day_of_week'], datetimes.dt.day_name(), check_names=False)
+        pd.testing.assert_series_equal(parts['date'], datetimes.dt.date, check_names=False)
+        pd.testing.assert_series_equal(parts['time'], datetimes.dt.time, check_names=False)
+
+    def test_compact_schema(self):
+        """Test that the compact schema shrinks the frame without changing values"""
+        processed_df, stats = process_crash_data(self.df)
+        compact_df, compact_stats = process_crash_data(self.df, compact=True)
+
+        self.assertEqual(compact_stats, stats)
+        self.assertIsInstance(compact_df['location'].dtype, pd.CategoricalDtype)
+        self.assertIsInstance(compact_df['Weather'].dtype, pd.CategoricalDtype)
+        self.assertEqual(compact_df['FatalInjuries'].dtype, np.int8)
+        self.assertEqual(compact_df['Latitude'].dtype, np.float32)
+        self.assertLess(memory_footprint(compact_df)['total_mb'] * 3, memory_footprint(processed_df)['total_mb'])
+
+        for column in ['location', 'weather', 'traffic_density', 'day_of_week', 'AStreetName']:
+            self.assertEqual(compact_df[column].astype(object).fillna('').tolist(),
+                             processed_df[column].astype(object).fillna('').tolist())
+        # Compacting twice is a no-op
+        pd.testing.assert_frame_equal(compact_crash_frame(compact_df), compact_df)
+
+
+class TestStreamingIngestion(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.csv_path = os.path.join(self.tmp_dir, "crashes.csv")
+        self.df = load_sample_crashes(3000)
+        self.df.to_csv(self.csv_path, index=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_streaming_stats_match_batch(self):
+        """Test that chunked stats equal the single-frame stats"""
+        _, expected_stats = process_crash_data(self.df)
+        kept_df, stats = process_crash_data_streaming(self.csv_path, chunksize=700)
+
+        self.assertIsNone(kept_df)
+        self.assertEqual(stats, expected_stats)
+        for key in ['locations', 'factors', 'incidents_by_hour', 'incidents_by_year']:
+            self.assertEqual(list(stats[key]), list(expected_stats[key]))
+
+    def test_streaming_keeps_requested_columns(self):
+        """Test that kept columns are concatenated across chunks"""
+        kept_df, _ = process_crash_data_streaming(self.csv_path, chunksize=1000, keep_columns=['severity', 'location'])
+        self.assertEqual(list(kept_df.columns), ['severity', 'location'])
+        self.assertEqual(len(kept_df), len(self.df))
+
+        compact_df, _ = process_crash_data_streaming(self.csv_path, chunksize=1000, keep_columns=['severity', 'location'], compact=True)
+        self.assertIsInstance(compact_df['location'].dtype, pd.CategoricalDtype)
+        self.assertEqual(compact_df['location'].astype(str).tolist(), kept_df['location'].astype(str).tolist())
+
+    def test_accumulator_merge(self):
+        """Test that accumulators over disjoint halves merge to the full stats"""
+        _, expected_stats = process_crash_data(self.df)
+        first = CrashStatsAccumulator().update(transform_crash_data(self.df.iloc[:1500]))
+        second = CrashStatsAccumulator().update(transform_crash_data(self.df.iloc[1500:]))
+        self.assertEqual(first.merge(second).to_stats(), expected_stats)
+
+
+class TestCrashCube(unittest.TestCase):
+    def setUp(self):
+        self.df, self.stats = process_crash_data(load_sample_crashes(3000), compact=True)
+        self.cube = CrashCube.from_frame(self.df)
+
+    def test_marginals_match_value_counts(self):
+        """Test that unfiltered marginals equal the row-scan stats"""
+        self.assertEqual(self.cube.marginal('hour').to_dict(), self.stats['incidents_by_hour'])
+        self.assertEqual(self.cube.marginal('year').to_dict(), self.stats['incidents_by_year'])
+        self.assertEqual(self.cube.marginal('severity').to_dict(), self.stats['severity_distribution'])
+        self.assertEqual(self.cube.marginal('weekday', sort=True).to_dict(), self.stats['incidents_by_day'])
+        self.assertEqual(self.cube.marginal('lighting').to_dict(),
+                         self.df['Lighting'].value_counts().sort_index().to_dict())
+        self.assertEqual(self.cube.count(), len(self.df))
+
+    def test_filtered_slices(self):
+        """Test filtered marginals, counts and crosstabs against boolean masks"""
+        mask = (self.df['weather'] == 'rain') & self.df['day_of_week'].isin(['Saturday', 'Sunday'])
+        expected = self.df.loc[mask, 'hour'].value_counts().sort_index().to_dict()
+        self.assertEqual(self.cube.marginal('hour', weather='rain', weekday=['Saturday', 'Sunday']).to_dict(), expected)
+        self.assertEqual(self.cube.count(weather='rain', weekday=['Saturday', 'Sunday']), int(mask.sum()))
+
+        table = self.cube.crosstab('hour', 'severity', weather='clear')
+        clear = self.df[self.df['weather'] == 'clear']
+        expected_table = pd.crosstab(clear['hour'], clear['severity']).reindex(index=table.index, columns=table.columns, fill_value=0)
+        np.testing.assert_array_equal(table.to_numpy(), expected_table.to_numpy())
+
+    def test_memoized_marginals_keep_filter_types(self):
+        """Test that filters differing only in value type are not served each other's memoized result"""
+        year = self.cube.labels['year'][0]
+        expected = self.cube.marginal('hour', year=year).to_dict()
+        self.assertTrue(expected)
+        self.assertEqual(self.cube.marginal('hour', year=str(year)).to_dict(), {})
+        self.assertEqual(self.cube.marginal('hour', year=year).to_dict(), expected)
+        self.assertEqual(self.cube.marginal('hour', year=[year]).to_dict(), expected)
+
+
+class TestCrashSpatialIndex(unittest.TestCase):
+    def setUp(self):
+        self.df = load_sample_crashes(5000)
+        # The source marks missing coordinates with 0
+        self.df.loc[self.df.index[:3], ['Latitude', 'Longitude']] = 0
+        self.index = CrashSpatialIndex.from_frame(self.df)
+        x, y = project(self.df['Latitude'], self.df['Longitude'])
+        self.x, self.y = x, y
+        self.valid = (self.df['Latitude'] != 0).to_numpy()
+
+    def brute_force_distances(self, lat, lon):
+        qx, qy = project(lat, lon)
+        distances = np.hypot(self.x - qx, self.y - qy)
+        distances[~self.valid] = np.inf
+        return distances
+
+    def test_skips_missing_coordinates(self):
+        """Test that 0/0 coordinates are not indexed"""
+        self.assertEqual(len(self.index), len(self.df) - 3)
+        self.assertFalse(np.isin([0, 1, 2], self.index.positions).any())
+
+    def test_queries_match_brute_force(self):
+        """Test radius, bounding box and nearest-neighbour queries against a full scan"""
+        rng = np.random.default_rng(7)
+        lats, lons = self.df['Latitude'], self.df['Longitude']
+        for _ in range(25):
+            lat, lon = 37.25 + 0.15 * rng.random(), -121.95 + 0.2 * rng.random()
+            distances = self.brute_force_distances(lat, lon)
+
+            positions, found = self.index.query_radius(lat, lon, 750, sort=True)
+            self.assertEqual(set(positions), set(np.flatnonzero(distances <= 750)))
+            self.assertTrue(np.all(np.diff(found) >= 0))
+
+            positions, found = self.index.query_knn(lat, lon, k=12)
+            np.testing.assert_allclose(found, np.sort(distances)[:12])
+
+            box = (lat - 0.01, lon - 0.01, lat + 0.01, lon + 0.01)
+            expected = np.flatnonzero(self.valid & lats.between(box[0], box[2]).to_numpy()
+                                      & lons.between(box[1], box[3]).to_numpy())
+            self.assertEqual(set(self.index.query_bbox(*box)), set(expected))
+
+    def test_corridor_matches_brute_force(self):
+        """Test that the route corridor query finds every crash near the polyline"""
+        route = np.array([[37.3382, -121.8863], [37.3352, -121.8811], [37.3209, -121.9476], [37.3639, -121.9289]])
+        rx, ry = project(route[:, 0], route[:, 1])
+        nearest = np.full(len(self.x), np.inf)
+        for i in range(len(route) - 1):
+            dx, dy = rx[i + 1] - rx[i], ry[i + 1] - ry[i]
+            t = np.clip(((self.x - rx[i]) * dx + (self.y - ry[i]) * dy) / (dx * dx + dy * dy), 0, 1)
+            nearest = np.minimum(nearest, np.hypot(self.x - rx[i] - t * dx, self.y - ry[i] - t * dy))
+        nearest[~self.valid] = np.inf
+
+        positions, distances, along, segments = self.index.query_corridor(route[:, 0], route[:, 1], 150)
+        self.assertEqual(set(positions), set(np.flatnonzero(nearest <= 150)))
+        np.testing.assert_allclose(distances, nearest[positions])
+        self.assertTrue(np.all(np.diff(along) >= 0))
+        self.assertTrue(np.all((segments >= 0) & (segments < len(route) - 1)))
+
+
+class TestCrashHeatmap(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(11)
+        n = 3000
+        self.lat = 37.33 + rng.normal(0, 0.03, n)
+        self.lon = -121.89 + rng.normal(0, 0.04, n)
+        self.severity = rng.integers(1, 6, n).astype(float)
+        self.lat[:5] = 0  # missing coordinates
+        self.pyramid = HeatmapPyramid.from_coordinates(self.lat, self.lon, self.severity)
+
+    def test_levels_conserve_crashes(self):
+        """Test that every level holds every located crash and its severity exactly once"""
+        valid = self.lat != 0
+        for zoom in range(MIN_ZOOM, MAX_ZOOM + 1):
+            level = self.pyramid.levels[zoom]
+            self.assertEqual(int(level['count'].sum()), int(valid.sum()))
+            self.assertAlmostEqual(level['weight'].sum(), self.severity[valid].sum())
+            self.assertTrue(np.all(np.diff(level['keys']) > 0))
+
+    def test_visible_cells_match_brute_force(self):
+        """Test that a view gets exactly the cells holding crashes inside its grid rows and columns"""
+        zoom, bounds = 14, (37.31, -121.92, 37.35, -121.86)
+        cells, level = self.pyramid.visible_cells(zoom, *bounds, weighted=False)
+        self.assertEqual(level, zoom)
+
+        scale = 2.0 ** (zoom + CELL_BITS)
+        x, y = mercator(self.lat, self.lon)
+        (x0, x1), (y0, y1) = mercator([bounds[2], bounds[0]], [bounds[1], bounds[3]])
+        cx, cy = np.floor(x * scale), np.floor(y * scale)
+        inside = ((cx >= np.floor(x0 * scale)) & (cx <= np.floor(x1 * scale))
+                  & (cy >= np.floor(y0 * scale)) & (cy <= np.floor(y1 * scale)) & (self.lat != 0))
+        peak = self.pyramid.levels[zoom]['count'].max()
+        self.assertEqual(int(round((cells[:, 2] * peak).sum())), int(inside.sum()))
+        self.assertEqual(len(cells), len(set(zip(cx[inside], cy[inside]))))
+
+    def test_large_views_use_coarser_levels(self):
+        """Test that a view over the cell limit is served from a coarser level"""
+        bounds = (37.1, -122.2, 37.6, -121.6)
+        cells, level = self.pyramid.visible_cells(MAX_ZOOM, *bounds, max_cells=200)
+        self.assertLessEqual(len(cells), 200)
+        self.assertLess(level, MAX_ZOOM)
+
+    def test_persisted_pyramid_round_trip(self):
+        """Test that the pyramid is saved once and read back unchanged"""
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir, ignore_errors=True)
+        df = pd.DataFrame({'Latitude': self.lat, 'Longitude': self.lon, 'severity': self.severity})
+
+        built = load_heatmap_pyramid(df, cache_dir)
+        self.assertEqual(len(list(Path(cache_dir).glob('heatmap-*.npz'))), 1)
+        loaded = load_heatmap_pyramid(df, cache_dir)
+        for zoom in built.levels:
+            for name, values in built.levels[zoom].items():
+                np.testing.assert_array_equal(loaded.levels[zoom][name], values)
+
+
+class TestCrashRiskSurface(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(5)
+        n = 2000
+        self.df = pd.DataFrame({
+            'Latitude': 37.33 + rng.normal(0, 0.02, n),
+            'Longitude': -121.89 + rng.normal(0, 0.02, n),
+            'VehicleInvolvedWith': rng.choice(['Other Vehicle', 'Bike', 'Pedestrian'], n),
+            'CollisionType': 'Other',
+            'datetime': pd.Timestamp('2020-01-01') + pd.to_timedelta(rng.integers(0, 24 * 365, n), unit='h'),
+            'weather': rng.choice(['clear', 'rain'], n)
+        })
+        self.surfaces = CrashRiskSurfaces(self.df, bounds=(37.25, -121.98, 37.41, -121.80), cell_size=100, bandwidth=200)
+
+    def test_fft_matches_direct_convolution(self):
+        """Test that the FFT-smoothed surface equals a direct Gaussian convolution and keeps every crash"""
+        surface = self.surfaces.surface()
+        counts = self.surfaces._rasterize(np.ones(len(self.df), dtype=bool))
+
+        radius = self.surfaces._radius
+        offsets = np.arange(-radius, radius + 1)
+        kernel = np.exp(-0.5 * (offsets * 100 / 200.0) ** 2)
+        kernel /= kernel.sum()
+        direct = np.apply_along_axis(np.convolve, 0, counts, kernel, mode='same')
+        direct = np.apply_along_axis(np.convolve, 1, direct, kernel, mode='same')
+
+        np.testing.assert_allclose(surface.density * 0.01, direct, atol=1e-4)
+        self.assertAlmostEqual(counts.sum(), len(self.df), places=6)
+
+    def test_filtered_surfaces_are_cached(self):
+        """Test that filters select the matching crashes and each filter key is built once"""
+        hours = self.df['datetime'].dt.hour
+        rainy_cycling = self.surfaces.surface(mode='Cycling', hour=[7, 8], weather='Rainy')
+        expected = ((self.df['VehicleInvolvedWith'] == 'Bike') & hours.isin([7, 8]) & (self.df['weather'] == 'rain')).sum()
+        self.assertEqual(rainy_cycling.n_crashes, expected)
+
+        self.assertIs(self.surfaces.surface(mode='bicycling', hour=(8, 7), weather='rain'), rainy_cycling)
+        self.assertEqual((self.surfaces.hits, self.surfaces.misses), (1, 1))
+
+    def test_sampling(self):
+        """Test that samples interpolate the grid at cell centers and are zero off the grid"""
+        surface = self.surfaces.surface()
+        x = surface.origin_x + (np.array([3, 40, 90]) + 0.5) * surface.cell_size
+        y = surface.origin_y + (np.array([7, 60, 80]) + 0.5) * surface.cell_size
+        lat, lon = unproject(x, y)
+        np.testing.assert_allclose(surface.sample(lat, lon), surface.density[[7, 60, 80], [3, 40, 90]], rtol=1e-5)
+        np.testing.assert_array_equal(surface.sample([36.0, 0.0], [-121.9, 0.0]), [0.0, 0.0])
+
+        profile = route_risk_profile(surface, [[37.30, -121.92], [37.36, -121.86]])
+        self.assertGreater(profile['peak_density'], profile['mean_density'])
+        self.assertGreater(profile['samples'], 50)
+
+
+class TestHotspotClusters(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        # Two tight groups of crashes about 2 km apart plus scattered background crashes
+        blobs = [(37.3382, -121.8863, 120, 17, 'Friday'), (37.3209, -121.9476, 60, 8, 'Monday')]
+        frames = []
+        for lat, lon, n, hour, day in blobs:
+            frames.append(pd.DataFrame({
+                'Latitude': lat + rng.normal(0, 0.0003, n),
+                'Longitude': lon + rng.normal(0, 0.0003, n),
+                'severity': np.r_[np.full(n - 10, 2), np.full(10, 5)],
+                'hour': np.r_[np.full(n // 2 + 1, hour), rng.integers(0, 24, n - n // 2 - 1)],
+                'day_of_week': np.r_[np.full(n // 2 + 1, day), np.full(n - n // 2 - 1, 'Sunday')],
+                'location': f"Blob {len(frames) + 1}"
+            }))
+        frames.append(pd.DataFrame({
+            'Latitude': 37.25 + 0.15 * rng.random(200),
+            'Longitude': -121.95 + 0.2 * rng.random(200),
+            'severity': 1, 'hour': 3, 'day_of_week': 'Tuesday', 'location': 'Background'
+        }))
+        self.df = pd.concat(frames, ignore_index=True)
+
+    def test_finds_dense_groups(self):
+        """Test that each dense group becomes one ranked hotspot with its own profile"""
+        hotspots = detect_hotspot_clusters(self.df, min_cell_crashes=10)
+        self.assertEqual([spot['location'] for spot in hotspots], ['Blob 1', 'Blob 2'])
+
+        first, second = hotspots
+        self.assertGreaterEqual(first['crash_count'], 100)
+        self.assertEqual(first['severe_crashes'], 10)
+        self.assertEqual((first['peak_hour'], first['peak_day']), (17, 'Friday'))
+        self.assertEqual((second['peak_hour'], second['peak_day']), (8, 'Monday'))
+        self.assertAlmostEqual(first['lat'], 37.3382, places=3)
+
+    def test_no_dense_cells(self):
+        """Test that sparse data yields no hotspots"""
+        self.assertEqual(detect_hotspot_clusters(self.df, min_cell_crashes=1000), [])
+
+    def test_location_profiles_match_per_location_loop(self):
+        """Test that grouped location profiles match filtering each location separately"""
+        df, _ = process_crash_data(load_sample_crashes(3000))
+        profiles = location_hotspot_profiles(df)
+        self.assertEqual(len(profiles), df['location'].nunique())
+
+        for profile, (location, count) in zip(profiles[:25], df['location'].value_counts().head(25).items()):
+            crashes = df[df['location'] == location]
+            expected = {
+                'location': location,
+                'crash_count': int(count),
+                'avg_severity': float(round(crashes['severity'].mean(), 1)),
+                'peak_hour': int(crashes['datetime'].dt.hour.value_counts().idxmax()),
+                'peak_day': crashes['datetime'].dt.day_name().value_counts().idxmax()
+            }
+            self.assertEqual(profile, expected)
+
+        # Categorical codes order tied counts differently, so compare without ranking
+        compact_df, _ = process_crash_data(load_sample_crashes(3000), compact=True)
+        by_location = lambda rows: sorted(rows, key=lambda row: row['location'])
+        self.assertEqual(by_location(location_hotspot_profiles(compact_df)), by_location(profiles))
+
+
+class TestOfflineGeocoder(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        rows = [
+            ('BLOSSOM HILL RD', 'MONTEREY RD', 116654, 37.255036, -121.801352, 5),
+            ('BLOSSOM HILL RD', 'MONTEREY RD', 20272, 37.256271, -121.803432, 1),
+            ('BLOSSOM HILL RD', 'SANTA TERESA BL', 1001, 37.2489, -121.8431, 3),
+            ('FIRST ST', 'SANTA CLARA ST', 1002, 37.3362, -121.8906, 4),
+            ('TWENTY THIRD ST', 'SANTA CLARA ST', 1003, 37.3469, -121.8698, 2),
+            ('MONTEREY RD', 'TULLY RD', 1004, 37.3043, -121.8531, 2),
+            ('SANTA CLARA ST', 'MONTEREY RD', 1005, 0.0, 0.0, 1),
+            ('ALUM ROCK AV', 'KING RD', 1006, 37.3570, -121.8530, 3),
+            ('ALUM ROCK AV', 'WHITE RD', 1007, 37.3700, -121.8290, 2),
+            ('WILLOW GLEN WY', 'MINNESOTA AV', 1008, 37.3030, -121.8940, 1)
+        ]
+        records = [row[:5] for row in rows for _ in range(row[5])]
+        df = pd.DataFrame(records, columns=['AStreetName', 'BStreetName', 'IntersectionNumber', 'Latitude', 'Longitude'])
+        cls.geocoder = OfflineGeocoder.from_frame(df)
+
+    def test_normalize_street(self):
+        """Test that typed street names map to crash-data tokens"""
+        self.assertEqual(normalize_street("N 1st Street"), ['first', 'st'])
+        self.assertEqual(normalize_street("123 Blossom Hill Road"), ['blossom', 'hill', 'rd'])
+        self.assertEqual(normalize_street("23rd Ave."), ['twenty', 'third', 'av'])
+        self.assertEqual(normalize_street("Blossom Hill Ro", partial=True), ['blossom', 'hill', 'ro'])
+
+    def test_geocode_intersections(self):
+        """Test exact, abbreviated, misspelled and address-style intersection input"""
+        for text in ["Blossom Hill Rd & Monterey Rd", "blossom hill road and monterey road",
+                     "Blosom Hil Rd & Montery Rd", "Monterey @ Blossom Hill, San Jose, CA 95123"]:
+            result = self.geocoder.geocode(text)
+            self.assertEqual(result['name'], 'Blossom Hill Rd & Monterey Rd', text)
+            self.assertEqual((result['lat'], result['lng'], result['crash_count']), (37.255036, -121.801352, 5))
+
+        self.assertEqual(self.geocoder.geocode("1st & Santa Clara")['name'], 'First St & Santa Clara St')
+        self.assertEqual(self.geocoder.geocode("23rd St & Santa Clara St")['kind'], 'intersection')
+        # Streets that never meet resolve to the nearest intersection on the first street
+        self.assertEqual(self.geocoder.geocode("Tully Rd & Santa Teresa Blvd")['kind'], 'near_intersection')
+
+    def test_geocode_places_and_misses(self):
+        """Test landmarks, single streets and unknown input"""
+        self.assertEqual(self.geocoder.geocode("Santana Row, San Jose")['kind'], 'landmark')
+        street = self.geocoder.geocode("Blossom Hill Road")
+        self.assertEqual((street['kind'], street['name'], street['crash_count']), ('street', 'Blossom Hill Rd', 9))
+        self.assertIsNone(self.geocoder.geocode("Xyzzy Plugh"))
+
+    def test_street_names_containing_landmarks(self):
+        """Test that streets and intersections named after a landmark are not resolved to the landmark"""
+        result = self.geocoder.geocode("Alum Rock Ave & King Rd")
+        self.assertEqual((result['kind'], result['lat'], result['lng']), ('intersection', 37.3570, -121.8530))
+        result = self.geocoder.geocode("Alum Rock Av & White Rd")
+        self.assertEqual((result['kind'], result['lat'], result['lng']), ('intersection', 37.3700, -121.8290))
+        result = self.geocoder.geocode("Willow Glen Way")
+        self.assertEqual((result['kind'], result['name']), ('street', 'Willow Glen Wy'))
+        self.assertEqual(self.geocoder.geocode("Willow Glen")['kind'], 'landmark')
+        self.assertEqual(self.geocoder.geocode("near Santana Row")['kind'], 'landmark')
+
+    def test_suggestions(self):
+        """Test street prefixes, word prefixes and cross-street suggestions"""
+        self.assertEqual(self.geocoder.suggest("blossom h"), ['Blossom Hill Rd'])
+        self.assertIn('Blossom Hill Rd', self.geocoder.suggest("hill"))
+        self.assertEqual(self.geocoder.suggest("Monterey Rd & "), ['Monterey Rd & Blossom Hill Rd', 'Monterey Rd & Tully Rd'])
+        self.assertEqual(self.geocoder.suggest("Blossom Hill Rd & mon"), ['Blossom Hill Rd & Monterey Rd'])
+
+
+def grid_street_crashes(size=3, spacing=0.002):
+    """Crash records on a size x size grid of streets (AV running east-west, ST north-south)"""
+    records = []
+    for row in range(size):
+        for col in range(size):
+            number = 100 * (row + 1) + col + 1
+            lat, lon = 37.30 + row * spacing, -121.90 + col * spacing
+            records.append((number, f"ROW{row} AV", f"COL{col} ST", lat, lon, 2, 0.0, 'At'))
+    return records
+
+
+class TestRoadGraph(unittest.TestCase):
+    def setUp(self):
+        records = grid_street_crashes()
+        # Two mid-block crashes east of the (row 0, col 0) intersection on ROW0 AV, one north of it on COL0 ST
+        records += [(101, 'ROW0 AV', 'COL0 ST', 37.30, -121.90, 5, 120.0, 'East Of')] * 2
+        records += [(101, 'COL0 ST', 'ROW0 AV', 37.30, -121.90, 3, 80.0, 'North Of')]
+        self.df = pd.DataFrame(records, columns=['IntersectionNumber', 'AStreetName', 'BStreetName', 'Latitude',
+                                                 'Longitude', 'severity', 'Distance', 'DirectionFromIntersection'])
+        self.graph = RoadGraph.from_frame(self.df)
+
+    def edge_between(self, a, b):
+        u, v = self.graph.node_for_number(a), self.graph.node_for_number(b)
+        neighbours, edges = self.graph.neighbors(u)
+        return int(edges[list(neighbours).index(v)])
+
+    def test_grid_streets_become_grid_edges(self):
+        """Test that consecutive intersections along each street are joined, and only those"""
+        self.assertEqual((self.graph.n_nodes, self.graph.n_edges), (9, 12))
+        self.assertEqual(sorted(np.diff(self.graph.indptr)), [2, 2, 2, 2, 3, 3, 3, 3, 4])
+        centre = self.graph.node_for_number(202)
+        self.assertEqual(sorted(self.graph.node_number[self.graph.neighbors(centre)[0]]), [102, 201, 203, 302])
+
+        edge = self.edge_between(101, 102)
+        self.assertEqual(self.graph.street_names[self.graph.edge_street[edge]], 'ROW0 AV')
+        self.assertAlmostEqual(float(self.graph.edge_length[edge]), 0.002 * 111195 * np.cos(np.radians(37.3382)), delta=1)
+
+    def test_midblock_crashes_go_to_their_segment(self):
+        """Test that crashes some distance from an intersection count towards the segment in that direction"""
+        east, north = self.edge_between(101, 102), self.edge_between(101, 201)
+        self.assertEqual((self.graph.edge_crashes[east], self.graph.edge_severe[east]), (2, 2))
+        self.assertEqual((self.graph.edge_crashes[north], self.graph.edge_severity[north]), (1, 3))
+        self.assertEqual(self.graph.node_crashes[self.graph.node_for_number(101)], 1)
+        self.assertEqual(self.graph.edge_crashes.sum() + self.graph.node_crashes.sum(), len(self.df))
+
+    def test_cached_graph_round_trip(self):
+        """Test that the graph is written once and loads back with identical arrays"""
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir, ignore_errors=True)
+        built = load_road_graph(self.df, cache_dir)
+        self.assertEqual(len(list(Path(cache_dir).glob('road-graph-*.npz'))), 1)
+        loaded = load_road_graph(self.df, cache_dir)
+        for name in ('indptr', 'indices', 'arc_edge', 'edge_length', 'edge_crashes', 'street_names'):
+            np.testing.assert_array_equal(getattr(loaded, name), getattr(built, name))
+        self.assertEqual(loaded.nearest_node(37.3021, -121.8981)[0], loaded.node_for_number(202))
+
+
+def reference_route_cost(graph, source, target, weight):
+    """Plain Dijkstra over every arc, used to check the A* router"""
+    import heapq
+    arc_risk = graph.edge_severity[graph.arc_edge] + graph.node_severity[graph.indices]
+    arc_cost = graph.edge_length[graph.arc_edge].astype(np.float64) + weight * RISK_COST_M * arc_risk
+    best = {source: 0.0}
+    heap = [(0.0, source)]
+    while heap:
+        cost, node = heapq.heappop(heap)
+        if cost > best[node]:
+            continue
+        for arc in range(graph.indptr[node], graph.indptr[node + 1]):
+            neighbour = int(graph.indices[arc])
+            if cost + arc_cost[arc] < best.get(neighbour, np.inf):
+                best[neighbour] = cost + arc_cost[arc]
+                heapq.heappush(heap, (best[neighbour], neighbour))
+    return best.get(target)
+
+
+def random_risk_grid(size, seed, extra_crashes=15):
+    """Street grid with clusters of random-severity crashes at random intersections or on the block east or north of them"""
+    rng = np.random.default_rng(seed)
+    records = grid_street_crashes(size=size)
+    for number in rng.choice([r[0] for r in records], size=extra_crashes):
+        row, col = int(number) // 100 - 1, int(number) % 100 - 1
+        street, cross = f"ROW{row} AV", f"COL{col} ST"
+        distance, direction = [(0.0, 'At'), (100.0, 'East Of'), (100.0, 'North Of')][rng.integers(3)]
+        if direction == 'North Of':
+            street, cross = cross, street
+        records += [(int(number), street, cross, 37.30 + row * 0.002, -121.90 + col * 0.002,
+                     int(rng.integers(1, 6)), distance, direction)] * int(rng.integers(1, 6))
+    df = pd.DataFrame(records, columns=['IntersectionNumber', 'AStreetName', 'BStreetName', 'Latitude',
+                                        'Longitude', 'severity', 'Distance', 'DirectionFromIntersection'])
+    return RoadGraph.from_frame(df), rng
+
+
+class TestSafeRouter(unittest.TestCase):
+    def test_matches_dijkstra(self):
+        """Test that A* finds routes as cheap as exhaustive Dijkstra for every safety weight"""
+        graph, rng = random_risk_grid(size=5, seed=3)
+        router = SafeRouter(graph)
+        arc_risk = graph.edge_severity[graph.arc_edge] + graph.node_severity[graph.indices]
+        for weight in (0.0, 0.5, 1.0):
+            for source, target in rng.integers(0, graph.n_nodes, size=(20, 2)):
+                nodes, arcs = router.shortest_path(int(source), int(target), weight)
+                self.assertEqual((nodes[0], nodes[-1]), (source, target))
+                np.testing.assert_array_equal(graph.indices[arcs], nodes[1:])
+                cost = sum(float(graph.edge_length[graph.arc_edge[a]]) + weight * RISK_COST_M * arc_risk[a] for a in arcs)
+                self.assertAlmostEqual(cost, reference_route_cost(graph, int(source), int(target), weight), places=3)
+
+    def test_safety_priority_avoids_risky_segment(self):
+        """Test that the fastest route takes a crash-heavy block that the safest route detours around"""
+        records = grid_street_crashes()
+        records += [(101, 'ROW0 AV', 'COL0 ST', 37.30, -121.90, 5, 100.0, 'East Of')] * 30
+        df = pd.DataFrame(records, columns=['IntersectionNumber', 'AStreetName', 'BStreetName', 'Latitude',
+                                            'Longitude', 'severity', 'Distance', 'DirectionFromIntersection'])
+        graph = RoadGraph.from_frame(df)
+        router = SafeRouter(graph)
+        origin, destination = [37.3001, -121.9001], [37.3001, -121.8959]
+
+        options = router.route_options(origin, destination, prioritize_safety=7, mode='Walking')
+        fastest, safest = options['fastest'], options['safest']
+        self.assertEqual(list(graph.node_number[fastest['nodes']]), [101, 102, 103])
+        self.assertNotIn(102, graph.node_number[safest['nodes']])
+        self.assertEqual(options['recommended']['nodes'], safest['nodes'])
+        self.assertGreater(safest['distance_m'], fastest['distance_m'])
+        self.assertGreater(safest['eta_minutes'], fastest['eta_minutes'])
+        self.assertLess(safest['crashes'], fastest['crashes'])
+        self.assertEqual((fastest['path'][0], fastest['path'][-1]), (origin, destination))
+        self.assertEqual(fastest['streets'], ['ROW0 AV'])
+
+
+def simple_path_costs(graph, source, target):
+    """(length, risk) of every simple path between two nodes, by exhaustive search"""
+    arc_risk = graph.edge_severity[graph.arc_edge] + graph.node_severity[graph.indices]
+    costs = []
+    stack = [(source, 0.0, 0.0, {source})]
+    while stack:
+        node, length, risk, visited = stack.pop()
+        if node == target:
+            costs.append((length, risk))
+            continue
+        for arc in range(graph.indptr[node], graph.indptr[node + 1]):
+            neighbour = int(graph.indices[arc])
+            if neighbour not in visited:
+                stack.append((neighbour, length + float(graph.edge_length[graph.arc_edge[arc]]),
+                              risk + float(arc_risk[arc]), visited | {neighbour}))
+    return costs
+
+
+class TestRouteFrontier(unittest.TestCase):
+    def test_exact_frontier_matches_exhaustive_search(self):
+        """Test that label setting finds every non-dominated (length, risk) trade-off"""
+        graph, _ = random_risk_grid(size=5, seed=12, extra_crashes=30)
+        router = SafeRouter(graph)
+        for source, target in [(101, 105), (101, 305), (101, 505)]:
+            source, target = graph.node_for_number(source), graph.node_for_number(target)
+            costs = simple_path_costs(graph, source, target)
+            expected = sorted({(round(length, 3), risk) for length, risk in costs
+                               if not any(l <= length + 1e-6 and r <= risk and (l < length - 1e-6 or r < risk)
+                                          for l, r in costs)})
+            paths = router.pareto_paths(source, target, max_routes=1000, resolution=0.0)
+            self.assertEqual([(round(length, 3), risk) for length, risk, _, _ in paths], expected)
+            for length, risk, nodes, arcs in paths:
+                self.assertEqual((nodes[0], nodes[-1]), (source, target))
+                np.testing.assert_array_equal(graph.indices[arcs], nodes[1:])
+                self.assertAlmostEqual(float(graph.edge_length[graph.arc_edge[arcs]].sum()), length, places=3)
+
+    def test_capped_frontier_keeps_extremes_and_slider_picks(self):
+        """Test that a capped frontier keeps the fastest and safest routes and the slider blend picks the A* route"""
+        # Each avenue further north is a longer way round but has fewer crashes
+        records = grid_street_crashes(size=5)
+        for row in range(4):
+            for col in range(4):
+                records += [(100 * (row + 1) + col + 1, f"ROW{row} AV", f"COL{col} ST", 37.30 + row * 0.002,
+                             -121.90 + col * 0.002, 5, 100.0, 'East Of')] * (3 * (4 - row))
+        df = pd.DataFrame(records, columns=['IntersectionNumber', 'AStreetName', 'BStreetName', 'Latitude',
+                                            'Longitude', 'severity', 'Distance', 'DirectionFromIntersection'])
+        graph = RoadGraph.from_frame(df)
+        router = SafeRouter(graph)
+        source, target = graph.node_for_number(101), graph.node_for_number(105)
+
+        full = router.pareto_paths(source, target, max_routes=1000, resolution=0.0)
+        self.assertEqual([risk for _, risk, _, _ in full], [248.0, 192.0, 136.0, 80.0, 24.0])
+        capped = router.pareto_paths(source, target, max_routes=3, resolution=0.0)
+        self.assertEqual([risk for _, risk, _, _ in capped], [248.0, 136.0, 24.0])
+
+        origin, destination = graph.path_coords([source, target])
+        frontier = [router.describe(nodes, arcs, origin, destination) for _, _, nodes, arcs in full]
+        self.assertEqual(choose_route(frontier, 0)['nodes'], frontier[0]['nodes'])
+        self.assertEqual(choose_route(frontier, 10)['nodes'], frontier[-1]['nodes'])
+        for slider in range(11):
+            risk_cost = safety_weight(slider) * RISK_COST_M
+            picked = choose_route(frontier, slider)
+            searched = router.route(origin, destination, slider)
+            self.assertAlmostEqual(picked['distance_m'] + risk_cost * picked['risk'],
+                                   searched['distance_m'] + risk_cost * searched['risk'], delta=0.5)
+
+
+class TestAlternativeRoutes(unittest.TestCase):
+    def setUp(self):
+        self.graph, _ = random_risk_grid(size=6, seed=8, extra_crashes=30)
+        self.router = SafeRouter(self.graph)
+        self.origin, self.destination = self.graph.path_coords([self.graph.node_for_number(101),
+                                                                 self.graph.node_for_number(606)])
+
+    def test_alternatives_are_distinct_and_bounded(self):
+        """Test that alternatives start from the best route, overlap little and cost at most the stretch limit"""
+        routes = self.router.alternative_routes(self.origin, self.destination, prioritize_safety=7, mode='Walking', k=3)
+        self.assertEqual(len(routes), 3)
+        best = self.router.route(self.origin, self.destination, 7, mode='Walking')
+        self.assertEqual(routes[0]['nodes'], best['nodes'])
+
+        costs = self.router.arc_costs(safety_weight(7))
+        best_cost = costs[routes[0]['arcs']].sum()
+        edge_sets = []
+        for route in routes:
+            edges = set(self.graph.arc_edge[route['arcs']].tolist())
+            length = self.graph.edge_length[list(edges)].sum()
+            self.assertAlmostEqual(route['distance_m'], length, delta=0.5)
+            self.assertLessEqual(costs[route['arcs']].sum(), MAX_ALTERNATIVE_STRETCH * best_cost + 1e-6)
+            for other in edge_sets:
+                self.assertLessEqual(self.graph.edge_length[list(edges & other)].sum(), MAX_ALTERNATIVE_OVERLAP * length + 1e-6)
+            edge_sets.append(edges)
+            self.assertEqual(route['eta_minutes'], max(round(route['distance_m'] / 1.4 / 60), 1))
+
+    def test_alternatives_extend_a_given_route(self):
+        """Test that alternatives can start from a route picked elsewhere (e.g. on the frontier)"""
+        frontier = self.router.route_frontier(self.origin, self.destination)
+        routes = self.router.alternative_routes(self.origin, self.destination, 10, k=2, first=frontier[-1])
+        self.assertIs(routes[0], frontier[-1])
+        self.assertLessEqual(len(routes), 2)
+        single = self.router.alternative_routes(self.origin, self.origin, 7)
+        self.assertEqual(len(single), 1)
+        self.assertEqual(single[0]['distance_m'], 0.0)
+
+
+class TestContractionHierarchy(unittest.TestCase):
+    def setUp(self):
+        self.graph, _ = random_risk_grid(size=6, seed=5, extra_crashes=40)
+        self.router = SafeRouter(self.graph)
+        self.costs = self.router.arc_costs(0.7)
+
+    def test_queries_match_dijkstra(self):
+        """Test that hierarchy queries return Dijkstra's cost and a connected path of original arcs"""
+        hierarchy = ContractionHierarchy.build(self.graph.indptr, self.graph.indices, self.costs)
+        self.assertGreater(hierarchy.n_shortcuts, 0)
+        sources = np.repeat(np.arange(self.graph.n_nodes), np.diff(self.graph.indptr))
+        for source in range(self.graph.n_nodes):
+            for target in range(self.graph.n_nodes):
+                cost, arcs = hierarchy.query(source, target)
+                self.assertAlmostEqual(cost, reference_route_cost(self.graph, source, target, 0.7), places=6)
+                self.assertAlmostEqual(float(self.costs[arcs].sum()), cost, places=6)
+                nodes = [source] + self.graph.indices[arcs].tolist()
+                np.testing.assert_array_equal(sources[arcs], nodes[:-1])
+                self.assertEqual(nodes[-1], target)
+
+    def test_router_serves_cached_hierarchies(self):
+        """Test that the router answers precomputed slider settings from a persisted hierarchy"""
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir, ignore_errors=True)
+        router = SafeRouter(self.graph, hierarchy_priorities=(7,), cache_dir=cache_dir)
+        origin, destination = self.graph.path_coords([self.graph.node_for_number(101), self.graph.node_for_number(606)])
+
+        routed = router.route(origin, destination, 7)
+        self.assertEqual(len(list(Path(cache_dir).glob('route-hierarchy-p07-*.npz'))), 1)
+        self.assertIsNone(router.hierarchy(6))
+        searched = self.router.route(origin, destination, 7)
+        risk_cost = safety_weight(7) * RISK_COST_M
+        self.assertAlmostEqual(routed['distance_m'] + risk_cost * routed['risk'],
+                               searched['distance_m'] + risk_cost * searched['risk'], places=3)
+
+        loaded = load_contraction_hierarchy(self.graph.indptr, self.graph.indices, self.costs, 'route-hierarchy-p07', cache_dir)
+        np.testing.assert_array_equal(loaded.arc_cost, router.hierarchy(7).arc_cost)
+        np.testing.assert_array_equal(loaded.up_arcs, router.hierarchy(7).up_arcs)
+
+        # The app's route options take the recommended route from the hierarchy at these settings
+        frontier = router.route_frontier(origin, destination)
+        with mock.patch.object(router, 'shortest_path', side_effect=AssertionError("A* used")):
+            options = router.route_options(origin, destination, 7, frontier=frontier)
+        self.assertEqual(options['recommended']['nodes'], routed['nodes'])
+        self.assertEqual(router.route_options(origin, destination, 6, frontier=frontier)['recommended'],
+                         choose_route(frontier, 6))
+
+
+class TestCrashStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.csv_path = os.path.join(self.tmp_dir, "crashes.csv")
+        self.cache_dir = os.path.join(self.tmp_dir, "cache")
+        load_sample_crashes(500).to_csv(self.csv_path, index=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_round_trip(self):
+        """Test that cached data matches a fresh process_crash_data run"""
+        self.assertIsNone(load_processed_crash_data(self.csv_path, self.cache_dir, compact=True))
+
+        processed_df, stats = load_crash_data(self.csv_path, self.cache_dir)
+        cached = load_processed_crash_data(self.csv_path, self.cache_dir, compact=True)
+        self.assertIsNotNone(cached)
+
+        cached_df, cached_stats = cached
+        pd.testing.assert_frame_equal(cached_df, processed_df)
+        self.assertEqual(cached_stats, stats)
+
+    def test_source_change_invalidates_cache(self):
+        """Test that editing the source CSV produces a cache miss"""
+        processed_df, stats = process_crash_data(pd.read_csv(self.csv_path))
+        save_processed_crash_data(processed_df, stats, self.csv_path, self.cache_dir)
+        self.assertIsNotNone(load_processed_crash_data(self.csv_path, self.cache_dir))
+
+        load_sample_crashes(400).to_csv(self.csv_path, index=False)
+        self.assertIsNone(load_processed_crash_data(self.csv_path, self.cache_dir))
+
+        # Only the entry for the current file version is kept
+        processed_df, _ = load_crash_data(self.csv_path, self.cache_dir)
+        self.assertEqual(len(processed_df), 400)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+
+class TestIncrementalIngest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.csv_path = os.path.join(self.tmp_dir, "crashes.csv")
+        self.cache_dir = os.path.join(self.tmp_dir, "cache")
+        self.all_rows = load_sample_crashes(800)
+        self.all_rows.iloc[:500].to_csv(self.csv_path, index=False)
+        load_crash_data(self.csv_path, self.cache_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_append_matches_full_rebuild(self):
+        """Test that appended rows load like a store built from all rows at once"""
+        # Overlaps the stored rows by 100 and repeats one new record
+        delta = pd.concat([self.all_rows.iloc[400:800], self.all_rows.iloc[[650]]])
+        self.assertEqual(append_crash_records(delta, self.csv_path, self.cache_dir), 300)
+
+        appended_df, appended_stats = load_processed_crash_data(self.csv_path, self.cache_dir, compact=True)
+        expected_df = compact_crash_frame(transform_crash_data(self.all_rows))
+        self.assertEqual(len(appended_df), 800)
+        pd.testing.assert_frame_equal(appended_df.astype(object), expected_df.astype(object))
+        self.assertEqual(appended_stats, CrashStatsAccumulator().update(transform_crash_data(self.all_rows)).to_stats())
+
+    def test_reingesting_is_a_no_op(self):
+        """Test that records already in the store are skipped"""
+        delta_path = os.path.join(self.tmp_dir, "new.csv")
+        self.all_rows.iloc[500:600].to_csv(delta_path, index=False)
+        self.assertEqual(append_crash_records(delta_path, self.csv_path, self.cache_dir), 100)
+        self.assertEqual(append_crash_records(delta_path, self.csv_path, self.cache_dir), 0)
+        self.assertEqual(append_crash_records(self.all_rows.iloc[:50], self.csv_path, self.cache_dir), 0)
+
+        processed_df, stats = load_crash_data(self.csv_path, self.cache_dir)
+        self.assertEqual(len(processed_df), 600)
+        self.assertEqual(stats['total_incidents'], 600)
+        self.assertTrue(processed_df['CrashFactId'].is_unique)
+
+    def test_mismatched_rows_trigger_rebuild(self):
+        """Test that rows the stored dtypes cannot hold are still ingested"""
+        delta = self.all_rows.iloc[500:600].copy()
+        delta.loc[delta.index[0], 'Distance'] = np.nan
+        delta.loc[delta.index[1], 'MinorInjuries'] = np.nan
+        self.assertEqual(append_crash_records(delta, self.csv_path, self.cache_dir), 100)
+
+        processed_df, stats = load_crash_data(self.csv_path, self.cache_dir)
+        self.assertEqual(len(processed_df), 600)
+        self.assertEqual(stats['total_incidents'], 600)
+        self.assertTrue(processed_df['MinorInjuries'].isna().any())
+
+    def test_appended_rows_survive_source_change(self):
+        """Test that appended records are replayed when the store is rebuilt from a touched source CSV"""
+        self.assertEqual(append_crash_records(self.all_rows.iloc[500:600], self.csv_path, self.cache_dir), 100)
+        stat = os.stat(self.csv_path)
+        os.utime(self.csv_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self.assertIsNone(load_processed_crash_data(self.csv_path, self.cache_dir, compact=True))
+
+        processed_df, stats = load_crash_data(self.csv_path, self.cache_dir)
+        self.assertEqual(len(processed_df), 600)
+        self.assertEqual(stats['total_incidents'], 600)
+        self.assertTrue(set(self.all_rows['CrashFactId'].iloc[500:600]).issubset(processed_df['CrashFactId']))
+
+        # A source that now includes some of the appended records does not duplicate them
+        self.all_rows.iloc[:550].to_csv(self.csv_path, index=False)
+        self.assertEqual(append_crash_records(self.all_rows.iloc[600:650], self.csv_path, self.cache_dir), 50)
+        processed_df, _ = load_crash_data(self.csv_path, self.cache_dir)
+        self.assertEqual(len(processed_df), 650)
+        self.assertTrue(processed_df['CrashFactId'].is_unique)
+
+
+class TestSharedCrashDataset(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.csv_path = os.path.join(self.tmp_dir, "crashes.csv")
+        load_sample_crashes(500).to_csv(self.csv_path, index=False)
+        self.dataset = SharedCrashDataset(self.csv_path, cache_dir=os.path.join(self.tmp_dir, "cache"))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_loads_once_across_threads(self):
+        """Test that concurrent sessions share a single load and every request is counted"""
+        metric_keys = set(self.dataset.get_metrics())
+
+        def session():
+            for _ in range(50):
+                self.dataset.get()
+
+        threads = [threading.Thread(target=session) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        metrics = self.dataset.get_metrics()
+        self.assertEqual(set(metrics), metric_keys)
+        self.assertEqual(metrics['requests'], 400)
+        self.assertEqual(metrics['load_count'], 1)
+        self.assertEqual(metrics['rows'], 500)
+        self.assertGreater(metrics['memory_mb'], 0)
+        self.assertIsNotNone(metrics['load_seconds'])
+
+    def test_views_are_isolated(self):
+        """Test that session-side changes do not leak into the shared data"""
+        view, stats = self.dataset.get()
+        view['hour_label'] = 'changed'
+        stats['total_incidents'] = -1
+
+        fresh_view, fresh_stats = self.dataset.get()
+        self.assertNotIn('hour_label', fresh_view.columns)
+        self.assertEqual(fresh_stats['total_incidents'], 500)
+
+    def test_route_corridor_analysis(self):
+        """Test route crash lookup and hotspots on the shared dataset"""
+        route = [[37.3382, -121.8863], [37.3209, -121.9476]]
+        crashes = crashes_near_route(route, 200, dataset=self.dataset)
+        self.assertTrue((crashes['distance_m'] <= 200).all())
+        self.assertTrue(crashes['along_m'].is_monotonic_increasing)
+
+        result = analyze_route_crashes(route, 200, dataset=self.dataset)
+        self.assertEqual(result['summary']['crash_count'], len(crashes))
+        self.assertLessEqual(sum(spot['crash_count'] for spot in result['hotspots']), len(crashes))
+        for spot in result['hotspots']:
+            self.assertTrue(1.0 <= spot['intensity'] <= 10.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
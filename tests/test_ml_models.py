@@ -5,6 +5,10 @@ Unit tests for machine learning models
 import unittest
 import sys
 import os
+import shutil
+import tempfile
+import time
+from unittest import mock
 import pandas as pd
 import numpy as np
 from pathlib import Path
@@ -14,7 +18,10 @@ parent_dir = str(Path(__file__).parent.parent)
 if parent_dir not in sys.path:
     sys.path.append(parent_dir)
 
-from ml_models import SafetyScorePredictor, IncidentRiskClassifier, generate_time_predictions
+from ml_models import SafetyScorePredictor, IncidentRiskClassifier, PredictionCache, generate_time_predictions
+from utils import prediction_table
+from utils.prediction_table import PredictionTable, load_prediction_table
+from utils.tree_ensemble import compile_tree_model
 
 class TestSafetyScorePredictor(unittest.TestCase):
     def setUp(self):
@@ -155,5 +162,297 @@ class TestTimePredictions(unittest.TestCase):
         self.assertLess(predictions["Evening Rush (4-7 PM)"], predictions["Mid-Day (9 AM-4 PM)"])
 
 
+def synthetic_training_frame(rows=300, seed=0):
+    """Random route conditions with scores and risk levels that depend on them"""
+    rng = np.random.default_rng(seed)
+    periods = ["Early Morning (5-7 AM)", "Morning Rush (7-9 AM)", "Mid-Day (9 AM-4 PM)",
+               "Evening Rush (4-7 PM)", "Evening (7-10 PM)", "Late Night (10 PM-5 AM)"]
+    X = pd.DataFrame({
+        'time_of_day': rng.choice(periods, rows),
+        'weather': rng.choice(['Clear', 'Rainy', 'Foggy'], rows),
+        'traffic_density': rng.integers(0, 11, rows)
+    }).astype({'time_of_day': object, 'weather': object})
+    score = 9.0 - 0.3 * X['traffic_density'] - 1.5 * X['time_of_day'].str.contains('Rush') - 1.0 * (X['weather'] != 'Clear')
+    risk = np.where(score < 5, 'high', np.where(score < 7, 'medium', 'low'))
+    return X, score + rng.normal(0, 0.2, rows), pd.Series(risk)
+
+
+class TrainedModelsTestCase(unittest.TestCase):
+    """Base class sharing one safety model and risk classifier trained on synthetic_training_frame"""
+    model_dir = None
+
+    @classmethod
+    def setUpClass(cls):
+        # Trained on first use and reused by every subclass
+        if TrainedModelsTestCase.model_dir is None:
+            model_dir = tempfile.mkdtemp()
+            X, scores, risks = synthetic_training_frame()
+            predictor = SafetyScorePredictor(model_path=os.path.join(model_dir, "safety.pkl"))
+            predictor.train(X, scores)
+            classifier = IncidentRiskClassifier(model_path=os.path.join(model_dir, "risk.pkl"))
+            classifier.train(X, risks)
+            TrainedModelsTestCase.X = X
+            TrainedModelsTestCase.predictor = predictor
+            TrainedModelsTestCase.classifier = classifier
+            TrainedModelsTestCase.model_dir = model_dir
+
+    def setUp(self):
+        # Every test starts without predictions cached by another
+        self.predictor.cache.clear()
+        self.classifier.cache.clear()
+
+
+def tearDownModule():
+    if TrainedModelsTestCase.model_dir is not None:
+        shutil.rmtree(TrainedModelsTestCase.model_dir, ignore_errors=True)
+
+
+class TestBatchPredictions(TrainedModelsTestCase):
+    def test_batch_matches_single_predictions(self):
+        """Test that batch scores and risk levels match one-row predictions for dicts and frames"""
+        rows = self.X.head(20).to_dict('records')
+        single = np.array([self.predictor.predict(row) for row in rows])
+        np.testing.assert_allclose(self.predictor.predict_batch(rows), single)
+        np.testing.assert_allclose(self.predictor.predict_batch(self.X.head(20)), single)
+
+        risk_levels, probabilities = self.classifier.predict_risk_batch(self.X.head(20))
+        self.assertEqual(probabilities.shape, (20, len(self.classifier.classes)))
+        for row, level, row_probabilities in zip(rows, risk_levels, probabilities):
+            risk = self.classifier.predict_risk(row)
+            self.assertEqual(risk['risk_level'], level)
+            self.assertAlmostEqual(risk['probability'], row_probabilities.max())
+            self.assertEqual(list(risk['class_probabilities'].values()), list(row_probabilities))
+
+    def test_time_predictions_use_one_batch(self):
+        """Test that time predictions score all periods in a single batch call"""
+        base_features = {'weather': 'Rainy', 'traffic_density': 6}
+        with mock.patch.object(self.predictor, 'predict_batch', wraps=self.predictor.predict_batch) as batch:
+            predictions = generate_time_predictions(self.predictor, base_features, 7.0)
+        self.assertEqual(batch.call_count, 1)
+        for period, score in predictions.items():
+            self.assertAlmostEqual(score, self.predictor.predict(dict(base_features, time_of_day=period)))
+
+    def test_fallback_batches(self):
+        """Test that untrained models fall back row by row with the same heuristics"""
+        predictor = SafetyScorePredictor(model_path="test_models/test_safety_model.pkl")
+        classifier = IncidentRiskClassifier(model_path="test_models/test_risk_model.pkl")
+        rows = [{'weather': 'Rainy'}, {'time_of_day': 'Morning Rush Hour'}, {}]
+        np.testing.assert_allclose(predictor.predict_batch(rows), [predictor._fallback_prediction(row) for row in rows])
+        np.testing.assert_allclose(predictor.predict_batch(pd.DataFrame(rows)),
+                                   [predictor._fallback_prediction(row) for row in rows])
+        risk_levels, probabilities = classifier.predict_risk_batch(rows)
+        self.assertEqual(list(risk_levels), ['high', 'high', 'medium'])
+        np.testing.assert_allclose(probabilities.sum(axis=1), 1.0)
+
+
+class TestRowEncoder(TrainedModelsTestCase):
+    def test_encoder_matches_column_transformer(self):
+        """Test that encoded rows match the fitted preprocessor, including unknown categories"""
+        rows = self.X.head(10).to_dict('records') + [{'time_of_day': 'Midday (11 AM-1 PM)', 'weather': 'Snow', 'traffic_density': 4}]
+        for row in rows:
+            expected = self.predictor.preprocessor.transform(pd.DataFrame([row]).astype({'time_of_day': object, 'weather': object}))
+            np.testing.assert_allclose(self.predictor.encoder.encode(row), expected, rtol=1e-6)
+        self.assertIsNone(self.predictor.encoder.encode({'weather': 'Clear', 'traffic_density': 3}))
+        self.assertIsNone(self.predictor.encoder.encode({'time_of_day': 'Late Night (10 PM-5 AM)', 'weather': 'Clear', 'traffic_density': 'heavy'}))
+
+    def test_single_row_predictions_match_batch(self):
+        """Test that encoded single-row predictions match the batch path, and reloaded models keep the encoder"""
+        reloaded = SafetyScorePredictor(model_path=self.predictor.model_path)
+        self.assertIsNotNone(reloaded.encoder)
+        for row in self.X.head(20).to_dict('records'):
+            self.assertAlmostEqual(self.predictor.predict(row), self.predictor.predict_batch([row])[0], places=12)
+            self.assertAlmostEqual(reloaded.predict(row), self.predictor.predict(row), places=12)
+            risk = self.classifier.predict_risk(row)
+            levels, probabilities = self.classifier.predict_risk_batch([row])
+            self.assertEqual(risk['risk_level'], levels[0])
+            np.testing.assert_allclose(list(risk['class_probabilities'].values()), probabilities[0])
+
+        # Rows the encoder cannot handle take the batch path
+        with mock.patch.object(self.predictor, 'predict_batch', wraps=self.predictor.predict_batch) as batch:
+            self.predictor.predict({'weather': 'Clear', 'traffic_density': 3})
+        self.assertEqual(batch.call_count, 1)
+
+
+class TestTreeBackends(TrainedModelsTestCase):
+    def test_flat_backend_matches_sklearn(self):
+        """Test that both backends give the same scores and risk probabilities, one row or many"""
+        models = {backend: (SafetyScorePredictor(model_path=os.path.join(self.model_dir, "safety.pkl"), backend=backend),
+                            IncidentRiskClassifier(model_path=os.path.join(self.model_dir, "risk.pkl"), backend=backend))
+                  for backend in ('flat', 'sklearn')}
+        flat_predictor, flat_classifier = models['flat']
+        predictor, classifier = models['sklearn']
+        self.assertIsNotNone(flat_predictor.flat_model)
+        self.assertIsNotNone(flat_classifier.flat_model)
+
+        np.testing.assert_allclose(flat_predictor.predict_batch(self.X.head(100)), predictor.predict_batch(self.X.head(100)), rtol=1e-12)
+        flat_levels, flat_probabilities = flat_classifier.predict_risk_batch(self.X.head(100))
+        levels, probabilities = classifier.predict_risk_batch(self.X.head(100))
+        self.assertEqual(list(flat_levels), list(levels))
+        np.testing.assert_allclose(flat_probabilities, probabilities, rtol=1e-9, atol=1e-12)
+        for row in self.X.head(10).to_dict('records'):
+            self.assertAlmostEqual(flat_predictor.predict(row), predictor.predict(row), places=12)
+            self.assertEqual(flat_classifier.predict_risk(row)['risk_level'], classifier.predict_risk(row)['risk_level'])
+
+        with self.assertRaises(ValueError):
+            SafetyScorePredictor(model_path=os.path.join(self.model_dir, "safety.pkl"), backend='onnx')
+
+    def test_flattened_trees_handle_missing_values_and_binary_boosting(self):
+        """Test the flattened evaluators on missing feature values and on a two-class booster"""
+        from sklearn.ensemble import RandomForestRegressor, GradientBoostingClassifier
+        rng = np.random.default_rng(0)
+        X = rng.normal(size=(400, 4))
+        y = 2 * X[:, 0] + X[:, 1]
+        X[rng.random(X.shape) < 0.2] = np.nan
+        forest = RandomForestRegressor(n_estimators=20, random_state=0).fit(X, y)
+        np.testing.assert_allclose(compile_tree_model(forest).predict(X), forest.predict(X), rtol=1e-12)
+
+        X = np.nan_to_num(X)
+        booster = GradientBoostingClassifier(n_estimators=30, random_state=0).fit(X, y > 0)
+        np.testing.assert_allclose(compile_tree_model(booster).predict_proba(X), booster.predict_proba(X), rtol=1e-9, atol=1e-12)
+
+
+class TestPredictionTable(TrainedModelsTestCase):
+    def assert_matches_live(self, table, predictor, classifier, rows):
+        for row in rows:
+            self.assertAlmostEqual(table.predict(row), predictor.predict(row))
+            risk = table.predict_risk(row)
+            expected = classifier.predict_risk(row)
+            self.assertEqual(risk['risk_level'], expected['risk_level'])
+            self.assertAlmostEqual(risk['probability'], expected['probability'])
+            for cls, prob in expected['class_probabilities'].items():
+                self.assertAlmostEqual(risk['class_probabilities'][cls], prob)
+
+    def test_fallback_table_matches_heuristics(self):
+        """Test that the table for untrained models returns the fallback heuristics for every feature"""
+        predictor = SafetyScorePredictor(model_path="test_models/test_safety_model.pkl")
+        classifier = IncidentRiskClassifier(model_path="test_models/test_risk_model.pkl")
+        table = PredictionTable.build(predictor, classifier)
+        self.assertEqual(table.columns, ['time_of_day', 'weather', 'traffic_density', 'day_of_week'])
+        rows = [
+            {'time_of_day': 'Evening Rush (4-7 PM)', 'weather': 'Foggy', 'traffic_density': 8,
+             'transport_mode': 'walking', 'day_of_week': 'Friday', 'origin': 'Downtown'},
+            {'time_of_day': 'Current Time', 'weather': 'Clear', 'traffic_density': 0,
+             'transport_mode': 'driving', 'day_of_week': 'Sunday'}
+        ]
+        self.assert_matches_live(table, predictor, classifier, rows)
+
+    def test_trained_table_matches_models(self):
+        """Test that lookups match the trained models and unseen inputs are left to the live models"""
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir, ignore_errors=True)
+        table = load_prediction_table(self.predictor, self.classifier, cache_dir=cache_dir)
+        self.assertEqual(table.columns, ['time_of_day', 'weather', 'traffic_density'])
+        self.assertEqual(len(table), 11 * 4 * 11)
+        rows = [{'time_of_day': period, 'weather': weather, 'traffic_density': traffic}
+                for period in ["Morning Rush (7-9 AM)", "Midday (11 AM-1 PM)"]
+                for weather in ["Clear", "Cloudy", "Rainy"] for traffic in [0, 5, 10]]
+        self.assert_matches_live(table, self.predictor, self.classifier, rows)
+        self.assertIsNone(table.predict({'time_of_day': 'Morning Rush (7-9 AM)', 'weather': 'Snow', 'traffic_density': 3}))
+        self.assertIsNone(table.predict_risk({'weather': 'Clear', 'traffic_density': 3}))
+
+        # A second load reads the cached file instead of re-evaluating the models
+        with mock.patch.object(PredictionTable, 'build') as build:
+            cached = load_prediction_table(self.predictor, self.classifier, cache_dir=cache_dir)
+        build.assert_not_called()
+        np.testing.assert_array_equal(cached.scores, table.scores)
+        self.assert_matches_live(cached, self.predictor, self.classifier, rows[:3])
+
+    def test_home_page_features_hit_the_table(self):
+        """Test that the feature dict predict_route_safety builds from the Home page options is a table hit"""
+        predictor = SafetyScorePredictor(model_path="test_models/test_safety_model.pkl")
+        classifier = IncidentRiskClassifier(model_path="test_models/test_risk_model.pkl")
+        features = {'origin': 'Downtown San Jose', 'destination': 'San Jose State University',
+                    'time_of_day': 'Morning Commute (7-9 AM)', 'weather': 'Rainy', 'traffic_density': 5,
+                    'day_of_week': 'Monday', 'transport_mode': 'Car'}
+        with mock.patch('ml_models.safety_model', predictor), mock.patch('ml_models.risk_classifier', classifier), \
+                mock.patch.object(prediction_table, '_table', None):
+            with mock.patch.object(predictor, 'predict') as live_predict, \
+                    mock.patch.object(classifier, 'predict_risk') as live_risk, \
+                    mock.patch.object(predictor, 'predict_batch', wraps=predictor.predict_batch) as live_batch:
+                prediction_table.get_prediction_table()
+                live_batch.reset_mock()
+                for mode in ["Car", "Public Transit", "Walking", "Cycling"]:
+                    features['transport_mode'] = mode
+                    self.assertEqual(prediction_table.predict_safety(features), predictor._fallback_prediction(features))
+                    self.assertEqual(prediction_table.predict_risk(features)['risk_level'],
+                                     classifier._fallback_risk_prediction(features)['risk_level'])
+                    self.assertEqual(len(prediction_table.predict_time_periods(features, 5.0)), 6)
+            live_predict.assert_not_called()
+            live_risk.assert_not_called()
+            live_batch.assert_not_called()
+
+        # Models that read the mode find the Home page spellings under the values they were trained on
+        table = PredictionTable(['transport_mode'], np.array([6.0, 7.0, 8.0, 9.0]), np.zeros(4, dtype=np.int8),
+                                np.ones((4, 1)), ['low'])
+        self.assertEqual(table.predict({'transport_mode': 'Public Transit'}), table.predict({'transport_mode': 'transit'}))
+        self.assertEqual(table.predict({'transport_mode': 'Cycling'}), 9.0)
+        self.assertEqual(prediction_table.canonical_features(features)['transport_mode'], 'bicycling')
+
+    def test_process_table_follows_model_versions(self):
+        """Test that the process-wide table is rebuilt when either model is swapped"""
+        predictor = SafetyScorePredictor(model_path="test_models/test_safety_model.pkl")
+        classifier = IncidentRiskClassifier(model_path="test_models/test_risk_model.pkl")
+        with mock.patch('ml_models.safety_model', predictor), mock.patch('ml_models.risk_classifier', classifier), \
+                mock.patch.object(prediction_table, '_table', None):
+            table = prediction_table.get_prediction_table()
+            self.assertIs(prediction_table.get_prediction_table(), table)
+            classifier._model_swapped()
+            rebuilt = prediction_table.get_prediction_table()
+            self.assertIsNot(rebuilt, table)
+            self.assertEqual(rebuilt.stamp, (predictor.model_version, classifier.model_version))
+
+
+class TestPredictionCache(unittest.TestCase):
+    def test_lru_eviction_and_ttl(self):
+        """Test that the cache evicts the least recently used entry and expires old ones"""
+        cache = PredictionCache(max_size=2, ttl_seconds=60)
+        keys = [PredictionCache.key({'weather': weather}, 1) for weather in ['Clear', 'Rainy', 'Foggy']]
+        cache.put(keys[0], 1.0)
+        cache.put(keys[1], 2.0)
+        self.assertEqual(cache.get(keys[0]), 1.0)
+        cache.put(keys[2], 3.0)
+        self.assertIsNone(cache.get(keys[1]))
+        self.assertEqual(cache.get(keys[2]), 3.0)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+        with mock.patch('ml_models.time.monotonic', return_value=time.monotonic() + 61):
+            self.assertIsNone(cache.get(keys[0]))
+        self.assertEqual(cache.stats()['size'], 1)
+        self.assertIsNone(PredictionCache.key({'origin': ['not', 'hashable']}, 1))
+
+    def test_predictions_are_cached_per_model_version(self):
+        """Test hits for repeated features in any key order, and invalidation when the model is swapped"""
+        model_dir = tempfile.mkdtemp()
+        try:
+            predictor = SafetyScorePredictor(model_path=os.path.join(model_dir, "safety.pkl"))
+            classifier = IncidentRiskClassifier(model_path=os.path.join(model_dir, "risk.pkl"))
+            features = {'time_of_day': 'Morning Rush (7-9 AM)', 'weather': 'Rainy', 'traffic_density': np.int64(6)}
+            reordered = {'traffic_density': 6, 'weather': 'Rainy', 'time_of_day': 'Morning Rush (7-9 AM)'}
+
+            fallback_score = predictor.predict(features)
+            self.assertEqual(predictor.predict(reordered), fallback_score)
+            self.assertEqual((predictor.cache.hits, predictor.cache.misses), (1, 1))
+            risk = classifier.predict_risk(features)
+            risk['class_probabilities']['high'] = -1.0
+            self.assertEqual(classifier.predict_risk(reordered)['class_probabilities'],
+                             classifier._fallback_risk_prediction(features)['class_probabilities'])
+            self.assertEqual(classifier.cache.stats()['hits'], 1)
+
+            X, scores, risks = synthetic_training_frame()
+            predictor.train(X, scores)
+            classifier.train(X, risks)
+            self.assertEqual(predictor.cache.stats()['size'], 0)
+            self.assertEqual(predictor.predict(features), predictor.predict_batch([features])[0])
+            self.assertEqual(predictor.cache.misses, 2)
+
+            # Reloading swaps the model again
+            version = predictor.model_version
+            predictor.load_model()
+            self.assertEqual(predictor.model_version, version + 1)
+            self.assertEqual(predictor.cache.stats()['size'], 0)
+        finally:
+            shutil.rmtree(model_dir, ignore_errors=True)
+
+
 if __name__ == '__main__':
     unittest.main()
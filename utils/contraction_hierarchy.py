@@ -0,0 +1,358 @@
+"""
+Contraction hierarchy for San Jose Safe Commute
+Preprocesses a directed graph with fixed arc costs so point-to-point shortest
+paths can be answered with two small upward searches instead of a Dijkstra
+over the whole city. Nodes are contracted one at a time in order of
+importance, adding shortcut arcs wherever a shortest path ran through the
+contracted node; the result is cached as a binary file
+"""
+
+import numpy as np
+import hashlib
+import heapq
+import logging
+import math
+import os
+import sys
+from pathlib import Path
+
+# Add parent directory to import path
+parent_dir = str(Path(__file__).parent.parent)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from utils.crash_store import CACHE_DIR
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Bump when the cached hierarchy layout changes so old files are rebuilt
+HIERARCHY_FORMAT_VERSION = 1
+
+# Nodes a witness search may settle before giving up and keeping the shortcut
+WITNESS_SETTLE_LIMIT = 50
+
+HIERARCHY_ARRAYS = ['rank', 'up_indptr', 'up_arcs', 'down_indptr', 'down_arcs',
+                    'arc_head', 'arc_tail', 'arc_cost', 'arc_first', 'arc_second', 'arc_original']
+
+def _witness_costs(out_adj, source, skip, limit):
+    """Costs from source avoiding node skip, searching no further than limit"""
+    best = {source: 0.0}
+    heap = [(0.0, source)]
+    settled = 0
+    while heap and settled < WITNESS_SETTLE_LIMIT:
+        cost, node = heapq.heappop(heap)
+        if cost > best[node]:
+            continue
+        if cost > limit:
+            break
+        settled += 1
+        for neighbour, (arc_cost, _) in out_adj[node].items():
+            if neighbour == skip:
+                continue
+            new_cost = cost + arc_cost
+            if new_cost < best.get(neighbour, math.inf):
+                best[neighbour] = new_cost
+                heapq.heappush(heap, (new_cost, neighbour))
+    return best
+
+class ContractionHierarchy:
+    """
+    Shortcut index over a directed graph with fixed arc costs
+
+    Arcs (original and shortcut) live in flat arrays. A shortcut remembers the
+    two arcs it replaces so paths can be unpacked back to original arcs.
+    up_* lists, per node, the arcs leading to higher-ranked nodes; down_*
+    lists the arcs arriving from higher-ranked nodes, for the backward search.
+    """
+    def __init__(self, **arrays):
+        for name in HIERARCHY_ARRAYS:
+            setattr(self, name, arrays[name])
+        self._up = self._adjacency(self.up_indptr, self.up_arcs, self.arc_head)
+        self._down = self._adjacency(self.down_indptr, self.down_arcs, self.arc_tail)
+        self._arc_first = self.arc_first.tolist()
+        self._arc_second = self.arc_second.tolist()
+        self._arc_original = self.arc_original.tolist()
+
+    def _adjacency(self, indptr, arcs, ends):
+        """Per-node lists of (neighbour, cost, arc) for the query searches"""
+        entries = list(zip(ends[arcs].tolist(), self.arc_cost[arcs].tolist(), arcs.tolist()))
+        bounds = indptr.tolist()
+        return [entries[bounds[i]:bounds[i + 1]] for i in range(len(bounds) - 1)]
+
+    @property
+    def n_nodes(self):
+        return len(self.rank)
+
+    @property
+    def n_shortcuts(self):
+        return int((self.arc_original < 0).sum())
+
+    @classmethod
+    def build(cls, indptr, indices, costs):
+        """
+        Contract a CSR graph
+
+        Args:
+            indptr: CSR row pointers (arcs of node i are indptr[i]:indptr[i + 1])
+            indices: Head node of each arc
+            costs: Non-negative cost of each arc
+
+        Returns:
+            ContractionHierarchy instance
+        """
+        n_nodes = len(indptr) - 1
+        tails = np.repeat(np.arange(n_nodes), np.diff(indptr)).tolist()
+        heads = np.asarray(indices).tolist()
+        costs = np.asarray(costs, dtype=np.float64).tolist()
+
+        arc_tail, arc_head, arc_cost, arc_first, arc_second, arc_original = [], [], [], [], [], []
+
+        def add_arc(tail, head, cost, first=-1, second=-1, original=-1):
+            arc_tail.append(tail)
+            arc_head.append(head)
+            arc_cost.append(cost)
+            arc_first.append(first)
+            arc_second.append(second)
+            arc_original.append(original)
+            return len(arc_cost) - 1
+
+        # Remaining graph as neighbour -> (cost, arc) maps, keeping the cheapest of parallel arcs
+        out_adj = [dict() for _ in range(n_nodes)]
+        in_adj = [dict() for _ in range(n_nodes)]
+        for original, (tail, head, cost) in enumerate(zip(tails, heads, costs)):
+            if tail == head or cost >= out_adj[tail].get(head, (math.inf,))[0]:
+                continue
+            arc = add_arc(tail, head, cost, original=original)
+            out_adj[tail][head] = (cost, arc)
+            in_adj[head][tail] = (cost, arc)
+
+        def shortcuts_for(node):
+            """Shortcuts needed to contract node: (tail, head, cost, first arc, second arc)"""
+            needed = []
+            outgoing = out_adj[node]
+            for tail, (in_cost, in_arc) in in_adj[node].items():
+                limit = in_cost + max((cost for head, (cost, _) in outgoing.items() if head != tail), default=-1.0)
+                if limit < 0:
+                    continue
+                witness = _witness_costs(out_adj, tail, node, limit)
+                for head, (out_cost, out_arc) in outgoing.items():
+                    if head == tail:
+                        continue
+                    cost = in_cost + out_cost
+                    if witness.get(head, math.inf) > cost:
+                        needed.append((tail, head, cost, in_arc, out_arc))
+            return needed
+
+        contracted_neighbours = [0] * n_nodes
+
+        def priority(node):
+            """Edge difference plus contracted neighbours: cheap nodes with few shortcuts go first"""
+            removed = len(in_adj[node]) + len(out_adj[node])
+            return len(shortcuts_for(node)) - removed + contracted_neighbours[node]
+
+        heap = [(priority(node), node) for node in range(n_nodes)]
+        heapq.heapify(heap)
+        rank = [0] * n_nodes
+        up = [[] for _ in range(n_nodes)]
+        down = [[] for _ in range(n_nodes)]
+        next_rank = 0
+        while heap:
+            _, node = heapq.heappop(heap)
+            # Lazy update: re-queue if the node got more expensive since it was scored
+            current = priority(node)
+            if heap and current > heap[0][0]:
+                heapq.heappush(heap, (current, node))
+                continue
+
+            for tail, head, cost, first, second in shortcuts_for(node):
+                if cost < out_adj[tail].get(head, (math.inf,))[0]:
+                    arc = add_arc(tail, head, cost, first, second)
+                    out_adj[tail][head] = (cost, arc)
+                    in_adj[head][tail] = (cost, arc)
+
+            rank[node] = next_rank
+            next_rank += 1
+            up[node] = [arc for _, arc in out_adj[node].values()]
+            down[node] = [arc for _, arc in in_adj[node].values()]
+            for head in out_adj[node]:
+                del in_adj[head][node]
+                contracted_neighbours[head] += 1
+            for tail in in_adj[node]:
+                del out_adj[tail][node]
+                contracted_neighbours[tail] += 1
+            out_adj[node].clear()
+            in_adj[node].clear()
+
+        def csr(lists):
+            indptr = np.zeros(n_nodes + 1, dtype=np.int64)
+            np.cumsum([len(arcs) for arcs in lists], out=indptr[1:])
+            flat = np.fromiter((arc for arcs in lists for arc in arcs), dtype=np.int64, count=int(indptr[-1]))
+            return indptr, flat
+
+        up_indptr, up_arcs = csr(up)
+        down_indptr, down_arcs = csr(down)
+        return cls(
+            rank=np.asarray(rank, dtype=np.int64),
+            up_indptr=up_indptr, up_arcs=up_arcs,
+            down_indptr=down_indptr, down_arcs=down_arcs,
+            arc_head=np.asarray(arc_head, dtype=np.int64),
+            arc_tail=np.asarray(arc_tail, dtype=np.int64),
+            arc_cost=np.asarray(arc_cost, dtype=np.float64),
+            arc_first=np.asarray(arc_first, dtype=np.int64),
+            arc_second=np.asarray(arc_second, dtype=np.int64),
+            arc_original=np.asarray(arc_original, dtype=np.int64)
+        )
+
+    def save(self, path):
+        """
+        Write the hierarchy arrays to an .npz file (atomically)
+
+        Args:
+            path: Destination file path
+        """
+        path = Path(path)
+        tmp_path = path.with_name(path.name + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, version=np.array(HIERARCHY_FORMAT_VERSION), **{name: getattr(self, name) for name in HIERARCHY_ARRAYS})
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Read a hierarchy written by save
+
+        Args:
+            path: Hierarchy file path
+
+        Returns:
+            ContractionHierarchy instance, or None if the file is from another format version
+        """
+        with np.load(path) as data:
+            if int(data['version']) != HIERARCHY_FORMAT_VERSION:
+                return None
+            return cls(**{name: data[name] for name in HIERARCHY_ARRAYS})
+
+    def query(self, source, target):
+        """
+        Shortest path between two nodes
+
+        Runs Dijkstra upward from the source and (over reversed arcs) upward
+        from the target, alternating, until neither queue can improve the best
+        meeting point.
+
+        Args:
+            source: Start node index
+            target: End node index
+
+        Returns:
+            Tuple of (cost, list of original arc indices), or (None, None) if unreachable
+        """
+        if source == target:
+            return 0.0, []
+        searches = (({source: 0.0}, {source: -1}, [(0.0, source)], self._up),
+                    ({target: 0.0}, {target: -1}, [(0.0, target)], self._down))
+        best, meeting = math.inf, -1
+        while True:
+            # Step whichever search has the cheaper frontier
+            forward, backward = searches
+            heaps = [forward[2][0][0] if forward[2] else math.inf, backward[2][0][0] if backward[2] else math.inf]
+            side = 0 if heaps[0] <= heaps[1] else 1
+            if heaps[side] >= best:
+                break
+            costs, via, heap, adjacency = searches[side]
+            other = searches[1 - side][0]
+            cost, node = heapq.heappop(heap)
+            if cost > costs[node]:
+                continue
+            if node in other and cost + other[node] < best:
+                best, meeting = cost + other[node], node
+            for neighbour, arc_cost, arc in adjacency[node]:
+                new_cost = cost + arc_cost
+                if new_cost < costs.get(neighbour, math.inf):
+                    costs[neighbour] = new_cost
+                    via[neighbour] = arc
+                    heapq.heappush(heap, (new_cost, neighbour))
+        if meeting < 0:
+            return None, None
+
+        # Arcs from source up to the meeting node, then from the meeting node down to target
+        arcs = []
+        node, via = meeting, searches[0][1]
+        while via[node] >= 0:
+            arcs.append(via[node])
+            node = int(self.arc_tail[via[node]])
+        arcs.reverse()
+        node, via = meeting, searches[1][1]
+        while via[node] >= 0:
+            arcs.append(via[node])
+            node = int(self.arc_head[via[node]])
+        return best, self.unpack(arcs)
+
+    def unpack(self, arcs):
+        """
+        Expand shortcut arcs into the original arcs they stand for
+
+        Args:
+            arcs: Hierarchy arc indices along a path
+
+        Returns:
+            List of original arc indices
+        """
+        first, second, original = self._arc_first, self._arc_second, self._arc_original
+        stack = list(reversed(arcs))
+        expanded = []
+        while stack:
+            arc = stack.pop()
+            if original[arc] >= 0:
+                expanded.append(original[arc])
+            else:
+                stack.append(second[arc])
+                stack.append(first[arc])
+        return expanded
+
+def _hierarchy_key(indptr, indices, costs):
+    """Content hash of the graph and arc costs a hierarchy is built from"""
+    digest = hashlib.sha256(str(HIERARCHY_FORMAT_VERSION).encode())
+    for values in (indptr, indices, costs):
+        digest.update(np.ascontiguousarray(values).tobytes())
+    return digest.hexdigest()[:32]
+
+def load_contraction_hierarchy(indptr, indices, costs, name, cache_dir=None):
+    """
+    Load the cached hierarchy for a graph and arc costs, building and saving it on a miss
+
+    Args:
+        indptr: CSR row pointers
+        indices: Head node of each arc
+        costs: Cost of each arc
+        name: Cache file prefix; older files with the same prefix are removed
+        cache_dir: Optional cache directory (defaults to the crash store's CACHE_DIR)
+
+    Returns:
+        ContractionHierarchy instance
+    """
+    cache_dir = Path(cache_dir or CACHE_DIR)
+    costs = np.asarray(costs, dtype=np.float64)
+    path = cache_dir / f"{name}-{_hierarchy_key(indptr, indices, costs)}.npz"
+
+    if path.exists():
+        try:
+            hierarchy = ContractionHierarchy.load(path)
+            if hierarchy is not None:
+                return hierarchy
+        except Exception as e:
+            logger.error(f"Error reading contraction hierarchy: {str(e)}")
+
+    hierarchy = ContractionHierarchy.build(indptr, indices, costs)
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        hierarchy.save(path)
+        for stale in cache_dir.glob(f"{name}-*.npz"):
+            if stale != path:
+                stale.unlink(missing_ok=True)
+        logger.info(f"Contraction hierarchy cached to {path}")
+    except OSError as e:
+        logger.error(f"Error writing contraction hierarchy: {str(e)}")
+    return hierarchy
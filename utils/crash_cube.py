@@ -0,0 +1,209 @@
+"""
+Pre-aggregated crash count cube for San Jose Safe Commute
+Counts crashes over year x month x weekday x hour x weather x severity x
+lighting x collision type (plus factor and road surface/condition) so charts
+and insights can query marginals and filtered slices without scanning rows
+"""
+
+import pandas as pd
+import numpy as np
+import logging
+import threading
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Upper bound on memoized marginal queries
+MAX_CACHED_QUERIES = 1024
+
+WEEKDAY_ORDER = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+# Cube dimension -> function extracting its values from the processed crash frame
+CUBE_DIMENSIONS = {
+    'year': lambda df: df['datetime'].dt.year,
+    'month': lambda df: df['datetime'].dt.month,
+    'weekday': lambda df: df['day_of_week'],
+    'hour': lambda df: df['datetime'].dt.hour,
+    'weather': lambda df: df['weather'],
+    'severity': lambda df: df['severity'],
+    'lighting': lambda df: df['Lighting'],
+    'collision_type': lambda df: df['CollisionType'],
+    'factor': lambda df: df['PrimaryCollisionFactor'],
+    'surface': lambda df: df['RoadwaySurface'],
+    'road_condition': lambda df: df['RoadwayCondition']
+}
+
+def _dimension_labels(dimension, values):
+    """Ordered labels for one dimension (calendar order for weekdays, sorted otherwise)"""
+    if dimension == 'weekday':
+        return list(WEEKDAY_ORDER)
+    observed = pd.unique(values.dropna())
+    labels = sorted(observed.tolist() if hasattr(observed, 'tolist') else list(observed))
+    # Integer-valued dimensions read back as floats when the source had NaT
+    if labels and all(isinstance(label, float) and label.is_integer() for label in labels):
+        labels = [int(label) for label in labels]
+    return labels
+
+def _filter_key(value):
+    """Hashable form of a filter value (lists and tuples by element, sets regardless of order)"""
+    if isinstance(value, (set, frozenset)):
+        return frozenset(value)
+    if isinstance(value, (list, tuple)):
+        return tuple(value)
+    return value
+
+class CrashCube:
+    """
+    Sparse count cube over the crash dimensions
+
+    Only occupied cells are stored: an (n_dimensions, n_cells) array of label
+    codes (one contiguous row per dimension) and a matching array of counts.
+    Each dimension has one extra code for missing values, which queries
+    never report.
+    """
+    def __init__(self, dimensions, labels, coords, counts):
+        self.dimensions = list(dimensions)
+        self.labels = {dim: list(labels[dim]) for dim in self.dimensions}
+        self.coords = coords
+        self.counts = counts
+        self._axis = {dim: i for i, dim in enumerate(self.dimensions)}
+        self._codes = {dim: {label: code for code, label in enumerate(self.labels[dim])} for dim in self.dimensions}
+        self._marginal_cache = {}
+        self._cache_lock = threading.Lock()
+
+    @classmethod
+    def from_frame(cls, df, dimensions=None):
+        """
+        Build the cube from a processed crash dataframe
+
+        Args:
+            df: Dataframe returned by process_crash_data
+            dimensions: Optional subset of CUBE_DIMENSIONS to aggregate over
+
+        Returns:
+            CrashCube instance
+        """
+        dimensions = list(dimensions or CUBE_DIMENSIONS)
+        labels = {}
+        code_columns = []
+        for dim in dimensions:
+            values = pd.Series(CUBE_DIMENSIONS[dim](df)).astype(object)
+            labels[dim] = _dimension_labels(dim, values)
+            codes = pd.Categorical(values, categories=labels[dim]).codes.astype(np.int64)
+            # Missing values go to the extra trailing code
+            codes[codes < 0] = len(labels[dim])
+            code_columns.append(codes)
+
+        shape = tuple(len(labels[dim]) + 1 for dim in dimensions)
+        keys = np.ravel_multi_index(code_columns, shape)
+        cell_keys, counts = np.unique(keys, return_counts=True)
+        coords = np.stack(np.unravel_index(cell_keys, shape)).astype(np.intp)
+
+        logger.info(f"Built crash cube with {len(counts)} occupied cells over {len(dimensions)} dimensions")
+        return cls(dimensions, labels, coords, counts.astype(np.int64))
+
+    def _filter_mask(self, filters):
+        """Boolean mask over cells matching {dimension: value or list of values}"""
+        mask = np.ones(len(self.counts), dtype=bool)
+        for dim, wanted in filters.items():
+            if wanted is None:
+                continue
+            if not isinstance(wanted, (list, tuple, set)):
+                wanted = [wanted]
+            allowed = np.zeros(len(self.labels[dim]) + 1, dtype=bool)
+            allowed[[self._codes[dim][value] for value in wanted if value in self._codes[dim]]] = True
+            mask &= allowed[self.coords[self._axis[dim]]]
+        return mask
+
+    def _bincount(self, dimension, filters):
+        """Counts per label code for one dimension under the given filters"""
+        codes = self.coords[self._axis[dimension]]
+        size = len(self.labels[dimension]) + 1
+        if not filters:
+            return np.bincount(codes, weights=self.counts, minlength=size)[:-1].astype(np.int64)
+        mask = self._filter_mask(filters)
+        return np.bincount(codes[mask], weights=self.counts[mask], minlength=size)[:-1].astype(np.int64)
+
+    def marginal(self, dimension, sort=False, **filters):
+        """
+        Count crashes per label of one dimension, optionally filtered
+
+        Example: cube.marginal('hour', weather='rain', weekday=['Saturday', 'Sunday'])
+
+        Args:
+            dimension: Dimension to break down
+            sort: Order by count descending (like value_counts) instead of label order
+            **filters: Dimension name -> label or list of labels to keep
+
+        Returns:
+            Series of counts indexed by label (zero-count labels omitted)
+        """
+        filters = {dim: value for dim, value in filters.items() if value is not None}
+        cache_key = (dimension, sort, frozenset((dim, _filter_key(value)) for dim, value in filters.items()))
+        try:
+            with self._cache_lock:
+                cached = self._marginal_cache.get(cache_key)
+        except TypeError:
+            # Unhashable filter values are answered without the memo
+            cache_key, cached = None, None
+        if cached is not None:
+            return cached.copy()
+
+        counts = self._bincount(dimension, filters)
+        result = pd.Series(counts, index=pd.Index(self.labels[dimension], name=dimension), name='count')
+        result = result[result > 0]
+        if sort:
+            result = result.sort_values(ascending=False, kind='stable')
+
+        if cache_key is not None:
+            with self._cache_lock:
+                if len(self._marginal_cache) >= MAX_CACHED_QUERIES:
+                    self._marginal_cache.clear()
+                self._marginal_cache[cache_key] = result
+        return result.copy()
+
+    def count(self, **filters):
+        """
+        Count crashes matching the filters
+
+        Args:
+            **filters: Dimension name -> label or list of labels to keep
+
+        Returns:
+            Number of crashes (int)
+        """
+        filters = {dim: value for dim, value in filters.items() if value is not None}
+        if not filters:
+            return int(self.counts.sum())
+        return int(self.counts[self._filter_mask(filters)].sum())
+
+    def crosstab(self, row_dimension, column_dimension, **filters):
+        """
+        Two-way count table between dimensions, optionally filtered
+
+        Args:
+            row_dimension: Dimension for the rows
+            column_dimension: Dimension for the columns
+            **filters: Dimension name -> label or list of labels to keep
+
+        Returns:
+            DataFrame of counts (rows and columns in label order)
+        """
+        filters = {dim: value for dim, value in filters.items() if value is not None}
+        mask = self._filter_mask(filters)
+        rows = self.coords[self._axis[row_dimension]][mask]
+        columns = self.coords[self._axis[column_dimension]][mask]
+        n_rows = len(self.labels[row_dimension]) + 1
+        n_columns = len(self.labels[column_dimension]) + 1
+
+        flat = np.bincount(rows * n_columns + columns, weights=self.counts[mask],
+                           minlength=n_rows * n_columns)
+        table = flat.reshape(n_rows, n_columns)[:-1, :-1].astype(np.int64)
+        return pd.DataFrame(table,
+                            index=pd.Index(self.labels[row_dimension], name=row_dimension),
+                            columns=pd.Index(self.labels[column_dimension], name=column_dimension))
+
+    def nbytes(self):
+        """Memory used by the cube arrays in bytes"""
+        return int(self.coords.nbytes + self.counts.nbytes)
@@ -0,0 +1,297 @@
+"""
+Process-wide shared crash dataset for San Jose Safe Commute
+Loads the processed crash data once per process and hands every Streamlit
+session a read-only view instead of a private copy
+"""
+
+import copy
+import logging
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+# Add parent directory to import path
+parent_dir = str(Path(__file__).parent.parent)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from utils.crash_cube import CrashCube
+from utils.crash_heatmap import load_heatmap_pyramid
+from utils.crash_risk_surface import CrashRiskSurfaces
+from utils.offline_geocoder import OfflineGeocoder
+from utils.road_graph import load_road_graph
+from utils.safe_router import SafeRouter, HIERARCHY_PRIORITIES
+from utils.crash_spatial_index import CrashSpatialIndex
+from utils.crash_store import load_crash_data, append_crash_records
+from utils.custom_data_processor import memory_footprint
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Bundled crash data file
+CRASH_DATA_PATH = Path(__file__).parent / "crashdata2011-2021.csv"
+
+class SharedCrashDataset:
+    """
+    Read-only crash dataset shared by all sessions in the process
+
+    The first caller loads the data (through the columnar cache) while holding
+    a lock; everyone after that gets a shallow view of the same columns.
+    """
+    def __init__(self, source_path=None, cache_dir=None, compact=True):
+        self.source_path = Path(source_path or CRASH_DATA_PATH)
+        self.cache_dir = cache_dir
+        self.compact = compact
+        self._lock = threading.Lock()
+        self._frame = None
+        self._stats = None
+        self._cube = None
+        self._spatial_index = None
+        self._heatmap = None
+        self._risk_surfaces = None
+        self._geocoder = None
+        self._road_graph = None
+        self._router = None
+        self._metrics = {
+            'loaded': False,
+            'load_seconds': None,
+            'memory_mb': None,
+            'rows': 0,
+            'loaded_at': None,
+            'load_count': 0,
+            'requests': 0,
+            'cube_cells': None,
+            'cube_build_seconds': None,
+            'spatial_index_points': None,
+            'spatial_index_build_seconds': None,
+            'heatmap_cells': None,
+            'heatmap_load_seconds': None,
+            'risk_surfaces_build_seconds': None,
+            'geocoder_build_seconds': None,
+            'road_graph_edges': None,
+            'road_graph_load_seconds': None,
+            'router_build_seconds': None
+        }
+
+    def _ensure_loaded(self):
+        """Load the dataset on first use (double-checked under the lock)"""
+        if self._frame is not None:
+            return
+        with self._lock:
+            if self._frame is not None:
+                return
+            start = time.perf_counter()
+            frame, stats = load_crash_data(self.source_path, self.cache_dir, compact=self.compact)
+            elapsed = time.perf_counter() - start
+
+            self._frame = frame
+            self._stats = stats
+            self._metrics.update({
+                'loaded': True,
+                'load_seconds': round(elapsed, 3),
+                'memory_mb': memory_footprint(frame)['total_mb'],
+                'rows': len(frame),
+                'loaded_at': datetime.now().isoformat(),
+                'load_count': self._metrics['load_count'] + 1
+            })
+            logger.info(f"Shared crash dataset loaded in {elapsed:.2f}s ({self._metrics['memory_mb']} MB)")
+
+    def get_frame(self):
+        """
+        Get a read-only view of the processed crash dataframe
+
+        The view shares column data with the process-wide frame. pandas 3 always
+        uses Copy-on-Write (requirements.txt pins it), so adding or changing
+        columns on it only affects the caller.
+
+        Returns:
+            Processed crash dataframe view
+        """
+        self._ensure_loaded()
+        with self._lock:
+            self._metrics['requests'] += 1
+        return self._frame.copy(deep=False)
+
+    def get_stats(self):
+        """
+        Get the stats dictionary for the shared dataset
+
+        Returns:
+            Private copy of the stats dictionary
+        """
+        self._ensure_loaded()
+        return copy.deepcopy(self._stats)
+
+    def get(self):
+        """
+        Get both the dataframe view and the stats dictionary
+
+        Returns:
+            Tuple of (processed crash dataframe view, stats dict)
+        """
+        return self.get_frame(), self.get_stats()
+
+    def get_cube(self):
+        """
+        Get the pre-aggregated count cube for the shared dataset (built on first use)
+
+        Returns:
+            CrashCube instance
+        """
+        self._ensure_loaded()
+        if self._cube is None:
+            with self._lock:
+                if self._cube is None:
+                    start = time.perf_counter()
+                    self._cube = CrashCube.from_frame(self._frame)
+                    self._metrics['cube_cells'] = len(self._cube.counts)
+                    self._metrics['cube_build_seconds'] = round(time.perf_counter() - start, 3)
+        return self._cube
+
+    def get_spatial_index(self):
+        """
+        Get the spatial index over crash locations (built on first use)
+
+        Query results are row positions into get_frame().
+
+        Returns:
+            CrashSpatialIndex instance
+        """
+        self._ensure_loaded()
+        if self._spatial_index is None:
+            with self._lock:
+                if self._spatial_index is None:
+                    start = time.perf_counter()
+                    self._spatial_index = CrashSpatialIndex.from_frame(self._frame)
+                    self._metrics['spatial_index_points'] = len(self._spatial_index)
+                    self._metrics['spatial_index_build_seconds'] = round(time.perf_counter() - start, 3)
+        return self._spatial_index
+
+    def get_heatmap_pyramid(self):
+        """
+        Get the multi-zoom heatmap pyramid over crash locations (loaded or built on first use)
+
+        Returns:
+            HeatmapPyramid instance
+        """
+        self._ensure_loaded()
+        if self._heatmap is None:
+            with self._lock:
+                if self._heatmap is None:
+                    start = time.perf_counter()
+                    self._heatmap = load_heatmap_pyramid(self._frame, self.cache_dir)
+                    self._metrics['heatmap_cells'] = len(self._heatmap)
+                    self._metrics['heatmap_load_seconds'] = round(time.perf_counter() - start, 3)
+        return self._heatmap
+
+    def get_risk_surfaces(self):
+        """
+        Get the kernel density risk surface builder for the shared dataset (built on first use)
+
+        Filtered surfaces are cached inside the returned object.
+
+        Returns:
+            CrashRiskSurfaces instance
+        """
+        self._ensure_loaded()
+        if self._risk_surfaces is None:
+            with self._lock:
+                if self._risk_surfaces is None:
+                    start = time.perf_counter()
+                    self._risk_surfaces = CrashRiskSurfaces(self._frame)
+                    self._metrics['risk_surfaces_build_seconds'] = round(time.perf_counter() - start, 3)
+        return self._risk_surfaces
+
+    def get_geocoder(self):
+        """
+        Get the offline street and intersection geocoder (built on first use)
+
+        Returns:
+            OfflineGeocoder instance
+        """
+        self._ensure_loaded()
+        if self._geocoder is None:
+            with self._lock:
+                if self._geocoder is None:
+                    start = time.perf_counter()
+                    self._geocoder = OfflineGeocoder.from_frame(self._frame)
+                    self._metrics['geocoder_build_seconds'] = round(time.perf_counter() - start, 3)
+        return self._geocoder
+
+    def get_road_graph(self):
+        """
+        Get the intersection graph derived from the crash data (loaded or built on first use)
+
+        Returns:
+            RoadGraph instance
+        """
+        self._ensure_loaded()
+        if self._road_graph is None:
+            with self._lock:
+                if self._road_graph is None:
+                    start = time.perf_counter()
+                    self._road_graph = load_road_graph(self._frame, self.cache_dir)
+                    self._metrics['road_graph_edges'] = self._road_graph.n_edges
+                    self._metrics['road_graph_load_seconds'] = round(time.perf_counter() - start, 3)
+        return self._road_graph
+
+    def get_router(self):
+        """
+        Get the safety-weighted router over the intersection graph (built on first use)
+
+        Returns:
+            SafeRouter instance
+        """
+        graph = self.get_road_graph()
+        if self._router is None:
+            with self._lock:
+                if self._router is None:
+                    start = time.perf_counter()
+                    self._router = SafeRouter(graph, HIERARCHY_PRIORITIES, self.cache_dir)
+                    self._metrics['router_build_seconds'] = round(time.perf_counter() - start, 3)
+        return self._router
+
+    def get_metrics(self):
+        """
+        Get load time, memory and usage metrics for the shared dataset
+
+        Returns:
+            Dict of metrics
+        """
+        with self._lock:
+            return dict(self._metrics)
+
+    def append_records(self, new_records):
+        """
+        Append new crash records to the underlying store and pick them up on the next request
+
+        Args:
+            new_records: Path to a crash CSV or a raw crash dataframe
+
+        Returns:
+            Number of records appended
+        """
+        appended = append_crash_records(new_records, self.source_path, self.cache_dir, compact=self.compact)
+        if appended:
+            self.reload()
+        return appended
+
+    def reload(self):
+        """Drop the loaded data so the next request reloads it (e.g. after the source file changes)"""
+        with self._lock:
+            self._frame = None
+            self._stats = None
+            self._cube = None
+            self._spatial_index = None
+            self._heatmap = None
+            self._risk_surfaces = None
+            self._geocoder = None
+            self._road_graph = None
+            self._router = None
+            self._metrics['loaded'] = False
+
+# Process-wide instance shared by all sessions
+crash_dataset = SharedCrashDataset()
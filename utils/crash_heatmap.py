@@ -0,0 +1,355 @@
+"""
+Multi-zoom crash heatmap pyramid for San Jose Safe Commute
+Bins every crash coordinate into a web-map grid at each zoom level once,
+persists the pyramid, and serves only the cells inside the visible bounding
+box to folium, so heat layers stay small even with the whole city in view
+"""
+
+import numpy as np
+import hashlib
+import logging
+import os
+import sys
+from pathlib import Path
+
+# Add parent directory to import path
+parent_dir = str(Path(__file__).parent.parent)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from utils.crash_spatial_index import valid_coordinates, ranges_to_index
+from utils.crash_store import CACHE_DIR
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Bump when the persisted pyramid layout changes so old files are rebuilt
+HEATMAP_FORMAT_VERSION = 1
+
+# Zoom levels kept in the pyramid (whole Bay Area down to single blocks)
+MIN_ZOOM = 10
+MAX_ZOOM = 17
+
+# Each 256px map tile is split into 2**CELL_BITS cells per side (16px cells)
+CELL_BITS = 4
+
+# A view never gets more cells than this; larger views are served from a coarser level
+MAX_HEAT_CELLS = 4000
+
+# Pixel size of web map tiles
+TILE_SIZE = 256
+
+def mercator(lat, lon):
+    """
+    Web Mercator coordinates of points as fractions of the world (0-1)
+
+    Args:
+        lat: Latitude value(s) in degrees
+        lon: Longitude value(s) in degrees
+
+    Returns:
+        Tuple of (x, y) arrays, y growing southwards like map tiles
+    """
+    lat = np.clip(np.asarray(lat, dtype=np.float64), -85.05112878, 85.05112878)
+    lon = np.asarray(lon, dtype=np.float64)
+    x = (lon + 180.0) / 360.0
+    y = (1.0 - np.arcsinh(np.tan(np.radians(lat))) / np.pi) / 2.0
+    return x, y
+
+def inverse_mercator(x, y):
+    """
+    Coordinates of Web Mercator world fractions
+
+    Args:
+        x, y: World fractions as returned by mercator
+
+    Returns:
+        Tuple of (lat, lon) arrays in degrees
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    lat = np.degrees(np.arctan(np.sinh(np.pi * (1.0 - 2.0 * y))))
+    return lat, x * 360.0 - 180.0
+
+def zoom_for_bounds(south, west, north, east, width_px=800, height_px=500):
+    """
+    Deepest zoom level at which a bounding box fits in a map of the given size
+
+    Args:
+        south, west, north, east: Bounding box in degrees
+        width_px, height_px: Map size in pixels
+
+    Returns:
+        Integer zoom level between 0 and MAX_ZOOM
+    """
+    (x0, x1), (y1, y0) = mercator([south, north], [west, east])
+    span_x = max(abs(x1 - x0), 1e-12)
+    span_y = max(abs(y1 - y0), 1e-12)
+    zoom = np.floor(np.log2(min(width_px / (span_x * TILE_SIZE), height_px / (span_y * TILE_SIZE))))
+    return int(np.clip(zoom, 0, MAX_ZOOM))
+
+def viewport_bounds(lat, lon, zoom, width_px=800, height_px=500):
+    """
+    Bounding box shown by a map centered on a point at a zoom level
+
+    Args:
+        lat, lon: Map center in degrees
+        zoom: Map zoom level
+        width_px, height_px: Map size in pixels
+
+    Returns:
+        Tuple of (south, west, north, east) in degrees
+    """
+    x, y = mercator(lat, lon)
+    world_px = TILE_SIZE * 2.0 ** zoom
+    half_x = width_px / 2.0 / world_px
+    half_y = height_px / 2.0 / world_px
+    north, west = inverse_mercator(x - half_x, max(y - half_y, 0.0))
+    south, east = inverse_mercator(x + half_x, min(y + half_y, 1.0))
+    return float(south), float(west), float(north), float(east)
+
+def _cell_keys(cx, cy):
+    """Row-major sort keys for cell columns and rows"""
+    return (np.asarray(cy, dtype=np.int64) << 32) | np.asarray(cx, dtype=np.int64)
+
+class HeatmapPyramid:
+    """
+    Crash counts binned into web-map grid cells at every zoom level
+
+    Each level holds only its occupied cells, sorted by (row, column) key, with
+    the crash count, summed severity and crash centroid of every cell. Cells at
+    one level are exact unions of four cells one level deeper.
+    """
+    def __init__(self, levels, n_points):
+        self.levels = levels
+        self.n_points = n_points
+
+    @classmethod
+    def from_coordinates(cls, lat, lon, weights=None):
+        """
+        Build the pyramid from coordinate arrays
+
+        Rows with missing (0/NaN) coordinates are skipped.
+
+        Args:
+            lat: Latitudes in degrees
+            lon: Longitudes in degrees
+            weights: Optional per-crash weights (e.g. severity); 1 when omitted
+
+        Returns:
+            HeatmapPyramid instance
+        """
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        weights = np.ones(len(lat)) if weights is None else np.asarray(weights, dtype=np.float64)
+        valid = valid_coordinates(lat, lon) & np.isfinite(weights)
+        lat, lon, weights = lat[valid], lon[valid], weights[valid]
+
+        # Bin at the deepest level, then merge 2x2 cells for each coarser level
+        scale = float(1 << (MAX_ZOOM + CELL_BITS))
+        x, y = mercator(lat, lon)
+        cx = np.minimum((x * scale).astype(np.int64), int(scale) - 1)
+        cy = np.minimum((y * scale).astype(np.int64), int(scale) - 1)
+        counts = np.ones(len(lat))
+        sums = (counts, weights, lat, lon)
+
+        levels = {}
+        for zoom in range(MAX_ZOOM, MIN_ZOOM - 1, -1):
+            keys, inverse = np.unique(_cell_keys(cx, cy), return_inverse=True)
+            sums = tuple(np.bincount(inverse, weights=values, minlength=len(keys)) for values in sums)
+            count, weight, lat_sum, lon_sum = sums
+            levels[zoom] = {
+                'keys': keys,
+                'count': count.astype(np.int32),
+                'weight': weight,
+                'lat': lat_sum / count,
+                'lon': lon_sum / count
+            }
+            cx, cy = (keys & 0xFFFFFFFF) >> 1, (keys >> 32) >> 1
+        return cls(levels, int(valid.sum()))
+
+    @classmethod
+    def from_frame(cls, df, weight_column='severity'):
+        """
+        Build the pyramid from a crash dataframe with Latitude/Longitude columns
+
+        Args:
+            df: Crash dataframe
+            weight_column: Column summed as each cell's weight (None to count only)
+
+        Returns:
+            HeatmapPyramid instance
+        """
+        weights = None
+        if weight_column is not None and weight_column in df.columns:
+            weights = df[weight_column].to_numpy(dtype=np.float64, na_value=np.nan)
+        return cls.from_coordinates(df['Latitude'].to_numpy(), df['Longitude'].to_numpy(), weights)
+
+    def __len__(self):
+        return sum(len(level['keys']) for level in self.levels.values())
+
+    def save(self, path):
+        """
+        Write the pyramid to an .npz file (atomically)
+
+        Args:
+            path: Destination file path
+        """
+        path = Path(path)
+        arrays = {'version': np.array(HEATMAP_FORMAT_VERSION), 'n_points': np.array(self.n_points)}
+        for zoom, level in self.levels.items():
+            for name, values in level.items():
+                arrays[f"z{zoom}_{name}"] = values
+        tmp_path = path.with_name(path.name + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Read a pyramid written by save
+
+        Args:
+            path: Pyramid file path
+
+        Returns:
+            HeatmapPyramid instance, or None if the file is from another format version
+        """
+        with np.load(path) as data:
+            if int(data['version']) != HEATMAP_FORMAT_VERSION:
+                return None
+            levels = {}
+            for zoom in range(MIN_ZOOM, MAX_ZOOM + 1):
+                levels[zoom] = {name: data[f"z{zoom}_{name}"] for name in ('keys', 'count', 'weight', 'lat', 'lon')}
+            return cls(levels, int(data['n_points']))
+
+    def visible_positions(self, zoom, south, west, north, east):
+        """
+        Indices of the cells of one level that overlap a bounding box
+
+        Args:
+            zoom: Pyramid level (MIN_ZOOM to MAX_ZOOM)
+            south, west, north, east: Bounding box in degrees
+
+        Returns:
+            Array of indices into the level's cell arrays
+        """
+        keys = self.levels[zoom]['keys']
+        if len(keys) == 0:
+            return np.empty(0, dtype=np.int64)
+
+        scale = float(1 << (zoom + CELL_BITS))
+        (x0, x1), (y0, y1) = mercator([north, south], [west, east])
+        cx0, cx1 = int(np.floor(x0 * scale)), int(np.floor(x1 * scale))
+        # Only rows that hold cells at this level need a lookup
+        cy0 = max(int(np.floor(y0 * scale)), int(keys[0] >> 32))
+        cy1 = min(int(np.floor(y1 * scale)), int(keys[-1] >> 32))
+        if cy1 < cy0 or cx1 < cx0:
+            return np.empty(0, dtype=np.int64)
+
+        rows = np.arange(cy0, cy1 + 1, dtype=np.int64)
+        starts = np.searchsorted(keys, _cell_keys(cx0, rows), side='left')
+        stops = np.searchsorted(keys, _cell_keys(cx1, rows), side='right')
+        return ranges_to_index(starts, stops)
+
+    def visible_cells(self, zoom, south, west, north, east, weighted=True, max_cells=MAX_HEAT_CELLS):
+        """
+        Heat points for the cells visible in a map view
+
+        The level matching the map zoom is used unless the view holds more than
+        max_cells cells, in which case coarser levels are tried. Intensities are
+        scaled by the level's busiest cell so colours stay put while panning.
+
+        Args:
+            zoom: Current map zoom level
+            south, west, north, east: Visible bounding box in degrees
+            weighted: Weight cells by summed severity instead of crash count
+            max_cells: Upper bound on the number of cells returned
+
+        Returns:
+            Tuple of (float array of [lat, lon, intensity] rows, pyramid level used)
+        """
+        level_zoom = int(np.clip(int(zoom), MIN_ZOOM, MAX_ZOOM))
+        positions = self.visible_positions(level_zoom, south, west, north, east)
+        while len(positions) > max_cells and level_zoom > MIN_ZOOM:
+            level_zoom -= 1
+            positions = self.visible_positions(level_zoom, south, west, north, east)
+
+        level = self.levels[level_zoom]
+        values = level['weight'] if weighted else level['count']
+        if len(positions) > max_cells:
+            # Still too many at the coarsest level: keep the heaviest cells
+            positions = positions[np.argsort(-values[positions], kind='stable')[:max_cells]]
+        peak = float(values.max()) if len(values) else 1.0
+        cells = np.column_stack([
+            level['lat'][positions],
+            level['lon'][positions],
+            values[positions] / peak
+        ])
+        return cells, level_zoom
+
+    def heat_data(self, zoom, south, west, north, east, weighted=True, max_cells=MAX_HEAT_CELLS):
+        """
+        Visible cells as a folium HeatMap data list
+
+        Args:
+            Same as visible_cells
+
+        Returns:
+            List of [lat, lon, intensity] lists
+        """
+        cells, _ = self.visible_cells(zoom, south, west, north, east, weighted, max_cells)
+        return np.round(cells, 6).tolist()
+
+def _pyramid_key(lat, lon, weights):
+    """Content hash of the inputs a pyramid is built from"""
+    digest = hashlib.sha256(str(HEATMAP_FORMAT_VERSION).encode())
+    for values in (lat, lon, weights):
+        if values is not None:
+            digest.update(np.ascontiguousarray(values, dtype=np.float64).tobytes())
+    return digest.hexdigest()[:32]
+
+def load_heatmap_pyramid(df, cache_dir=None, weight_column='severity'):
+    """
+    Load the persisted pyramid for a crash dataframe, building and saving it on a miss
+
+    Pyramids are keyed by a hash of the coordinates and weights, so appended
+    crash records produce a new pyramid file.
+
+    Args:
+        df: Crash dataframe with Latitude/Longitude columns
+        cache_dir: Optional cache directory (defaults to the crash store's CACHE_DIR)
+        weight_column: Column summed as each cell's weight
+
+    Returns:
+        HeatmapPyramid instance
+    """
+    cache_dir = Path(cache_dir or CACHE_DIR)
+    lat = df['Latitude'].to_numpy(dtype=np.float64)
+    lon = df['Longitude'].to_numpy(dtype=np.float64)
+    weights = None
+    if weight_column is not None and weight_column in df.columns:
+        weights = df[weight_column].to_numpy(dtype=np.float64, na_value=np.nan)
+    path = cache_dir / f"heatmap-{_pyramid_key(lat, lon, weights)}.npz"
+
+    if path.exists():
+        try:
+            pyramid = HeatmapPyramid.load(path)
+            if pyramid is not None:
+                return pyramid
+        except Exception as e:
+            logger.error(f"Error reading heatmap pyramid: {str(e)}")
+
+    pyramid = HeatmapPyramid.from_coordinates(lat, lon, weights)
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        pyramid.save(path)
+        for stale in cache_dir.glob("heatmap-*.npz"):
+            if stale != path:
+                stale.unlink(missing_ok=True)
+        logger.info(f"Heatmap pyramid ({len(pyramid)} cells) cached to {path}")
+    except OSError as e:
+        logger.error(f"Error writing heatmap pyramid: {str(e)}")
+    return pyramid
@@ -0,0 +1,331 @@
+"""
+Kernel density crash-risk surface for San Jose Safe Commute
+Rasterizes crash coordinates onto a fixed San Jose grid and smooths them with
+a Gaussian kernel through an FFT convolution, giving a continuous risk
+surface that routes and map overlays can sample at any point
+"""
+
+import numpy as np
+import logging
+import sys
+import threading
+from pathlib import Path
+
+# Add parent directory to import path
+parent_dir = str(Path(__file__).parent.parent)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from utils.crash_spatial_index import project, valid_coordinates
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Fixed San Jose grid extent (south, west, north, east), covering every located crash
+SURFACE_BOUNDS = (37.15, -122.05, 37.47, -121.65)
+
+# Grid cell edge length in meters
+SURFACE_CELL_SIZE_M = 50.0
+
+# Gaussian kernel standard deviation in meters (about one city block)
+KDE_BANDWIDTH_M = 150.0
+
+# Kernel is cut off this many standard deviations from its center
+KERNEL_TRUNCATE = 4.0
+
+# Upper bound on cached filtered surfaces
+MAX_CACHED_SURFACES = 64
+
+# Crashes counted for each travel mode (transit riders share the road with drivers)
+MODE_FILTERS = {
+    'walking': lambda df: (df['VehicleInvolvedWith'] == 'Pedestrian') | (df['CollisionType'] == 'Vehicle/Pedestrian'),
+    'bicycling': lambda df: (df['VehicleInvolvedWith'] == 'Bike') | (df['CollisionType'] == 'Vehicle/Bike'),
+    'driving': lambda df: ~((df['VehicleInvolvedWith'].isin(['Pedestrian', 'Bike']))
+                            | (df['CollisionType'].isin(['Vehicle/Pedestrian', 'Vehicle/Bike'])))
+}
+
+# UI and API mode names -> MODE_FILTERS key
+MODE_ALIASES = {
+    'car': 'driving',
+    'driving': 'driving',
+    'public transit': 'driving',
+    'transit': 'driving',
+    'walking': 'walking',
+    'cycling': 'bicycling',
+    'bicycling': 'bicycling'
+}
+
+# UI weather names -> processed 'weather' values
+WEATHER_ALIASES = {
+    'clear': 'clear',
+    'cloudy': 'cloudy',
+    'rain': 'rain',
+    'rainy': 'rain',
+    'fog': 'fog',
+    'foggy': 'fog',
+    'snow': 'snow',
+    'other': 'other'
+}
+
+def _fft_size(n):
+    """Smallest size >= n with only 2, 3 and 5 as prime factors (fast FFT lengths)"""
+    while True:
+        m = n
+        for p in (2, 3, 5):
+            while m % p == 0:
+                m //= p
+        if m == 1:
+            return n
+        n += 1
+
+def _hours_key(hour):
+    """Normalize an hour or collection of hours to a sorted tuple (None for all hours)"""
+    if hour is None:
+        return None
+    hours = [hour] if np.isscalar(hour) else list(hour)
+    return tuple(sorted({int(h) % 24 for h in hours}))
+
+def surface_key(mode=None, hour=None, weather=None):
+    """
+    Cache key for a filtered surface
+
+    Args:
+        mode: Travel mode (UI or API name), None for all crashes
+        hour: Hour of day or collection of hours, None for all hours
+        weather: Weather condition (UI or processed name), None for all weather
+
+    Returns:
+        Tuple of (mode, hours, weather) with normalized values
+    """
+    if mode is not None:
+        mode = MODE_ALIASES.get(str(mode).lower())
+        if mode is None:
+            raise ValueError(f"Unknown travel mode. Must be one of: {', '.join(MODE_ALIASES)}")
+    if weather is not None:
+        weather = WEATHER_ALIASES.get(str(weather).lower(), str(weather).lower())
+    return (mode, _hours_key(hour), weather)
+
+class RiskSurface:
+    """
+    Smoothed crash density on the fixed San Jose grid
+
+    density[row, col] is in crashes per km² at the center of the cell, rows
+    running south to north and columns west to east in projected meters.
+    """
+    def __init__(self, density, origin_x, origin_y, cell_size, n_crashes, key=None):
+        self.density = density
+        self.origin_x = origin_x
+        self.origin_y = origin_y
+        self.cell_size = cell_size
+        self.n_crashes = n_crashes
+        self.key = key
+
+    @property
+    def shape(self):
+        return self.density.shape
+
+    def sample(self, lat, lon):
+        """
+        Density at arbitrary points by bilinear interpolation between cell centers
+
+        Args:
+            lat: Latitude value(s) in degrees
+            lon: Longitude value(s) in degrees
+
+        Returns:
+            Array of densities in crashes per km² (0 outside the grid)
+        """
+        x, y = project(lat, lon)
+        fx = (np.atleast_1d(x) - self.origin_x) / self.cell_size - 0.5
+        fy = (np.atleast_1d(y) - self.origin_y) / self.cell_size - 0.5
+        ny, nx = self.density.shape
+        inside = np.isfinite(fx) & np.isfinite(fy) & (fx >= -0.5) & (fx <= nx - 0.5) & (fy >= -0.5) & (fy <= ny - 0.5)
+        fx = np.clip(np.where(inside, fx, 0.0), 0.0, nx - 1.0)
+        fy = np.clip(np.where(inside, fy, 0.0), 0.0, ny - 1.0)
+
+        col = np.minimum(fx.astype(np.int64), nx - 2)
+        row = np.minimum(fy.astype(np.int64), ny - 2)
+        tx, ty = fx - col, fy - row
+        d = self.density
+        values = ((d[row, col] * (1 - tx) + d[row, col + 1] * tx) * (1 - ty)
+                  + (d[row + 1, col] * (1 - tx) + d[row + 1, col + 1] * tx) * ty)
+        return np.where(inside, values, 0.0)
+
+    def sample_route(self, route, spacing_m=None):
+        """
+        Densities along a route polyline, sampled at regular spacing
+
+        Args:
+            route: List of [lat, lng] points
+            spacing_m: Distance between samples (defaults to the cell size)
+
+        Returns:
+            Tuple of (sample lat array, sample lng array, density array)
+        """
+        route = np.asarray(route, dtype=np.float64).reshape(-1, 2)
+        spacing_m = spacing_m or self.cell_size
+        x, y = project(route[:, 0], route[:, 1])
+        lengths = np.hypot(np.diff(x), np.diff(y))
+        if len(route) < 2 or lengths.sum() == 0:
+            return route[:1, 0], route[:1, 1], self.sample(route[:1, 0], route[:1, 1])
+
+        # Interpolate the route's lat/lng at evenly spaced distances along it
+        along = np.concatenate([[0.0], np.cumsum(lengths)])
+        stations = np.linspace(0.0, along[-1], max(int(np.ceil(along[-1] / spacing_m)) + 1, 2))
+        lats = np.interp(stations, along, route[:, 0])
+        lngs = np.interp(stations, along, route[:, 1])
+        return lats, lngs, self.sample(lats, lngs)
+
+    def percentile(self, q):
+        """
+        Density percentile over the occupied part of the grid
+
+        Args:
+            q: Percentile (0-100)
+
+        Returns:
+            Density in crashes per km²
+        """
+        occupied = self.density[self.density > 1e-9]
+        return float(np.percentile(occupied, q)) if len(occupied) else 0.0
+
+class CrashRiskSurfaces:
+    """
+    Builds and caches filtered crash density surfaces for one crash dataset
+
+    Crash positions on the grid and the filter columns are prepared once, and
+    the kernel's FFT is computed once for the fixed grid, so each new filtered
+    surface costs one rasterization and one forward/inverse FFT pair.
+    """
+    def __init__(self, df, bounds=SURFACE_BOUNDS, cell_size=SURFACE_CELL_SIZE_M, bandwidth=KDE_BANDWIDTH_M):
+        south, west, north, east = bounds
+        self.cell_size = float(cell_size)
+        self.bandwidth = float(bandwidth)
+        (self.origin_x, max_x), (self.origin_y, max_y) = project([south, north], [west, east])
+        self.nx = int(np.ceil((max_x - self.origin_x) / self.cell_size))
+        self.ny = int(np.ceil((max_y - self.origin_y) / self.cell_size))
+
+        lat = df['Latitude'].to_numpy(dtype=np.float64)
+        lon = df['Longitude'].to_numpy(dtype=np.float64)
+        valid = valid_coordinates(lat, lon)
+        x, y = project(lat[valid], lon[valid])
+        self._fx = (x - self.origin_x) / self.cell_size - 0.5
+        self._fy = (y - self.origin_y) / self.cell_size - 0.5
+
+        # Filter columns, restricted to located crashes
+        self._modes = {mode: np.asarray(select(df), dtype=bool)[valid] for mode, select in MODE_FILTERS.items()
+                       if {'VehicleInvolvedWith', 'CollisionType'}.issubset(df.columns)}
+        self._hours = (df['datetime'].dt.hour.to_numpy(dtype=np.float64, na_value=-1)[valid].astype(np.int64)
+                       if 'datetime' in df.columns else None)
+        self._weather = df['weather'].astype(str).to_numpy()[valid] if 'weather' in df.columns else None
+
+        self._radius = int(np.ceil(KERNEL_TRUNCATE * self.bandwidth / self.cell_size))
+        self._fft_shape = (_fft_size(self.ny + self._radius), _fft_size(self.nx + self._radius))
+        self._kernel_fft = self._build_kernel_fft()
+
+        self._lock = threading.Lock()
+        self._cache = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _build_kernel_fft(self):
+        """FFT of the normalized Gaussian kernel, wrapped around the origin of the padded grid"""
+        offsets = np.arange(-self._radius, self._radius + 1)
+        weights = np.exp(-0.5 * (offsets * self.cell_size / self.bandwidth) ** 2)
+        kernel_1d = weights / weights.sum()
+        kernel = np.zeros(self._fft_shape)
+        kernel[np.ix_(offsets % self._fft_shape[0], offsets % self._fft_shape[1])] = np.outer(kernel_1d, kernel_1d)
+        return np.fft.rfft2(kernel)
+
+    def _mask(self, key):
+        """Boolean mask over located crashes for a surface key"""
+        mode, hours, weather = key
+        mask = np.ones(len(self._fx), dtype=bool)
+        if mode is not None and self._modes:
+            mask &= self._modes[mode]
+        if hours is not None and self._hours is not None:
+            mask &= np.isin(self._hours, hours)
+        if weather is not None and self._weather is not None:
+            mask &= self._weather == weather
+        return mask
+
+    def _rasterize(self, mask):
+        """Spread the selected crashes over their four nearest cell centers (linear binning)"""
+        fx, fy = self._fx[mask], self._fy[mask]
+        col, row = np.floor(fx).astype(np.int64), np.floor(fy).astype(np.int64)
+        tx, ty = fx - col, fy - row
+        grid = np.zeros(self.ny * self.nx)
+        for dr, dc, w in ((0, 0, (1 - ty) * (1 - tx)), (0, 1, (1 - ty) * tx),
+                          (1, 0, ty * (1 - tx)), (1, 1, ty * tx)):
+            r, c = row + dr, col + dc
+            inside = (r >= 0) & (r < self.ny) & (c >= 0) & (c < self.nx)
+            grid += np.bincount(r[inside] * self.nx + c[inside], weights=w[inside], minlength=self.ny * self.nx)
+        return grid.reshape(self.ny, self.nx)
+
+    def _build(self, key):
+        """Smoothed crash density surface for a key: rasterize, then convolve with the kernel via FFT"""
+        mask = self._mask(key)
+        counts = self._rasterize(mask)
+        smoothed = np.fft.irfft2(np.fft.rfft2(counts, s=self._fft_shape) * self._kernel_fft, s=self._fft_shape)
+        cell_area_km2 = (self.cell_size / 1000.0) ** 2
+        # FFT round-off leaves tiny negative values in empty areas
+        density = np.maximum(smoothed[:self.ny, :self.nx], 0.0) / cell_area_km2
+        return RiskSurface(density.astype(np.float32), self.origin_x, self.origin_y, self.cell_size,
+                           int(mask.sum()), key)
+
+    def surface(self, mode=None, hour=None, weather=None):
+        """
+        Get the crash density surface for a filter combination (built on first use)
+
+        Example: surfaces.surface(mode='Cycling', hour=range(16, 19), weather='Rainy')
+
+        Args:
+            mode: Travel mode (UI or API name), None for all crashes
+            hour: Hour of day or collection of hours, None for all hours
+            weather: Weather condition (UI or processed name), None for all weather
+
+        Returns:
+            RiskSurface instance (shared; treat as read-only)
+        """
+        key = surface_key(mode, hour, weather)
+        cached = self._cache.get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached
+
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self.hits += 1
+                return cached
+            self.misses += 1
+            result = self._build(key)
+            if len(self._cache) >= MAX_CACHED_SURFACES:
+                self._cache.clear()
+            self._cache[key] = result
+            return result
+
+def route_risk_profile(surface, route, spacing_m=None):
+    """
+    Summarize a risk surface along a route
+
+    Args:
+        surface: RiskSurface to sample
+        route: List of [lat, lng] points
+        spacing_m: Distance between samples (defaults to the surface cell size)
+
+    Returns:
+        Dictionary with mean and peak density (crashes per km²), the peak location,
+        and the share of the route above the surface's 90th percentile
+    """
+    lats, lngs, values = surface.sample_route(route, spacing_m)
+    peak = int(np.argmax(values))
+    threshold = surface.percentile(90)
+    return {
+        'mean_density': round(float(values.mean()), 1),
+        'peak_density': round(float(values[peak]), 1),
+        'peak_location': [round(float(lats[peak]), 6), round(float(lngs[peak]), 6)],
+        'high_risk_share': round(float((values > threshold).mean()), 3) if threshold > 0 else 0.0,
+        'samples': len(values)
+    }
@@ -0,0 +1,336 @@
+"""
+Spatial index over crash locations for San Jose Safe Commute
+Buckets the crash Latitude/Longitude points into a uniform grid on a local
+metric projection so radius, bounding-box and nearest-neighbour queries only
+look at the few cells around the query point
+"""
+
+import numpy as np
+import logging
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Mean Earth radius in meters
+EARTH_RADIUS_M = 6371008.8
+
+# Downtown San Jose, the origin of the local projection
+PROJECTION_ORIGIN = (37.3382, -121.8863)
+
+# Grid cell edge length in meters
+DEFAULT_CELL_SIZE_M = 200.0
+
+# Cell size is increased when the points are spread so far apart that the grid would get larger than this
+MAX_GRID_CELLS = 4_000_000
+
+def project(lat, lon, origin=PROJECTION_ORIGIN):
+    """
+    Project coordinates to meters east/north of the origin
+
+    An equirectangular projection is accurate to well under 0.1% across the city.
+
+    Args:
+        lat: Latitude value(s) in degrees
+        lon: Longitude value(s) in degrees
+        origin: (lat, lon) of the projection origin
+
+    Returns:
+        Tuple of (x, y) arrays in meters
+    """
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    x = np.radians(lon - origin[1]) * EARTH_RADIUS_M * np.cos(np.radians(origin[0]))
+    y = np.radians(lat - origin[0]) * EARTH_RADIUS_M
+    return x, y
+
+def unproject(x, y, origin=PROJECTION_ORIGIN):
+    """
+    Convert projected meters back to coordinates
+
+    Args:
+        x: Meters east of the origin
+        y: Meters north of the origin
+        origin: (lat, lon) of the projection origin
+
+    Returns:
+        Tuple of (lat, lon) arrays in degrees
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    lat = origin[0] + np.degrees(y / EARTH_RADIUS_M)
+    lon = origin[1] + np.degrees(x / (EARTH_RADIUS_M * np.cos(np.radians(origin[0]))))
+    return lat, lon
+
+def valid_coordinates(lat, lon):
+    """
+    Mask of usable coordinates (the crash data uses 0 for a missing location)
+
+    Args:
+        lat: Latitude values
+        lon: Longitude values
+
+    Returns:
+        Boolean array
+    """
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    return (np.isfinite(lat) & np.isfinite(lon) & (lat != 0) & (lon != 0)
+            & (np.abs(lat) <= 90) & (np.abs(lon) <= 180))
+
+def ranges_to_index(starts, stops):
+    """
+    Concatenate the integer ranges [start, stop) without a Python loop
+
+    Args:
+        starts: Range start positions
+        stops: Range end positions (exclusive)
+
+    Returns:
+        Array of all positions in the ranges, in order
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    lengths = np.asarray(stops, dtype=np.int64) - starts
+    lengths = np.maximum(lengths, 0)
+    ends = np.cumsum(lengths)
+    return np.repeat(starts - ends + lengths, lengths) + np.arange(ends[-1] if len(ends) else 0)
+
+class CrashSpatialIndex:
+    """
+    Uniform grid index over crash points
+
+    Points are sorted by grid cell (row-major), so every cell, and every run
+    of cells within one grid row, is a contiguous slice found through the
+    cell_start offsets. Query results are row positions into the frame (or
+    coordinate arrays) the index was built from.
+    """
+    def __init__(self, x, y, positions, origin_x, origin_y, nx, ny, cell_size, cell_start):
+        self.x = x
+        self.y = y
+        self.positions = positions
+        self.origin_x = origin_x
+        self.origin_y = origin_y
+        self.nx = nx
+        self.ny = ny
+        self.cell_size = cell_size
+        self.cell_start = cell_start
+
+    @classmethod
+    def from_coordinates(cls, lat, lon, positions=None, cell_size=DEFAULT_CELL_SIZE_M):
+        """
+        Build the index from coordinate arrays
+
+        Args:
+            lat: Latitude values
+            lon: Longitude values
+            positions: Identifier per point returned by queries (defaults to 0..n-1)
+            cell_size: Grid cell edge length in meters
+
+        Returns:
+            CrashSpatialIndex instance
+        """
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        if positions is None:
+            positions = np.arange(len(lat))
+        valid = valid_coordinates(lat, lon)
+        x, y = project(lat[valid], lon[valid])
+        positions = np.asarray(positions)[valid].astype(np.int64)
+
+        if len(x) == 0:
+            return cls(x, y, positions, 0.0, 0.0, 1, 1, float(cell_size), np.zeros(2, dtype=np.int64))
+
+        origin_x, origin_y = float(x.min()), float(y.min())
+        width, height = float(x.max()) - origin_x, float(y.max()) - origin_y
+        cell_size = max(float(cell_size), np.sqrt(width * height / MAX_GRID_CELLS))
+        nx = int(width // cell_size) + 1
+        ny = int(height // cell_size) + 1
+
+        cells = (((y - origin_y) // cell_size).astype(np.int64) * nx
+                 + ((x - origin_x) // cell_size).astype(np.int64))
+        order = np.argsort(cells, kind='stable')
+        cell_start = np.zeros(nx * ny + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cells, minlength=nx * ny), out=cell_start[1:])
+
+        logger.info(f"Built crash spatial index over {len(x)} points ({nx}x{ny} cells of {cell_size:.0f} m)")
+        return cls(x[order], y[order], positions[order], origin_x, origin_y, nx, ny, cell_size, cell_start)
+
+    @classmethod
+    def from_frame(cls, df, cell_size=DEFAULT_CELL_SIZE_M):
+        """
+        Build the index from a crash dataframe with Latitude/Longitude columns
+
+        Args:
+            df: Crash dataframe
+            cell_size: Grid cell edge length in meters
+
+        Returns:
+            CrashSpatialIndex instance whose results are row positions into df
+        """
+        return cls.from_coordinates(df['Latitude'].to_numpy(), df['Longitude'].to_numpy(), cell_size=cell_size)
+
+    def __len__(self):
+        return len(self.x)
+
+    def candidates(self, min_x, min_y, max_x, max_y):
+        """
+        Internal point indices in all cells overlapping a projected box
+
+        Args:
+            min_x, min_y, max_x, max_y: Box corners in projected meters
+
+        Returns:
+            Array of indices into self.x / self.y / self.positions
+        """
+        cx0 = max(int((min_x - self.origin_x) // self.cell_size), 0)
+        cx1 = min(int((max_x - self.origin_x) // self.cell_size), self.nx - 1)
+        cy0 = max(int((min_y - self.origin_y) // self.cell_size), 0)
+        cy1 = min(int((max_y - self.origin_y) // self.cell_size), self.ny - 1)
+        if cx0 > cx1 or cy0 > cy1:
+            return np.empty(0, dtype=np.int64)
+        # Cells x0..x1 of one grid row are contiguous, so each row is a single slice
+        row_offsets = np.arange(cy0, cy1 + 1) * self.nx
+        return ranges_to_index(self.cell_start[row_offsets + cx0], self.cell_start[row_offsets + cx1 + 1])
+
+    def query_radius(self, lat, lon, radius_m, sort=False):
+        """
+        Find crashes within a distance of a point
+
+        Args:
+            lat: Latitude of the query point
+            lon: Longitude of the query point
+            radius_m: Search radius in meters
+            sort: Order results by distance
+
+        Returns:
+            Tuple of (row positions, distances in meters)
+        """
+        x, y = project(lat, lon)
+        idx = self.candidates(x - radius_m, y - radius_m, x + radius_m, y + radius_m)
+        distances = np.hypot(self.x[idx] - x, self.y[idx] - y)
+        keep = distances <= radius_m
+        idx, distances = idx[keep], distances[keep]
+        if sort:
+            order = np.argsort(distances, kind='stable')
+            idx, distances = idx[order], distances[order]
+        return self.positions[idx], distances
+
+    def query_bbox(self, min_lat, min_lon, max_lat, max_lon):
+        """
+        Find crashes inside a latitude/longitude bounding box
+
+        Args:
+            min_lat, min_lon, max_lat, max_lon: Box corners in degrees
+
+        Returns:
+            Array of row positions
+        """
+        # The projection is linear in each axis, so the box stays axis-aligned
+        min_x, min_y = project(min_lat, min_lon)
+        max_x, max_y = project(max_lat, max_lon)
+        idx = self.candidates(min_x, min_y, max_x, max_y)
+        keep = ((self.x[idx] >= min_x) & (self.x[idx] <= max_x)
+                & (self.y[idx] >= min_y) & (self.y[idx] <= max_y))
+        return self.positions[idx[keep]]
+
+    def query_knn(self, lat, lon, k=10):
+        """
+        Find the k crashes nearest to a point
+
+        Args:
+            lat: Latitude of the query point
+            lon: Longitude of the query point
+            k: Number of neighbours
+
+        Returns:
+            Tuple of (row positions, distances in meters), nearest first
+        """
+        x, y = project(lat, lon)
+        k = min(int(k), len(self))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        # Grow a square window until the k-th nearest candidate lies inside its inscribed circle
+        half_width = self.cell_size
+        max_half_width = self.cell_size * (self.nx + self.ny) + np.hypot(x - self.origin_x, y - self.origin_y)
+        while True:
+            idx = self.candidates(x - half_width, y - half_width, x + half_width, y + half_width)
+            if len(idx) >= k:
+                distances = np.hypot(self.x[idx] - x, self.y[idx] - y)
+                nearest = np.argpartition(distances, k - 1)[:k]
+                if distances[nearest].max() <= half_width or half_width >= max_half_width:
+                    order = nearest[np.argsort(distances[nearest], kind='stable')]
+                    return self.positions[idx[order]], distances[order]
+            half_width *= 2
+
+    def query_corridor(self, lats, lons, buffer_m):
+        """
+        Find crashes within a distance of a polyline (e.g. a route)
+
+        Segments are split into pieces no longer than a grid cell so the cells
+        scanned hug the route. Distances are computed for every candidate and
+        segment pair at once and the nearest segment is kept per crash.
+
+        Args:
+            lats: Latitudes of the polyline vertices
+            lons: Longitudes of the polyline vertices
+            buffer_m: Corridor half-width in meters
+
+        Returns:
+            Tuple of (row positions, distance to the route in meters, distance
+            along the route in meters, segment number), ordered along the route
+        """
+        px, py = project(np.atleast_1d(lats), np.atleast_1d(lons))
+        if len(px) == 1:
+            px, py = np.repeat(px, 2), np.repeat(py, 2)
+        ax, ay = px[:-1], py[:-1]
+        dx, dy = px[1:] - ax, py[1:] - ay
+        seg_len = np.hypot(dx, dy)
+        seg_offset = np.concatenate([[0.0], np.cumsum(seg_len)[:-1]])
+
+        # Pieces of at most one cell along each segment
+        n_pieces = np.maximum(np.ceil(seg_len / self.cell_size), 1).astype(np.int64)
+        piece_seg = np.repeat(np.arange(len(seg_len)), n_pieces)
+        piece_step = ranges_to_index(np.zeros(len(n_pieces)), n_pieces)
+        t0 = piece_step / n_pieces[piece_seg]
+        t1 = (piece_step + 1) / n_pieces[piece_seg]
+        x0, x1 = ax[piece_seg] + dx[piece_seg] * t0, ax[piece_seg] + dx[piece_seg] * t1
+        y0, y1 = ay[piece_seg] + dy[piece_seg] * t0, ay[piece_seg] + dy[piece_seg] * t1
+
+        # Cell box around each piece, clipped to the grid
+        cx0 = np.maximum(((np.minimum(x0, x1) - buffer_m - self.origin_x) // self.cell_size).astype(np.int64), 0)
+        cx1 = np.minimum(((np.maximum(x0, x1) + buffer_m - self.origin_x) // self.cell_size).astype(np.int64), self.nx - 1)
+        cy0 = np.maximum(((np.minimum(y0, y1) - buffer_m - self.origin_y) // self.cell_size).astype(np.int64), 0)
+        cy1 = np.minimum(((np.maximum(y0, y1) + buffer_m - self.origin_y) // self.cell_size).astype(np.int64), self.ny - 1)
+        n_rows = np.where((cx0 <= cx1) & (cy0 <= cy1), cy1 - cy0 + 1, 0)
+
+        # One contiguous slice per (piece, grid row), then one pair per (candidate, segment)
+        row_piece = np.repeat(np.arange(len(n_rows)), n_rows)
+        rows = cy0[row_piece] + ranges_to_index(np.zeros(len(n_rows)), n_rows)
+        starts = self.cell_start[rows * self.nx + cx0[row_piece]]
+        stops = self.cell_start[rows * self.nx + cx1[row_piece] + 1]
+        idx = ranges_to_index(starts, stops)
+        seg = np.repeat(piece_seg[row_piece], stops - starts)
+
+        # Vectorized point-to-segment distance
+        rel_x, rel_y = self.x[idx] - ax[seg], self.y[idx] - ay[seg]
+        seg_len2 = seg_len[seg] ** 2
+        t = np.clip((rel_x * dx[seg] + rel_y * dy[seg]) / np.where(seg_len2 > 0, seg_len2, 1.0), 0.0, 1.0)
+        distances = np.hypot(rel_x - t * dx[seg], rel_y - t * dy[seg])
+        keep = distances <= buffer_m
+        idx, seg, t, distances = idx[keep], seg[keep], t[keep], distances[keep]
+
+        # Nearest segment per crash
+        order = np.lexsort((distances, idx))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = idx[order][1:] != idx[order][:-1]
+        nearest = order[first]
+        along = seg_offset[seg[nearest]] + t[nearest] * seg_len[seg[nearest]]
+
+        by_along = np.argsort(along, kind='stable')
+        nearest = nearest[by_along]
+        return self.positions[idx[nearest]], distances[nearest], along[by_along], seg[nearest]
+
+    def nbytes(self):
+        """Memory used by the index arrays in bytes"""
+        return int(self.x.nbytes + self.y.nbytes + self.positions.nbytes + self.cell_start.nbytes)
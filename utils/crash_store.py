@@ -0,0 +1,736 @@
+"""
+Columnar on-disk cache for the processed San Jose crash dataset
+Stores the output of process_crash_data as one raw array file per column so
+later page loads can memory-map the columns instead of re-parsing the CSV, and
+new crash records can be appended without rebuilding the whole store. Appended
+records are also kept in a delta CSV next to the source, which is replayed
+whenever the store is rebuilt
+"""
+
+import pandas as pd
+import numpy as np
+import argparse
+import hashlib
+import joblib
+import json
+import logging
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+# Add parent directory to import path
+parent_dir = str(Path(__file__).parent.parent)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from utils.custom_data_processor import (
+    transform_crash_data, compact_crash_frame, memory_footprint, concat_crash_frames, CrashStatsAccumulator
+)
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Default location of the cache, next to the crash CSV
+CACHE_DIR = Path(__file__).parent / ".crash_cache"
+
+# Bump when the on-disk layout changes so old caches are ignored
+CACHE_FORMAT_VERSION = 4
+
+# Columns holding Python date/time objects are rebuilt from 'datetime' on load
+DERIVED_COLUMNS = {
+    'date': lambda df: df['datetime'].dt.date,
+    'time': lambda df: df['datetime'].dt.time,
+}
+
+# Identifier columns used to skip records the store already holds
+ID_COLUMNS = ['CrashFactId', 'TcrNumber']
+
+# Codes for categorical and dictionary columns are stored at a fixed width so appends never overflow
+CODE_DTYPE = np.dtype('int32')
+
+class _SchemaMismatch(ValueError):
+    """New records cannot be appended column-wise to the stored schema"""
+
+def source_fingerprint(source_path):
+    """
+    Build the cache key for a source CSV from its content hash and mtime
+
+    Args:
+        source_path: Path to the source CSV file
+
+    Returns:
+        Hex string identifying this exact version of the file
+    """
+    digest = hashlib.sha256()
+    with open(source_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    mtime_ns = os.stat(source_path).st_mtime_ns
+    return f"{digest.hexdigest()[:32]}-{mtime_ns}"
+
+def _entry_dir(source_path, cache_dir, fingerprint):
+    """Directory holding the cache entry for one source file version"""
+    return Path(cache_dir) / f"{Path(source_path).stem}-{fingerprint}"
+
+def delta_path(source_path):
+    """Delta CSV holding the records appended to a source file, next to it"""
+    source_path = Path(source_path)
+    return source_path.with_name(f"{source_path.stem}.appended.csv")
+
+def _delta_size(source_path):
+    """Size in bytes of a source file's delta CSV (0 if nothing was appended)"""
+    try:
+        return os.stat(delta_path(source_path)).st_size
+    except FileNotFoundError:
+        return 0
+
+
+def _python_values(values):
+    """Convert NumPy scalars to plain Python values so they can be written as JSON"""
+    return [value.item() if hasattr(value, 'item') else value for value in values]
+
+def _encode_column(series):
+    """
+    Convert a column into a flat NumPy array plus the metadata needed to restore it
+
+    Args:
+        series: Column to encode
+
+    Returns:
+        Tuple of (array, column metadata dict, list of categories or None)
+    """
+    dtype = series.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        codes = series.cat.codes.to_numpy().astype(CODE_DTYPE)
+        return codes, {'kind': 'categorical', 'storage': CODE_DTYPE.str}, _python_values(dtype.categories)
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        values = series.to_numpy()
+        return values.view('int64'), {'kind': 'datetime', 'storage': '<i8', 'dtype': str(values.dtype)}, None
+    if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_numeric_dtype(dtype):
+        if isinstance(dtype, np.dtype):
+            values = series.to_numpy()
+            return values, {'kind': 'numeric', 'storage': values.dtype.str}, None
+    # Everything else (strings, mixed objects) is dictionary encoded
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    return codes.astype(CODE_DTYPE), {'kind': 'dictionary', 'storage': CODE_DTYPE.str}, _python_values(uniques)
+
+def _encode_appended_column(series, column_meta, categories):
+    """
+    Encode new values of a column against the schema already in the store
+
+    Args:
+        series: New values of the column
+        column_meta: Stored metadata for the column
+        categories: Stored categories (categorical columns only)
+
+    Returns:
+        Tuple of (array, list of categories to append or None)
+
+    Raises:
+        _SchemaMismatch: If the values cannot be stored with the existing column type
+    """
+    kind = column_meta['kind']
+    name = column_meta['name']
+    if kind == 'categorical':
+        values = series.astype(object)
+        uniques = pd.unique(values.dropna())
+        known = pd.Index(categories).get_indexer(uniques) >= 0 if categories else np.zeros(len(uniques), dtype=bool)
+        new_categories = _python_values(uniques[~known])
+        codes = pd.Categorical(values, categories=list(categories) + new_categories).codes
+        return codes.astype(CODE_DTYPE), new_categories
+    if kind == 'dictionary':
+        # Dictionary entries only need to be decodable, so new values are appended without a membership check
+        codes, uniques = pd.factorize(series, use_na_sentinel=True)
+        codes = np.where(codes >= 0, codes + column_meta['n_categories'], -1)
+        return codes.astype(CODE_DTYPE), _python_values(uniques)
+    if kind == 'datetime':
+        if not pd.api.types.is_datetime64_any_dtype(series.dtype):
+            raise _SchemaMismatch(f"Column '{name}' is no longer a datetime column")
+        return series.to_numpy().astype(column_meta['dtype']).view('int64'), None
+
+    storage = np.dtype(column_meta['storage'])
+    if not (pd.api.types.is_bool_dtype(series.dtype) or pd.api.types.is_numeric_dtype(series.dtype)):
+        raise _SchemaMismatch(f"Column '{name}' is no longer numeric")
+    values = series.to_numpy()
+    if storage.kind in 'iub':
+        if series.isna().any():
+            raise _SchemaMismatch(f"Column '{name}' has missing values but is stored as {storage}")
+        converted = values.astype(storage)
+        if not np.array_equal(converted, values):
+            raise _SchemaMismatch(f"Column '{name}' has values outside the range of {storage}")
+        return converted, None
+    return values.astype(storage), None
+
+def _decode_column(values, column_meta, categories):
+    """
+    Rebuild a column from its stored array and metadata
+
+    Args:
+        values: Array loaded from disk (possibly memory-mapped)
+        column_meta: Metadata written by _encode_column
+        categories: Stored categories for categorical and dictionary columns
+
+    Returns:
+        Array-like suitable for a DataFrame column
+    """
+    kind = column_meta['kind']
+    if kind == 'datetime':
+        return np.asarray(values).view(column_meta['dtype'])
+    if kind == 'numeric':
+        # Plain ndarray view over the memory-mapped file
+        return np.asarray(values)
+    if kind == 'categorical':
+        return pd.Categorical.from_codes(np.asarray(values), categories=categories)
+    lookup = np.empty(len(categories) + 1, dtype=object)
+    lookup[:-1] = categories
+    lookup[-1] = np.nan
+    # Code -1 (missing) indexes the trailing NaN slot
+    return lookup.take(values)
+
+def _append_array(path, values, committed_rows):
+    """
+    Append values to a raw column file
+
+    Anything past the committed rows (left by an interrupted append) is cut off first.
+
+    Args:
+        path: Column file path
+        values: Array to append, already in the stored dtype
+        committed_rows: Number of rows the store metadata currently covers
+    """
+    values = np.ascontiguousarray(values)
+    with open(path, 'r+b' if path.exists() else 'wb') as f:
+        f.truncate(committed_rows * values.dtype.itemsize)
+        f.seek(0, os.SEEK_END)
+        f.write(values.tobytes())
+
+def _read_array(path, storage, rows):
+    """Memory-map the committed rows of a raw column file"""
+    if rows == 0:
+        return np.empty(0, dtype=storage)
+    return np.memmap(path, dtype=storage, mode='r', shape=(rows,))
+
+def _append_categories(path, categories, committed_bytes):
+    """
+    Append a batch of categories to a column's dictionary file (one JSON list per line)
+
+    Args:
+        path: Dictionary file path
+        categories: New categories
+        committed_bytes: Size of the file the store metadata currently covers
+
+    Returns:
+        New committed size of the file in bytes
+    """
+    with open(path, 'r+b' if path.exists() else 'wb') as f:
+        f.truncate(committed_bytes)
+        f.seek(0, os.SEEK_END)
+        if categories:
+            f.write((json.dumps(categories) + '\n').encode('utf-8'))
+        return f.tell()
+
+def _read_categories(path, column_meta):
+    """Read the committed categories of a categorical or dictionary column"""
+    with open(path, 'rb') as f:
+        data = f.read(column_meta['categories_bytes'])
+    categories = []
+    for line in data.splitlines():
+        categories.extend(json.loads(line))
+    if len(categories) != column_meta['n_categories']:
+        raise ValueError(f"Dictionary for column '{column_meta['name']}' is incomplete")
+    return categories
+
+def _id_keys(series):
+    """
+    64-bit lookup keys for the non-missing values of an identifier column
+
+    Args:
+        series: CrashFactId or TcrNumber values
+
+    Returns:
+        uint64 array with one key per non-missing value
+    """
+    values = series.dropna()
+    if pd.api.types.is_numeric_dtype(values.dtype):
+        return values.to_numpy().astype(np.int64).view(np.uint64)
+    # Report numbers are hashed; a collision between two distinct 64-bit hashes is negligible here
+    return pd.util.hash_array(values.astype(str).to_numpy(dtype=object))
+
+def _known_ids(entry, meta, column, keys):
+    """Mark keys already present in the stored ID index for a column"""
+    found = np.zeros(len(keys), dtype=bool)
+    for segment in meta['id_index'].get(column, []):
+        if segment['size'] == 0:
+            continue
+        ids = np.load(entry / segment['file'], mmap_mode='r')
+        positions = np.minimum(np.searchsorted(ids, keys), len(ids) - 1)
+        found |= ids[positions] == keys
+    return found
+
+def _add_id_segments(entry, meta, processed_df):
+    """
+    Index the identifiers of newly stored rows
+
+    Each append adds one sorted segment per ID column. Whenever the newest
+    segment is at least as large as the one before it the two are merged,
+    so there are only O(log n) segments and each ID is rewritten O(log n) times.
+
+    Args:
+        entry: Store directory
+        meta: Store metadata (updated in place)
+        processed_df: Newly stored rows
+
+    Returns:
+        List of segment files that are obsolete once the metadata is committed
+    """
+    obsolete = []
+    for column in ID_COLUMNS:
+        if column not in processed_df.columns:
+            continue
+        segments = meta['id_index'].setdefault(column, [])
+        keys = np.sort(_id_keys(processed_df[column]))
+        while segments and segments[-1]['size'] <= len(keys):
+            segment = segments.pop()
+            keys = np.sort(np.concatenate([np.load(entry / segment['file']), keys]), kind='stable')
+            obsolete.append(segment['file'])
+        meta['id_segment_seq'] += 1
+        file_name = f"ids-{column}-{meta['id_segment_seq']}.npy"
+        np.save(entry / file_name, keys, allow_pickle=False)
+        segments.append({'file': file_name, 'size': len(keys)})
+    return obsolete
+
+def _drop_known_records(raw_df, entry, meta):
+    """
+    Drop raw records whose CrashFactId or TcrNumber is already stored or repeated in the batch
+
+    Args:
+        raw_df: New records in the crashdata2011-2021.csv format
+        entry: Store directory
+        meta: Store metadata
+
+    Returns:
+        Dataframe of records that are new to the store
+    """
+    known = np.zeros(len(raw_df), dtype=bool)
+    for column in ID_COLUMNS:
+        if column not in raw_df.columns:
+            continue
+        valid = raw_df[column].notna().to_numpy()
+        keys = _id_keys(raw_df[column])
+        seen = _known_ids(entry, meta, column, keys) | pd.Series(keys).duplicated().to_numpy()
+        known[valid] |= seen
+    return raw_df[~known]
+
+def _write_json_atomic(path, data):
+    """Write JSON next to path and move it into place in one step"""
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def _read_meta(entry, source_path=None):
+    """
+    Read a store's metadata
+
+    Args:
+        entry: Store directory
+        source_path: Source CSV; if given, a store that does not cover all of its delta CSV is ignored
+
+    Returns:
+        Metadata dict, or None if it is missing, from another format version or stale
+    """
+    meta_path = entry / 'meta.json'
+    if not meta_path.exists():
+        return None
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if meta.get('version') != CACHE_FORMAT_VERSION:
+        return None
+    if source_path is not None and meta['delta_bytes'] != _delta_size(source_path):
+        return None
+    return meta
+
+def _write_stats(entry, meta, stats, accumulator):
+    """
+    Write the stats and their accumulator under a new generation
+
+    The files only take effect once the metadata pointing at them is committed.
+
+    Returns:
+        List of stats files that are obsolete once the metadata is committed
+    """
+    obsolete = [meta[key] for key in ('stats_file', 'accumulator_file') if meta.get(key)]
+    meta['generation'] += 1
+    meta['stats_file'] = f"stats-{meta['generation']}.pkl"
+    meta['accumulator_file'] = f"accumulator-{meta['generation']}.pkl"
+    joblib.dump(stats, entry / meta['stats_file'])
+    # Plain Counters only, so the C pickler is much faster than joblib here
+    with open(entry / meta['accumulator_file'], 'wb') as f:
+        pickle.dump(accumulator, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return obsolete
+
+def save_processed_crash_data(processed_df, stats, source_path, cache_dir=None, compact=False, accumulator=None,
+                              delta_bytes=0):
+    """
+    Persist processed crash data and its stats for the given source file
+
+    Args:
+        processed_df: DataFrame returned by process_crash_data
+        stats: Stats dictionary returned by process_crash_data
+        source_path: Path to the CSV the data was built from
+        cache_dir: Optional cache directory (defaults to CACHE_DIR)
+        compact: Whether processed_df uses the compact schema
+        accumulator: CrashStatsAccumulator over the same rows (rebuilt from processed_df if omitted)
+        delta_bytes: How much of the source's delta CSV processed_df includes
+
+    Returns:
+        Path to the written cache entry
+    """
+    cache_dir = Path(cache_dir or CACHE_DIR)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    fingerprint = source_fingerprint(source_path)
+    entry = _entry_dir(source_path, cache_dir, fingerprint)
+    if accumulator is None:
+        accumulator = CrashStatsAccumulator().update(processed_df)
+
+    # Write into a temporary directory first so readers never see a partial entry
+    tmp_dir = Path(tempfile.mkdtemp(dir=cache_dir, prefix='.tmp-'))
+    try:
+        meta = {
+            'version': CACHE_FORMAT_VERSION,
+            'fingerprint': fingerprint,
+            'rows': len(processed_df),
+            'compact': bool(compact),
+            'columns': [],
+            'id_index': {},
+            'id_segment_seq': 0,
+            'generation': 0,
+            'appended': [],
+            'delta_bytes': delta_bytes
+        }
+        for i, column in enumerate(processed_df.columns):
+            if column in DERIVED_COLUMNS:
+                meta['columns'].append({'name': column, 'kind': 'derived'})
+                continue
+            values, column_meta, categories = _encode_column(processed_df[column])
+            column_meta['name'] = column
+            column_meta['file'] = f"{i}.bin"
+            _append_array(tmp_dir / column_meta['file'], values, 0)
+            if categories is not None:
+                column_meta['categories_file'] = f"{i}.categories"
+                column_meta['n_categories'] = len(categories)
+                column_meta['categories_bytes'] = _append_categories(tmp_dir / column_meta['categories_file'], categories, 0)
+            meta['columns'].append(column_meta)
+
+        _add_id_segments(tmp_dir, meta, processed_df)
+        _write_stats(tmp_dir, meta, stats, accumulator)
+        _write_json_atomic(tmp_dir / 'meta.json', meta)
+
+        if entry.exists():
+            shutil.rmtree(entry)
+        os.replace(tmp_dir, entry)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    # Drop entries for older versions of the same source file
+    for stale in cache_dir.glob(f"{Path(source_path).stem}-*"):
+        if stale != entry and stale.is_dir():
+            shutil.rmtree(stale, ignore_errors=True)
+
+    logger.info(f"Crash data cached to {entry}")
+    return entry
+
+def load_processed_crash_data(source_path, cache_dir=None, compact=False):
+    """
+    Load cached processed crash data for the given source file
+
+    Args:
+        source_path: Path to the source CSV file
+        cache_dir: Optional cache directory (defaults to CACHE_DIR)
+        compact: Only accept an entry written with the compact schema
+
+    Returns:
+        Tuple of (processed dataframe, stats dict), or None on a cache miss
+    """
+    cache_dir = Path(cache_dir or CACHE_DIR)
+    entry = _entry_dir(source_path, cache_dir, source_fingerprint(source_path))
+
+    try:
+        meta = _read_meta(entry, source_path)
+        if meta is None or meta.get('compact') != bool(compact):
+            return None
+        return _read_store(entry, meta)
+    except Exception as e:
+        logger.error(f"Error reading crash data cache: {str(e)}")
+        return None
+
+def _read_store(entry, meta):
+    """
+    Read the processed dataframe and stats a store's metadata covers
+
+    Args:
+        entry: Store directory
+        meta: Store metadata
+
+    Returns:
+        Tuple of (processed dataframe, stats dict)
+    """
+    data = {}
+    derived = []
+    for column_meta in meta['columns']:
+        if column_meta['kind'] == 'derived':
+            derived.append(column_meta['name'])
+            data[column_meta['name']] = None
+            continue
+        values = _read_array(entry / column_meta['file'], column_meta['storage'], meta['rows'])
+        categories = None
+        if 'categories_file' in column_meta:
+            categories = _read_categories(entry / column_meta['categories_file'], column_meta)
+        data[column_meta['name']] = _decode_column(values, column_meta, categories)
+
+    processed_df = pd.DataFrame({k: v for k, v in data.items() if v is not None}, copy=False)
+    for column in derived:
+        processed_df[column] = DERIVED_COLUMNS[column](processed_df)
+    processed_df = processed_df[list(data.keys())]
+    if meta['compact']:
+        # Restores categorical date/time and Arrow-backed identifier strings
+        processed_df = compact_crash_frame(processed_df)
+
+    stats = joblib.load(entry / meta['stats_file'])
+    return processed_df, stats
+
+def _new_ids(raw_df, known_df):
+    """Mask of raw records whose CrashFactId and TcrNumber are not in known_df or repeated before them"""
+    new = np.ones(len(raw_df), dtype=bool)
+    for column in ID_COLUMNS:
+        if column not in raw_df.columns:
+            continue
+        valid = raw_df[column].notna().to_numpy()
+        keys = _id_keys(raw_df[column])
+        known_keys = _id_keys(known_df[column]) if column in known_df.columns else np.empty(0, dtype=np.uint64)
+        seen = np.isin(keys, known_keys) | pd.Series(keys).duplicated().to_numpy()
+        new[valid] &= ~seen
+    return new
+
+def _read_source(source_path):
+    """
+    Read a source CSV together with the records appended to it
+
+    Delta records the source already holds (e.g. after it was re-downloaded
+    with them) are dropped, so replaying the delta never duplicates crashes.
+
+    Args:
+        source_path: Path to the source CSV file
+
+    Returns:
+        Raw crash dataframe
+    """
+    df = pd.read_csv(source_path)
+    path = delta_path(source_path)
+    if not path.exists() or path.stat().st_size == 0:
+        return df
+    delta_df = pd.read_csv(path)
+    delta_df = delta_df[_new_ids(delta_df, df)]
+    logger.info(f"Replaying {len(delta_df)} appended crash records from {path}")
+    return pd.concat([df, delta_df], ignore_index=True)
+
+def _append_delta(raw_df, source_path):
+    """
+    Add raw records to the source's delta CSV, in the source's column order
+
+    Args:
+        raw_df: New records in the crashdata2011-2021.csv format
+        source_path: Path to the source CSV file
+
+    Returns:
+        New size of the delta CSV in bytes
+    """
+    path = delta_path(source_path)
+    columns = pd.read_csv(source_path, nrows=0).columns
+    write_header = _delta_size(source_path) == 0
+    with open(path, 'a', newline='') as f:
+        raw_df.reindex(columns=columns).to_csv(f, header=write_header, index=False)
+        f.flush()
+        os.fsync(f.fileno())
+    return _delta_size(source_path)
+
+def load_crash_data(source_path, cache_dir=None, compact=True):
+    """
+    Load processed crash data, using the columnar cache when it is fresh
+
+    On a cache miss the CSV and its delta of appended records are parsed, run
+    through process_crash_data and the result is written back to the cache for
+    the next caller.
+
+    Args:
+        source_path: Path to the crashdata2011-2021.csv style file
+        cache_dir: Optional cache directory (defaults to CACHE_DIR)
+        compact: Return the frame using the compact categorical schema
+
+    Returns:
+        Tuple of (processed dataframe, stats dict)
+    """
+    cached = load_processed_crash_data(source_path, cache_dir, compact=compact)
+    if cached is not None:
+        processed_df, stats = cached
+        logger.info(f"Crash data loaded from cache ({memory_footprint(processed_df)['total_mb']} MB in memory)")
+        return processed_df, stats
+
+    delta_bytes = _delta_size(source_path)
+    df = _read_source(source_path)
+    processed_df = transform_crash_data(df)
+    del df
+    # Same stats as process_crash_data; the accumulator is kept so appends can update them
+    accumulator = CrashStatsAccumulator().update(processed_df)
+    stats = accumulator.to_stats()
+    if compact:
+        processed_df = compact_crash_frame(processed_df)
+
+    try:
+        save_processed_crash_data(processed_df, stats, source_path, cache_dir, compact=compact, accumulator=accumulator,
+                                  delta_bytes=delta_bytes)
+    except Exception as e:
+        # A read-only deployment still works, it just never gets the fast path
+        logger.warning(f"Could not write crash data cache: {str(e)}")
+
+    return processed_df, stats
+
+def _append_rows(entry, meta, processed_df):
+    """
+    Append processed rows to the store's column and dictionary files
+
+    Every column is encoded before anything is written, so a schema mismatch
+    leaves the store untouched. The metadata is updated in place but not committed.
+
+    Returns:
+        List of files that are obsolete once the metadata is committed
+    """
+    stored_columns = [column_meta['name'] for column_meta in meta['columns']]
+    if set(processed_df.columns) != set(stored_columns):
+        raise _SchemaMismatch("New records have different columns from the stored crash data")
+
+    encoded = []
+    for column_meta in meta['columns']:
+        if column_meta['kind'] == 'derived':
+            continue
+        categories = None
+        if column_meta['kind'] == 'categorical':
+            categories = _read_categories(entry / column_meta['categories_file'], column_meta)
+        values, new_categories = _encode_appended_column(processed_df[column_meta['name']], column_meta, categories)
+        encoded.append((column_meta, values, new_categories))
+
+    for column_meta, values, new_categories in encoded:
+        _append_array(entry / column_meta['file'], values, meta['rows'])
+        if new_categories is not None:
+            path = entry / column_meta['categories_file']
+            column_meta['categories_bytes'] = _append_categories(path, new_categories, column_meta['categories_bytes'])
+            column_meta['n_categories'] += len(new_categories)
+    meta['rows'] += len(processed_df)
+    return _add_id_segments(entry, meta, processed_df)
+
+def append_crash_records(new_records, source_path, cache_dir=None, compact=True):
+    """
+    Append new crash records to the stored dataset for a source file
+
+    Records whose CrashFactId or TcrNumber is already stored (or repeated
+    within the batch) are skipped. Only the new rows are transformed and
+    written: column and dictionary files are appended to, the stats are
+    updated from the persisted accumulator and the ID index gains a segment,
+    so the cost follows the size of the batch rather than the history. Rows
+    that do not fit the stored column types trigger a full rebuild instead.
+
+    The raw records are first added to the delta CSV next to the base CSV
+    (see delta_path), so they survive the store being rebuilt after the base
+    CSV changes.
+
+    Args:
+        new_records: Path to a CSV in the crashdata2011-2021.csv format, or a raw dataframe
+        source_path: Path to the base CSV the store was built from
+        cache_dir: Optional cache directory (defaults to CACHE_DIR)
+        compact: Schema to use if the store has to be built first
+
+    Returns:
+        Number of records appended
+    """
+    cache_dir = Path(cache_dir or CACHE_DIR)
+    entry = _entry_dir(source_path, cache_dir, source_fingerprint(source_path))
+    meta = _read_meta(entry, source_path)
+    if meta is None:
+        load_crash_data(source_path, cache_dir, compact=compact)
+        meta = _read_meta(entry, source_path)
+        if meta is None:
+            raise OSError(f"Could not create the crash data store at {entry}")
+
+    if isinstance(new_records, pd.DataFrame):
+        raw_df, label = new_records, '<dataframe>'
+    else:
+        raw_df, label = pd.read_csv(new_records), str(new_records)
+    new_df = _drop_known_records(raw_df, entry, meta)
+    skipped = len(raw_df) - len(new_df)
+    if new_df.empty:
+        logger.info(f"No new crash records in {label} ({skipped} already stored)")
+        return 0
+
+    processed_df = transform_crash_data(new_df.reset_index(drop=True))
+    # The delta is the durable copy; until the store commits the new size it is treated as stale
+    meta['delta_bytes'] = _append_delta(new_df, source_path)
+    with open(entry / meta['accumulator_file'], 'rb') as f:
+        accumulator = pickle.load(f).update(processed_df)
+    stats = accumulator.to_stats()
+    record = {'source': label, 'rows': len(processed_df), 'skipped': skipped,
+              'ingested_at': datetime.now().isoformat()}
+
+    try:
+        obsolete = _append_rows(entry, meta, processed_df)
+    except _SchemaMismatch as e:
+        logger.warning(f"{str(e)}; rebuilding the crash data store")
+        _rebuild_store(source_path, cache_dir, meta, processed_df, stats, accumulator, record)
+        return len(processed_df)
+
+    obsolete += _write_stats(entry, meta, stats, accumulator)
+    meta['appended'].append(record)
+    _write_json_atomic(entry / 'meta.json', meta)
+    for file_name in obsolete:
+        (entry / file_name).unlink(missing_ok=True)
+
+    logger.info(f"Appended {len(processed_df)} crash records from {label} ({skipped} already stored)")
+    return len(processed_df)
+
+def _rebuild_store(source_path, cache_dir, meta, processed_df, stats, accumulator, record):
+    """Rewrite the store with the new rows when they cannot be appended column-wise"""
+    compact = meta['compact']
+    # The store does not cover the delta's new size yet, so it is read without the freshness check
+    stored_df, _ = _read_store(_entry_dir(source_path, cache_dir, meta['fingerprint']), meta)
+    if compact:
+        processed_df = compact_crash_frame(processed_df)
+    combined_df = concat_crash_frames([stored_df, processed_df]).reset_index(drop=True)
+    if compact:
+        combined_df = compact_crash_frame(combined_df)
+
+    entry = save_processed_crash_data(combined_df, stats, source_path, cache_dir, compact=compact,
+                                      accumulator=accumulator, delta_bytes=meta['delta_bytes'])
+    rebuilt_meta = _read_meta(entry)
+    rebuilt_meta['appended'] = meta['appended'] + [record]
+    _write_json_atomic(entry / 'meta.json', rebuilt_meta)
+
+def main():
+    """Command line entry point: append new crash CSV files to the store"""
+    parser = argparse.ArgumentParser(description="Append new crash records to the processed crash data store")
+    parser.add_argument('new_records', nargs='+', help="CSV file(s) in the crashdata2011-2021.csv format")
+    parser.add_argument('--source', default=str(Path(__file__).parent / "crashdata2011-2021.csv"),
+                        help="Base crash CSV the store was built from")
+    parser.add_argument('--cache-dir', default=None, help="Cache directory (defaults to utils/.crash_cache)")
+    args = parser.parse_args()
+
+    for path in args.new_records:
+        appended = append_crash_records(path, args.source, args.cache_dir)
+        print(f"{path}: appended {appended} new crash records")
+
+if __name__ == "__main__":
+    main()
@@ -4,87 +4,271 @@ Custom data processor for handling crashdata2011-2021.csv format
 
 import pandas as pd
 import numpy as np
+import logging
+from collections import Counter
 from datetime import datetime
 
-def process_crash_data(df):
+try:
+    import pyarrow  # noqa: F401
+    ARROW_STRING_DTYPE = pd.StringDtype("pyarrow")
+except ImportError:
+    ARROW_STRING_DTYPE = None
+
+logger = logging.getLogger(__name__)
+
+# Rows per chunk for streaming ingestion
+DEFAULT_CHUNKSIZE = 50000
+
+# CrashDateTime values look like "3/14/2018 11:17:00 PM"
+CRASH_DATETIME_FORMAT = '%m/%d/%Y %I:%M:%S %p'
+
+NS_PER_HOUR = 3600 * 10**9
+NS_PER_DAY = 24 * NS_PER_HOUR
+DAY_NAMES = np.array(['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'], dtype=object)
+
+# Compact in-memory schema for the processed crash frame.
+# Low-cardinality text becomes categorical, counts and coordinates are downcast.
+CATEGORICAL_COLUMNS = [
+    'Weather', 'Lighting', 'RoadwaySurface', 'RoadwayCondition', 'CollisionType',
+    'PrimaryCollisionFactor', 'TrafficControl', 'PedestrianAction', 'ProximityToIntersection',
+    'VehicleInvolvedWith', 'PedestrianDirectionFrom', 'PedestrianDirectionTo',
+    'DirectionFromIntersection', 'Comment', 'AStreetName', 'BStreetName',
+    # Derived columns
+    'location', 'weather', 'traffic_density', 'day_of_week', 'incident_type', 'date', 'time'
+]
+# Unique-per-row identifiers stay strings (Arrow-backed when pyarrow is installed)
+STRING_COLUMNS = ['Name', 'TcrNumber', 'CrashDateTime']
+NUMERIC_SCHEMA = {
+    'MinorInjuries': 'int8',
+    'ModerateInjuries': 'int8',
+    'SevereInjuries': 'int8',
+    'FatalInjuries': 'int8',
+    'severity': 'int8',
+    'hour': 'int8',
+    'year': 'int16',
+    'CrashFactId': 'int32',
+    'IntersectionNumber': 'int32',
+    'Latitude': 'float32',
+    'Longitude': 'float32',
+    'Distance': 'float32'
+}
+
+# Severity levels in priority order: fatal, severe, moderate, minor
+INJURY_SEVERITY = [
+    ('FatalInjuries', 5),
+    ('SevereInjuries', 4),
+    ('ModerateInjuries', 3),
+    ('MinorInjuries', 2)
+]
+
+# Weather substrings mapped to our standard format, checked in order
+WEATHER_MAPPING = {
+    'Clear': 'clear',
+    'Rain': 'rain',
+    'Fog': 'fog',
+    'Snow': 'snow',
+    'Cloudy': 'cloudy',
+    'Other': 'other'
+}
+
+# Traffic density for each hour of the day (rush hours high, late night low)
+TRAFFIC_DENSITY_BY_HOUR = np.array(
+    ['low'] * 6 +                       # 0-5
+    ['medium'] +                        # 6
+    ['high'] * 3 +                      # 7-9
+    ['medium'] * 6 +                    # 10-15
+    ['high'] * 3 +                      # 16-18
+    ['medium'] * 3 +                    # 19-21
+    ['low'] * 2,                        # 22-23
+    dtype=object
+)
+
+def calculate_severity(df):
     """
-    Process the crashdata2011-2021.csv format data
+    Calculate severity (1-5) from the injury columns
     
     Args:
-        df: Loaded pandas dataframe
+        df: Dataframe with FatalInjuries/SevereInjuries/ModerateInjuries/MinorInjuries
     
     Returns:
-        Processed dataframe and stats dictionary
+        Series of severity levels (1 = property damage only, 5 = fatal)
+    """
+    conditions = [(df[column] > 0).to_numpy() for column, _ in INJURY_SEVERITY]
+    choices = [level for _, level in INJURY_SEVERITY]
+    return pd.Series(np.select(conditions, choices, default=1), index=df.index)
+
+def build_location(df):
+    """
+    Build a descriptive "A & B" location from the street name columns
+    
+    Args:
+        df: Dataframe with AStreetName and BStreetName
+    
+    Returns:
+        Series of location strings, "Unknown" when both streets are missing
+    """
+    a_street = df['AStreetName']
+    b_street = df['BStreetName']
+    a_present = a_street.notna()
+    b_present = b_street.notna()
+    
+    location = pd.Series("Unknown", index=df.index, dtype=object)
+    location[b_present] = b_street[b_present].astype(str)
+    location[a_present] = a_street[a_present].astype(str)
+    both = a_present & b_present
+    location[both] = a_street[both].astype(str) + " & " + b_street[both].astype(str)
+    return location.astype(str)
+
+def _standard_weather(value):
+    """Map a single raw weather value to our standard format"""
+    return next((v for k, v in WEATHER_MAPPING.items() if k in str(value)), 'other')
+
+def map_weather(weather):
+    """
+    Map raw weather descriptions to our standard format
+    
+    The substring rules are evaluated once per distinct value and then
+    broadcast through the factorized codes.
+    
+    Args:
+        weather: Series of raw Weather values
+    
+    Returns:
+        Series of standard weather labels
+    """
+    codes, uniques = pd.factorize(weather, use_na_sentinel=True)
+    # Trailing slot handles missing values (code -1)
+    lookup = np.array([_standard_weather(value) for value in uniques] + [_standard_weather(np.nan)], dtype=object)
+    return pd.Series(lookup[codes], index=weather.index).astype(str)
+
+def estimate_traffic_density(datetimes):
+    """
+    Estimate traffic density from the hour of the crash
+    
+    Args:
+        datetimes: Series of crash datetimes (missing values count as noon)
+    
+    Returns:
+        Series of 'low'/'medium'/'high' labels
+    """
+    hours = datetimes.dt.hour.fillna(12).to_numpy(dtype=np.int64)
+    return pd.Series(TRAFFIC_DENSITY_BY_HOUR[hours], index=datetimes.index).astype(str)
+
+def parse_crash_datetimes(values):
+    """
+    Parse CrashDateTime strings using the known export format
+    
+    Rows that do not match the format (if any) fall back to pandas'
+    per-element inference, so only the odd rows pay that cost.
+    
+    Args:
+        values: Series of CrashDateTime strings
+    
+    Returns:
+        Series of datetimes (NaT where unparseable)
+    """
+    parsed = pd.to_datetime(values, format=CRASH_DATETIME_FORMAT, errors='coerce')
+    failed = parsed.isna() & values.notna()
+    if failed.any():
+        parsed[failed] = pd.to_datetime(values[failed], format='mixed', errors='coerce')
+    return parsed
+
+def _broadcast_unique(keys, valid, build):
+    """Build Python objects once per distinct key and broadcast them to every row"""
+    result = np.full(len(keys), pd.NaT, dtype=object)
+    if valid.any():
+        uniques, inverse = np.unique(keys[valid], return_inverse=True)
+        built = np.empty(len(uniques), dtype=object)
+        built[:] = [build(key) for key in uniques]
+        result[valid] = built[inverse]
+    return result
+
+def derive_datetime_parts(datetimes):
+    """
+    Derive date, time, day_of_week, hour and year in one pass over int64 nanoseconds
+    
+    Produces the same values and dtypes as the equivalent .dt accessors.
+    
+    Args:
+        datetimes: Series of datetimes
+    
+    Returns:
+        Dict of column name -> Series
+    """
+    index = datetimes.index
+    ns = datetimes.to_numpy(dtype='datetime64[ns]').view(np.int64)
+    valid = ~datetimes.isna().to_numpy()
+    safe_ns = np.where(valid, ns, 0)
+    
+    days = safe_ns // NS_PER_DAY
+    ns_of_day = safe_ns - days * NS_PER_DAY
+    hours = (ns_of_day // NS_PER_HOUR).astype(np.int32)
+    years = days.astype('datetime64[D]').astype('datetime64[Y]').astype(np.int32) + 1970
+    # 1970-01-01 was a Thursday (Monday = 0)
+    weekdays = (days + 3) % 7
+    
+    day_of_week = DAY_NAMES[weekdays]
+    if valid.all():
+        hour = pd.Series(hours, index=index)
+        year = pd.Series(years, index=index)
+    else:
+        hour = pd.Series(np.where(valid, hours, np.nan), index=index)
+        year = pd.Series(np.where(valid, years, np.nan), index=index)
+        day_of_week = np.where(valid, day_of_week, np.nan)
+    
+    return {
+        'date': pd.Series(_broadcast_unique(days, valid, lambda d: np.datetime64(int(d), 'D').astype(object)), index=index),
+        'time': pd.Series(_broadcast_unique(ns_of_day, valid, lambda t: pd.Timestamp(int(t)).time()), index=index),
+        'day_of_week': pd.Series(day_of_week, index=index),
+        'hour': hour,
+        'year': year
+    }
+
+def transform_crash_data(df):
+    """
+    Derive our standard columns from crashdata2011-2021.csv format rows
+    
+    Args:
+        df: Loaded pandas dataframe (full file or a single chunk)
+    
+    Returns:
+        Processed copy of the dataframe
     """
     # Make a copy to avoid modifying the original
     processed_df = df.copy()
     
-    # Convert crash datetime to proper format
-    processed_df['datetime'] = pd.to_datetime(processed_df['CrashDateTime'], errors='coerce')
-    processed_df['date'] = processed_df['datetime'].dt.date
-    processed_df['time'] = processed_df['datetime'].dt.time
+    # Convert crash datetime to proper format and derive its parts in one pass
+    processed_df['datetime'] = parse_crash_datetimes(processed_df['CrashDateTime'])
+    datetime_parts = derive_datetime_parts(processed_df['datetime'])
+    processed_df['date'] = datetime_parts['date']
+    processed_df['time'] = datetime_parts['time']
     
     # Map fields to our standard format
     processed_df['incident_type'] = 'crash'  # Default incident type
     
-    # Calculate severity based on injury columns
-    def calculate_severity(row):
-        if row['FatalInjuries'] > 0:
-            return 5  # Fatal
-        elif row['SevereInjuries'] > 0:
-            return 4  # Severe
-        elif row['ModerateInjuries'] > 0:
-            return 3  # Moderate
-        elif row['MinorInjuries'] > 0:
-            return 2  # Minor
-        else:
-            return 1  # Property damage only
-    
-    processed_df['severity'] = processed_df.apply(calculate_severity, axis=1)
-    
-    # Create a more descriptive location field
-    processed_df['location'] = processed_df.apply(
-        lambda row: f"{row['AStreetName']} & {row['BStreetName']}" 
-        if pd.notna(row['AStreetName']) and pd.notna(row['BStreetName']) 
-        else row['AStreetName'] if pd.notna(row['AStreetName']) 
-        else row['BStreetName'] if pd.notna(row['BStreetName'])
-        else "Unknown", axis=1
-    )
-    
-    # Map weather condition to our standard format
-    weather_mapping = {
-        'Clear': 'clear',
-        'Rain': 'rain',
-        'Fog': 'fog',
-        'Snow': 'snow',
-        'Cloudy': 'cloudy',
-        'Other': 'other'
-    }
-    processed_df['weather'] = processed_df['Weather'].map(
-        lambda x: next((v for k, v in weather_mapping.items() if k in str(x)), 'other')
-    )
+    # Vectorized derived columns (no row-wise apply)
+    processed_df['severity'] = calculate_severity(processed_df)
+    processed_df['location'] = build_location(processed_df)
+    processed_df['weather'] = map_weather(processed_df['Weather'])
+    processed_df['traffic_density'] = estimate_traffic_density(processed_df['datetime'])
     
-    # Extract traffic density from other features
-    def estimate_traffic_density(row):
-        time = row['datetime'].hour if not pd.isna(row['datetime']) else 12
-        
-        # Rush hours typically have high traffic
-        if (7 <= time <= 9) or (16 <= time <= 18):
-            return 'high'
-        # Late night typically has low traffic
-        elif 22 <= time or time <= 5:
-            return 'low'
-        # Other times have medium traffic
-        else:
-            return 'medium'
+    # Add day of week
+    processed_df['day_of_week'] = datetime_parts['day_of_week']
+    processed_df['hour'] = datetime_parts['hour']
+    processed_df['year'] = datetime_parts['year']
     
-    processed_df['traffic_density'] = processed_df.apply(estimate_traffic_density, axis=1)
+    return processed_df
+
+def compute_crash_stats(processed_df):
+    """
+    Generate summary statistics for processed crash data
     
-    # Add day of week
-    processed_df['day_of_week'] = processed_df['datetime'].dt.day_name()
-    processed_df['hour'] = processed_df['datetime'].dt.hour
+    Args:
+        processed_df: Dataframe returned by transform_crash_data
     
-    # Generate statistics
+    Returns:
+        Stats dictionary
+    """
     stats = {
         'total_incidents': len(processed_df),
         'incident_types': {'crash': len(processed_df)},
@@ -101,8 +285,219 @@ def process_crash_data(df):
     stats['incidents_by_day'] = processed_df['day_of_week'].value_counts().to_dict()
     
     # Year stats
-    if 'datetime' in processed_df.columns:
-        processed_df['year'] = processed_df['datetime'].dt.year
-        stats['incidents_by_year'] = processed_df['year'].value_counts().sort_index().to_dict()
+    stats['incidents_by_year'] = processed_df['year'].value_counts().sort_index().to_dict()
+    
+    return stats
+
+def compact_crash_frame(df):
+    """
+    Apply the compact schema to a (processed) crash dataframe
+    
+    Columns missing from the frame are skipped, as are integer downcasts for
+    columns that contain missing values.
+    
+    Args:
+        df: Crash dataframe
+    
+    Returns:
+        New dataframe using categorical, Arrow string and downcast numeric dtypes
+    """
+    dtypes = {}
+    for column in CATEGORICAL_COLUMNS:
+        if column in df.columns and not isinstance(df[column].dtype, pd.CategoricalDtype):
+            dtypes[column] = 'category'
+    if ARROW_STRING_DTYPE is not None:
+        for column in STRING_COLUMNS:
+            if column in df.columns:
+                dtypes[column] = ARROW_STRING_DTYPE
+    for column, dtype in NUMERIC_SCHEMA.items():
+        if column not in df.columns or df[column].dtype == dtype:
+            continue
+        if np.issubdtype(np.dtype(dtype), np.integer) and df[column].isna().any():
+            continue
+        dtypes[column] = dtype
+    return df.astype(dtypes)
+
+def memory_footprint(df):
+    """
+    Report the in-memory size of a dataframe
+    
+    Args:
+        df: Dataframe to measure
+    
+    Returns:
+        Dict with total megabytes and per-column megabytes (largest first)
+    """
+    usage = df.memory_usage(deep=True, index=True)
+    columns = (usage.drop('Index') / 1e6).sort_values(ascending=False).round(3)
+    return {
+        'total_mb': round(float(usage.sum()) / 1e6, 2),
+        'columns': columns.to_dict()
+    }
+
+def process_crash_data(df, compact=False):
+    """
+    Process the crashdata2011-2021.csv format data
+    
+    Args:
+        df: Loaded pandas dataframe
+        compact: Apply the compact schema to the processed dataframe
+    
+    Returns:
+        Processed dataframe and stats dictionary
+    """
+    processed_df = transform_crash_data(df)
+    stats = compute_crash_stats(processed_df)
+    
+    if compact:
+        before = memory_footprint(processed_df)['total_mb']
+        processed_df = compact_crash_frame(processed_df)
+        after = memory_footprint(processed_df)['total_mb']
+        logger.info(f"Compacted crash data from {before} MB to {after} MB")
     
     return processed_df, stats
+
+def concat_crash_frames(frames):
+    """
+    Concatenate crash dataframes, unioning categorical columns
+    
+    Plain pd.concat falls back to object dtype when categories differ
+    between chunks; this keeps them categorical.
+    
+    Args:
+        frames: List of dataframes with the same columns
+    
+    Returns:
+        Concatenated dataframe
+    """
+    columns = {}
+    for column in frames[0].columns:
+        parts = [frame[column] for frame in frames]
+        if all(isinstance(part.dtype, pd.CategoricalDtype) for part in parts):
+            combined = pd.api.types.union_categoricals(parts)
+            index = pd.concat([part.index.to_series() for part in parts]).index
+            columns[column] = pd.Series(combined, index=index)
+        else:
+            columns[column] = pd.concat(parts)
+    return pd.DataFrame(columns)
+
+class CrashStatsAccumulator:
+    """
+    Mergeable accumulator for the process_crash_data stats dictionary
+    
+    Each chunk is folded in with update(); accumulators built over separate
+    chunks (or files) combine with merge(). Memory grows with the number of
+    distinct values per column, not with the number of rows.
+    """
+    # Stats key -> (column, how many entries to keep, sort by key instead of count)
+    COUNTED_COLUMNS = {
+        'locations': ('location', 10, False),
+        'severity_distribution': ('severity', None, False),
+        'weather_distribution': ('weather', None, False),
+        'collisions_by_type': ('CollisionType', None, False),
+        'factors': ('PrimaryCollisionFactor', 5, False),
+        'incidents_by_hour': ('hour', None, True),
+        'incidents_by_day': ('day_of_week', None, False),
+        'incidents_by_year': ('year', None, True)
+    }
+    
+    def __init__(self):
+        self.total_incidents = 0
+        self.counters = {key: Counter() for key in self.COUNTED_COLUMNS}
+    
+    def update(self, processed_chunk):
+        """
+        Fold a processed chunk into the running counts
+        
+        Args:
+            processed_chunk: Dataframe returned by transform_crash_data
+        
+        Returns:
+            self, so calls can be chained
+        """
+        self.total_incidents += len(processed_chunk)
+        for key, (column, _, _) in self.COUNTED_COLUMNS.items():
+            # sort=False keeps first-occurrence order for stable tie-breaking
+            counts = processed_chunk[column].value_counts(sort=False)
+            # Categorical columns report unobserved categories as zero
+            counts = counts[counts > 0]
+            self.counters[key].update(counts.to_dict())
+        return self
+    
+    def merge(self, other):
+        """
+        Combine another accumulator's counts into this one
+        
+        Args:
+            other: CrashStatsAccumulator built over different rows
+        
+        Returns:
+            self, so calls can be chained
+        """
+        self.total_incidents += other.total_incidents
+        for key, counter in other.counters.items():
+            self.counters[key].update(counter)
+        return self
+    
+    def to_stats(self):
+        """
+        Build the stats dictionary in the same shape as process_crash_data
+        
+        Returns:
+            Stats dictionary
+        """
+        stats = {
+            'total_incidents': self.total_incidents,
+            'incident_types': {'crash': self.total_incidents}
+        }
+        for key, (_, limit, by_key) in self.COUNTED_COLUMNS.items():
+            items = self.counters[key].items()
+            if by_key:
+                ordered = sorted(items, key=lambda item: item[0])
+            else:
+                ordered = sorted(items, key=lambda item: item[1], reverse=True)
+            stats[key] = dict(ordered[:limit] if limit else ordered)
+        return stats
+
+def iter_crash_chunks(source, chunksize=DEFAULT_CHUNKSIZE, **read_csv_kwargs):
+    """
+    Read a crash CSV in chunks and yield each processed chunk
+    
+    Args:
+        source: Path or buffer of a crashdata2011-2021.csv format file
+        chunksize: Number of rows per chunk
+        **read_csv_kwargs: Extra arguments passed to pd.read_csv
+    
+    Yields:
+        Processed dataframe for each chunk
+    """
+    for chunk in pd.read_csv(source, chunksize=chunksize, **read_csv_kwargs):
+        yield transform_crash_data(chunk)
+
+def process_crash_data_streaming(source, chunksize=DEFAULT_CHUNKSIZE, keep_columns=None, compact=False):
+    """
+    Process a crash CSV chunk by chunk with incremental statistics
+    
+    Only one raw chunk and its processed copy are alive at a time, so peak
+    memory is bounded by the chunk size plus whatever is kept.
+    
+    Args:
+        source: Path or buffer of a crashdata2011-2021.csv format file
+        chunksize: Number of rows per chunk
+        keep_columns: Processed columns to retain; None keeps only the stats
+        compact: Apply the compact schema to each kept chunk
+    
+    Returns:
+        Tuple of (dataframe of kept columns or None, stats dictionary)
+    """
+    accumulator = CrashStatsAccumulator()
+    kept_chunks = []
+    
+    for processed_chunk in iter_crash_chunks(source, chunksize=chunksize):
+        accumulator.update(processed_chunk)
+        if keep_columns is not None:
+            kept_chunk = processed_chunk[list(keep_columns)]
+            kept_chunks.append(compact_crash_frame(kept_chunk) if compact else kept_chunk)
+    
+    kept_df = concat_crash_frames(kept_chunks) if kept_chunks else None
+    return kept_df, accumulator.to_stats()
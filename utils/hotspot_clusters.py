@@ -0,0 +1,301 @@
+"""
+Density-based crash hotspot detection for San Jose Safe Commute
+Clusters crash locations by grid density (a grid form of DBSCAN): cells with
+enough crashes are dense, touching dense cells form one hotspot (cells next
+to it join as its border), and each hotspot's severity and peak times come
+from a single grouped pass
+"""
+
+import pandas as pd
+import numpy as np
+import logging
+import sys
+from pathlib import Path
+
+# Add parent directory to import path
+parent_dir = str(Path(__file__).parent.parent)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from utils.crash_spatial_index import CrashSpatialIndex, unproject
+from utils.custom_data_processor import DAY_NAMES
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Clustering grid cell edge length in meters
+CLUSTER_CELL_SIZE_M = 100.0
+
+# Crashes a cell needs to count as dense
+MIN_CELL_CRASHES = 15
+
+# Largest group x code table _modal_codes counts densely with np.bincount
+MAX_DENSE_MODE_CELLS = 1 << 22
+
+# Forward neighbour offsets; with their mirror images they cover all 8 neighbours
+NEIGHBOUR_OFFSETS = [(1, 0), (0, 1), (1, 1), (-1, 1)]
+
+def _connected_labels(n_nodes, left, right):
+    """
+    Label the connected components of an undirected graph given as an edge list
+
+    Uses min-label propagation with pointer jumping, which converges in a few
+    rounds for the small, compact components dense cells form.
+
+    Args:
+        n_nodes: Number of nodes
+        left: First node of each edge
+        right: Second node of each edge
+
+    Returns:
+        Array with the smallest node number of each node's component
+    """
+    labels = np.arange(n_nodes)
+    while True:
+        updated = labels.copy()
+        np.minimum.at(updated, left, labels[right])
+        np.minimum.at(updated, right, labels[left])
+        updated = updated[updated]
+        if np.array_equal(updated, labels):
+            return labels
+        labels = updated
+
+def _modal_codes(groups, codes, n_groups):
+    """
+    Most frequent non-negative code per group
+
+    Ties go to the code that appears first, matching value_counts().idxmax().
+
+    Args:
+        groups: Group number per row
+        codes: Category code per row (-1 for missing)
+        n_groups: Number of groups
+
+    Returns:
+        Array of modal codes per group, -1 where a group has no codes
+    """
+    valid = codes >= 0
+    groups, codes = groups[valid], codes[valid].astype(np.int64)
+    modal = np.full(n_groups, -1, dtype=np.int64)
+    if len(codes) == 0:
+        return modal
+    width = codes.max() + 1
+    keys = groups * width + codes
+
+    if n_groups * width <= MAX_DENSE_MODE_CELLS:
+        # Dense table: score each (group, code) by count, breaking ties by earliest row
+        counts = np.bincount(keys, minlength=n_groups * width)
+        first_seen = np.full(n_groups * width, len(keys), dtype=np.int64)
+        np.minimum.at(first_seen, keys, np.arange(len(keys)))
+        score = (counts * (len(keys) + 1) - first_seen).reshape(n_groups, width)
+        best = score.argmax(axis=1)
+        has_codes = counts.reshape(n_groups, width).any(axis=1)
+        modal[has_codes] = best[has_codes]
+        return modal
+
+    pairs, first_seen, counts = np.unique(keys, return_index=True, return_counts=True)
+    pair_groups, pair_codes = pairs // width, pairs % width
+    # Highest count first, then earliest appearance, within each group
+    order = np.lexsort((first_seen, -counts, pair_groups))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = pair_groups[order][1:] != pair_groups[order][:-1]
+    modal[pair_groups[order][first]] = pair_codes[order][first]
+    return modal
+
+def _category_codes(series):
+    """
+    Integer codes and labels for a column, reusing categorical codes when available
+
+    Args:
+        series: Column to encode
+
+    Returns:
+        Tuple of (int64 codes with -1 for missing, labels)
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.codes.to_numpy().astype(np.int64), series.cat.categories
+    codes, labels = pd.factorize(series.to_numpy())
+    return codes.astype(np.int64), labels
+
+def location_hotspot_profiles(df, top=None):
+    """
+    Profile crash locations in one grouped pass
+
+    Every location gets its crash count, mean severity, peak hour and peak
+    day from bincounts over the location codes, instead of one boolean mask
+    and value_counts per location.
+
+    Args:
+        df: Processed crash dataframe with a location column (severity and
+            datetime are used when present)
+        top: Number of locations to return, busiest first (all when None)
+
+    Returns:
+        List of dicts with location, crash_count, avg_severity, peak_hour and peak_day
+    """
+    codes, names = _category_codes(df['location'])
+    n_locations = len(names)
+
+    valid = codes >= 0
+    counts = np.bincount(codes[valid], minlength=n_locations)
+    # Busiest first; ties keep value_counts order (first appearance, or category order)
+    ranked = np.argsort(-counts, kind='stable')
+    ranked = ranked[counts[ranked] > 0]
+    if top is not None:
+        ranked = ranked[:top]
+
+    avg_severity = None
+    if 'severity' in df.columns:
+        severity = df['severity'].to_numpy(dtype=np.float64)
+        has_severity = valid & ~np.isnan(severity)
+        severity_sum = np.bincount(codes[has_severity], weights=severity[has_severity], minlength=n_locations)
+        severity_n = np.bincount(codes[has_severity], minlength=n_locations)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            avg_severity = severity_sum / severity_n
+
+    peak_hours = peak_days = None
+    if 'datetime' in df.columns:
+        datetimes = df['datetime']
+        has_time = valid & datetimes.notna().to_numpy()
+        hours = np.where(has_time, datetimes.dt.hour.to_numpy(dtype=np.float64, na_value=-1), -1).astype(np.int64)
+        days = np.where(has_time, datetimes.dt.dayofweek.to_numpy(dtype=np.float64, na_value=-1), -1).astype(np.int64)
+        peak_hours = _modal_codes(codes[valid], hours[valid], n_locations)
+        peak_days = _modal_codes(codes[valid], days[valid], n_locations)
+
+    # Gather the ranked rows as plain Python values in bulk rather than per element
+    n_ranked = len(ranked)
+    location_names = np.asarray(names, dtype=object)[ranked].tolist()
+    crash_counts = counts[ranked].tolist()
+    severities = [None] * n_ranked
+    if avg_severity is not None:
+        rounded = np.round(avg_severity[ranked], 1)
+        severities = [None if np.isnan(value) else value for value in rounded.tolist()]
+    hours = [None] * n_ranked
+    days = [None] * n_ranked
+    if peak_hours is not None:
+        hours = [None if value < 0 else value for value in peak_hours[ranked].tolist()]
+        days = [None if value < 0 else DAY_NAMES[value] for value in peak_days[ranked].tolist()]
+
+    profiles = [
+        {"location": location, "crash_count": count, "avg_severity": severity, "peak_hour": hour, "peak_day": day}
+        for location, count, severity, hour, day in zip(location_names, crash_counts, severities, hours, days)
+    ]
+    return profiles
+
+def detect_hotspot_clusters(df, spatial_index=None, cell_size_m=CLUSTER_CELL_SIZE_M,
+                            min_cell_crashes=MIN_CELL_CRASHES, top=None):
+    """
+    Cluster crash locations into ranked hotspots
+
+    Args:
+        df: Processed crash dataframe (Latitude, Longitude, severity, hour,
+            day_of_week and location columns are used when present)
+        spatial_index: CrashSpatialIndex built from df (built here if omitted)
+        cell_size_m: Clustering grid cell edge length in meters
+        min_cell_crashes: Crashes a cell needs to be part of a hotspot
+        top: Number of hotspots to return (all when None)
+
+    Returns:
+        List of hotspot dicts ranked by crash count
+    """
+    index = spatial_index if spatial_index is not None else CrashSpatialIndex.from_frame(df)
+    if len(index) == 0:
+        return []
+
+    # Occupied cells of the clustering grid
+    cx = ((index.x - index.origin_x) // cell_size_m).astype(np.int64)
+    cy = ((index.y - index.origin_y) // cell_size_m).astype(np.int64)
+    width = int(cx.max()) + 2
+    cell_keys, point_cell, cell_counts = np.unique(cy * width + cx, return_inverse=True, return_counts=True)
+
+    dense = cell_counts >= min_cell_crashes
+    dense_keys = cell_keys[dense]
+    if len(dense_keys) == 0:
+        return []
+
+    # Join touching dense cells
+    left, right = [], []
+    for dx, dy in NEIGHBOUR_OFFSETS:
+        neighbours = dense_keys + dy * width + dx
+        found = np.searchsorted(dense_keys, neighbours)
+        found = np.minimum(found, len(dense_keys) - 1)
+        hit = dense_keys[found] == neighbours
+        left.append(np.flatnonzero(hit))
+        right.append(found[hit])
+    component = _connected_labels(len(dense_keys), np.concatenate(left), np.concatenate(right))
+    _, dense_cluster = np.unique(component, return_inverse=True)
+
+    # Cluster number per cell: dense cells first, then sparse cells touching one (-1 elsewhere)
+    cell_cluster = np.full(len(cell_keys), -1, dtype=np.int64)
+    cell_cluster[dense] = dense_cluster
+    sparse = np.flatnonzero(~dense)
+    for dx, dy in NEIGHBOUR_OFFSETS + [(-dx, -dy) for dx, dy in NEIGHBOUR_OFFSETS]:
+        unassigned = sparse[cell_cluster[sparse] < 0]
+        neighbours = cell_keys[unassigned] + dy * width + dx
+        found = np.minimum(np.searchsorted(dense_keys, neighbours), len(dense_keys) - 1)
+        hit = dense_keys[found] == neighbours
+        cell_cluster[unassigned[hit]] = dense_cluster[found[hit]]
+    point_cluster = cell_cluster[point_cell]
+    in_cluster = point_cluster >= 0
+    clusters = point_cluster[in_cluster]
+    positions = index.positions[in_cluster]
+    n_clusters = int(clusters.max()) + 1
+
+    # Single grouped pass for every per-cluster statistic
+    counts = np.bincount(clusters, minlength=n_clusters)
+    x_mean = np.bincount(clusters, weights=index.x[in_cluster], minlength=n_clusters) / counts
+    y_mean = np.bincount(clusters, weights=index.y[in_cluster], minlength=n_clusters) / counts
+    spread = np.hypot(index.x[in_cluster] - x_mean[clusters], index.y[in_cluster] - y_mean[clusters])
+    radius = np.zeros(n_clusters)
+    np.maximum.at(radius, clusters, spread)
+    n_cells = np.bincount(cell_cluster[cell_cluster >= 0], minlength=n_clusters)
+
+    severity = None
+    if 'severity' in df.columns:
+        severity = df['severity'].to_numpy(dtype=np.float64)[positions]
+        severity_sum = np.bincount(clusters, weights=np.nan_to_num(severity), minlength=n_clusters)
+        severity_n = np.bincount(clusters, weights=~np.isnan(severity), minlength=n_clusters)
+        severe = np.bincount(clusters, weights=severity >= 4, minlength=n_clusters)
+
+    peak_hours = np.full(n_clusters, -1, dtype=np.int64)
+    if 'hour' in df.columns:
+        hours = df['hour'].to_numpy(dtype=np.float64)[positions]
+        peak_hours = _modal_codes(clusters, np.where(np.isnan(hours), -1, hours).astype(np.int64), n_clusters)
+
+    peak_days = np.full(n_clusters, -1, dtype=np.int64)
+    if 'day_of_week' in df.columns:
+        day_codes = pd.Categorical(df['day_of_week'], categories=DAY_NAMES).codes.astype(np.int64)
+        peak_days = _modal_codes(clusters, day_codes[positions], n_clusters)
+
+    top_locations = None
+    if 'location' in df.columns:
+        location_codes, location_names = _category_codes(df['location'])
+        top_locations = _modal_codes(clusters, location_codes[positions], n_clusters)
+
+    lats, lngs = unproject(x_mean, y_mean)
+    ranked = np.lexsort((np.arange(n_clusters), -counts))
+    if top is not None:
+        ranked = ranked[:top]
+
+    hotspots = []
+    for rank, c in enumerate(ranked, start=1):
+        avg_severity = None
+        if severity is not None and severity_n[c] > 0:
+            avg_severity = float(round(severity_sum[c] / severity_n[c], 1))
+        hotspots.append({
+            "cluster_id": rank,
+            "location": location_names[top_locations[c]] if top_locations is not None and top_locations[c] >= 0 else None,
+            "lat": round(float(lats[c]), 6),
+            "lng": round(float(lngs[c]), 6),
+            "crash_count": int(counts[c]),
+            "avg_severity": avg_severity,
+            "severe_crashes": int(severe[c]) if severity is not None else None,
+            "peak_hour": int(peak_hours[c]) if peak_hours[c] >= 0 else None,
+            "peak_day": DAY_NAMES[peak_days[c]] if peak_days[c] >= 0 else None,
+            "radius_m": round(float(radius[c]), 1),
+            "cells": int(n_cells[c])
+        })
+
+    logger.info(f"Found {n_clusters} crash hotspots covering {len(clusters)} of {len(index)} crashes")
+    return hotspots
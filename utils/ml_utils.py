@@ -17,12 +17,25 @@ parent_dir = str(Path(__file__).parent.parent)
 if parent_dir not in sys.path:
     sys.path.append(parent_dir)
 
-from ml_models import safety_model, risk_classifier, generate_time_predictions
+from utils.route_corridor import analyze_route_crashes
+from utils.hotspot_clusters import detect_hotspot_clusters, location_hotspot_profiles
+from utils.crash_dataset import crash_dataset
+from utils.crash_risk_surface import route_risk_profile
+from utils.prediction_table import predict_safety, predict_risk, predict_time_periods
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Hours of the day covered by each time-of-day option ("Current Time" uses the current hour)
+TIME_OF_DAY_HOURS = {
+    "Early Morning (5-7 AM)": (5, 6),
+    "Morning Commute (7-9 AM)": (7, 8),
+    "Midday (11 AM-1 PM)": (11, 12),
+    "Evening Commute (4-6 PM)": (16, 17),
+    "Late Night (10 PM-12 AM)": (22, 23)
+}
+
 def get_safety_time_predictions(origin, destination, current_safety_score, risk_factors):
     """
     Generate safety predictions for different times of day using ML models
@@ -43,7 +56,7 @@ def get_safety_time_predictions(origin, destination, current_safety_score, risk_
         features['destination'] = destination
         
         # Generate predictions
-        predictions = generate_time_predictions(safety_model, features, current_safety_score)
+        predictions = predict_time_periods(features, current_safety_score)
         return predictions
         
     except Exception as e:
@@ -59,7 +72,69 @@ def get_safety_time_predictions(origin, destination, current_safety_score, risk_
             "Late Night (10 PM-5 AM)": max(current_safety_score - 0.8, 1.0)
         }
 
-def predict_route_safety(origin, destination, time_of_day, weather, traffic_density, mode):
+def add_route_crash_history(analysis, route_coords):
+    """
+    Add the historical crashes along a route to a safety analysis
+    
+    Args:
+        analysis: Safety analysis dictionary (updated in place)
+        route_coords: List of [lat, lng] route points
+        
+    Returns:
+        The updated analysis dictionary
+    """
+    try:
+        route_crashes = analyze_route_crashes(route_coords)
+    except Exception as e:
+        logger.warning(f"Route crash history unavailable: {str(e)}")
+        return analysis
+    
+    summary = route_crashes['summary']
+    analysis['route_crashes'] = summary
+    analysis['hotspots'] = route_crashes['hotspots']
+    
+    if summary['high_density'] and not any(alert['type'] == "High Risk Area" for alert in analysis.get('alerts', [])):
+        analysis.setdefault('alerts', []).append({
+            "type": "High Risk Area",
+            "description": (f"{summary['crash_count']} crashes were recorded within {summary['buffer_m']:.0f} m "
+                            f"of this route ({summary['crashes_per_km']} per km)")
+        })
+    analysis.setdefault('top_reasons', []).append(
+        f"{summary['crash_count']} past crashes along this route ({summary['severe_crashes']} severe or fatal)"
+    )
+    return analysis
+
+def add_route_risk_surface(analysis, route_coords, time_of_day, weather, mode):
+    """
+    Add the crash density along a route, for matching conditions, to a safety analysis
+    
+    Args:
+        analysis: Safety analysis dictionary (updated in place)
+        route_coords: List of [lat, lng] route points
+        time_of_day: Selected time of day
+        weather: Weather conditions
+        mode: Transportation mode
+        
+    Returns:
+        The updated analysis dictionary
+    """
+    try:
+        hours = TIME_OF_DAY_HOURS.get(time_of_day, (datetime.now().hour,))
+        surface = crash_dataset.get_risk_surfaces().surface(mode=mode, hour=hours, weather=weather)
+        profile = route_risk_profile(surface, route_coords)
+    except Exception as e:
+        logger.warning(f"Route risk surface unavailable: {str(e)}")
+        return analysis
+    
+    profile['matching_crashes'] = surface.n_crashes
+    analysis['risk_surface'] = profile
+    if profile['high_risk_share'] >= 0.25:
+        analysis.setdefault('top_reasons', []).append(
+            f"{profile['high_risk_share']:.0%} of this route runs through crash-dense areas for these conditions"
+        )
+    return analysis
+
+def predict_route_safety(origin, destination, time_of_day, weather, traffic_density, mode, route_coords=None):
     """
     Use ML models to predict route safety score and risk factors
     
@@ -70,6 +145,8 @@ def predict_route_safety(origin, destination, time_of_day, weather, traffic_dens
         weather: Weather conditions
         traffic_density: Traffic density level (0-10)
         mode: Transportation mode
+        route_coords: Optional list of [lat, lng] route points; adds the
+            historical crashes along the route and their hotspots
         
     Returns:
         Dictionary with safety analysis
@@ -89,15 +166,15 @@ def predict_route_safety(origin, destination, time_of_day, weather, traffic_dens
             'transport_mode': mode
         }
         
-        # Get safety score prediction
-        safety_score = safety_model.predict(features)
+        # Get safety score prediction (a table lookup for the app's discrete inputs)
+        safety_score = predict_safety(features)
         safety_score = round(float(safety_score), 1)
         
         # Get risk classification
-        risk_prediction = risk_classifier.predict_risk(features)
+        risk_prediction = predict_risk(features)
         
         # Generate time-based predictions
-        time_predictions = generate_time_predictions(safety_model, features, safety_score)
+        time_predictions = predict_time_periods(features, safety_score)
         
         # Determine safety category
         if safety_score >= 8.0:
@@ -152,13 +229,17 @@ def predict_route_safety(origin, destination, time_of_day, weather, traffic_dens
             "ai_powered": True
         }
         
+        if route_coords is not None:
+            add_route_crash_history(analysis, route_coords)
+            add_route_risk_surface(analysis, route_coords, time_of_day, weather, mode)
+        
         return analysis
         
     except Exception as e:
         logger.error(f"Error in predict_route_safety: {str(e)}")
         
         # Return a basic fallback analysis
-        return {
+        fallback = {
             "safety_score": 7.0,
             "color": "yellow",
             "safety_category": "medium",
@@ -185,64 +266,47 @@ def predict_route_safety(origin, destination, time_of_day, weather, traffic_dens
             ],
             "ai_powered": False
         }
+        
+        if route_coords is not None:
+            add_route_crash_history(fallback, route_coords)
+            add_route_risk_surface(fallback, route_coords, time_of_day, weather, mode)
+        
+        return fallback
 
-def analyze_accident_hotspots(df):
+def analyze_accident_hotspots(df, top=10, spatial_index=None, method=None):
     """
-    Use ML to identify and analyze accident hotspots from crash data
+    Identify and analyze accident hotspots from crash data
     
     Args:
         df: DataFrame with crash data
+        top: Number of hotspots to return (all when None)
+        spatial_index: Optional CrashSpatialIndex built from df
+        method: 'density_clusters' to cluster crash coordinates or 'locations'
+            to profile each location string; defaults to clusters when the
+            data has coordinates
         
     Returns:
         Dictionary with hotspot analysis
     """
     try:
         # Ensure we have the necessary columns
-        if df is None or len(df) == 0 or 'location' not in df.columns:
+        if df is None or len(df) == 0:
             return {"hotspots": [], "error": "Insufficient data for hotspot analysis"}
         
-        # Group crashes by location
-        location_counts = df['location'].value_counts()
-        
-        # Get top 10 hotspots
-        top_hotspots = location_counts.head(10)
+        if method is None:
+            method = "density_clusters" if {'Latitude', 'Longitude'}.issubset(df.columns) else "locations"
         
-        # Create hotspot objects
-        hotspots = []
-        for location, count in top_hotspots.items():
-            # Filter for crashes at this location
-            location_crashes = df[df['location'] == location]
-            
-            # Calculate average severity at this location
-            avg_severity = location_crashes['severity'].mean() if 'severity' in location_crashes.columns else None
-            
-            # Calculate most common times
-            if 'datetime' in location_crashes.columns:
-                # Extract hour
-                location_crashes['hour'] = location_crashes['datetime'].dt.hour
-                peak_hour = location_crashes['hour'].value_counts().idxmax()
-                
-                # Extract day of week
-                location_crashes['day'] = location_crashes['datetime'].dt.day_name()
-                peak_day = location_crashes['day'].value_counts().idxmax()
-            else:
-                peak_hour = None
-                peak_day = None
-            
-            # Build hotspot object
-            hotspot = {
-                "location": location,
-                "crash_count": int(count),
-                "avg_severity": float(round(avg_severity, 1)) if avg_severity is not None else None,
-                "peak_hour": int(peak_hour) if peak_hour is not None else None,
-                "peak_day": peak_day
-            }
-            
-            hotspots.append(hotspot)
+        if method == "density_clusters":
+            hotspots = detect_hotspot_clusters(df, spatial_index=spatial_index, top=top)
+        elif method == "locations" and 'location' in df.columns:
+            hotspots = location_hotspot_profiles(df, top=top)
+        else:
+            return {"hotspots": [], "error": "Insufficient data for hotspot analysis"}
         
         # Return analysis
         return {
             "hotspots": hotspots,
+            "method": method,
             "total_analyzed": len(df),
             "analysis_timestamp": datetime.now().isoformat()
         }
@@ -0,0 +1,459 @@
+"""
+Offline geocoder for San Jose Safe Commute
+Builds a street and intersection index from the crash records (street names,
+intersection numbers and coordinates) so addresses like "Blossom Hill Rd &
+Monterey Rd" resolve locally, with a prefix trie for type-ahead suggestions
+and trigram matching for misspelled street names
+"""
+
+import numpy as np
+import pandas as pd
+import logging
+import re
+import sys
+from pathlib import Path
+
+# Add parent directory to import path
+parent_dir = str(Path(__file__).parent.parent)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from utils.crash_spatial_index import project, valid_coordinates
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Downtown San Jose, returned by callers when nothing matches
+DEFAULT_COORDS = [37.3382, -121.8863]
+
+# Named places that are not street intersections (normalized name -> [lat, lng])
+LANDMARKS = {
+    "downtown san jose": [37.3382, -121.8863],
+    "santana row": [37.3209, -121.9476],
+    "san jose state university": [37.3352, -121.8811],
+    "san jose international airport": [37.3639, -121.9289],
+    "willow glen": [37.3094, -121.8990],
+    "japantown": [37.3480, -121.8950],
+    "east san jose": [37.3509, -121.8121],
+    "north san jose": [37.3871, -121.9334],
+    "south san jose": [37.2424, -121.8747],
+    "west san jose": [37.3239, -121.9769],
+    "san jose city hall": [37.3374, -121.8862],
+    "winchester mystery house": [37.3184, -121.9511],
+    "valley fair mall": [37.3261, -121.9465],
+    "communications hill": [37.2924, -121.8583],
+    "alum rock": [37.3772, -121.8244]
+}
+
+# Street type words -> the abbreviation used in the crash data
+SUFFIX_ALIASES = {
+    'street': 'st', 'st': 'st',
+    'avenue': 'av', 'ave': 'av', 'av': 'av',
+    'road': 'rd', 'rd': 'rd',
+    'drive': 'dr', 'dr': 'dr',
+    'way': 'wy', 'wy': 'wy',
+    'court': 'ct', 'ct': 'ct',
+    'lane': 'ln', 'ln': 'ln',
+    'place': 'pl', 'pl': 'pl',
+    'circle': 'ci', 'cir': 'ci', 'ci': 'ci',
+    'boulevard': 'bl', 'blvd': 'bl', 'bl': 'bl',
+    'parkway': 'pw', 'pkwy': 'pw', 'pw': 'pw',
+    'expressway': 'ex', 'expy': 'ex', 'expwy': 'ex', 'ex': 'ex',
+    'freeway': 'fw', 'fwy': 'fw', 'fw': 'fw',
+    'highway': 'hw', 'hwy': 'hw', 'hw': 'hw',
+    'loop': 'lp', 'lp': 'lp',
+    'square': 'sq', 'sq': 'sq',
+    'driveway': 'dw', 'dw': 'dw'
+}
+
+# Leading direction words dropped from input (the crash data has no directional prefixes)
+DIRECTIONS = {'n', 's', 'e', 'w', 'north', 'south', 'east', 'west'}
+
+# Separators between the two streets of an intersection
+INTERSECTION_SEPARATOR = re.compile(r'\s*(?:&|@|\band\b|\bat\b)\s*')
+
+# Number of suggestions kept at every trie node
+SUGGESTION_LIMIT = 8
+
+# Minimum trigram Dice similarity for a fuzzy street match
+FUZZY_MIN_SCORE = 0.45
+
+_ORDINAL_UNITS = ['', 'first', 'second', 'third', 'fourth', 'fifth', 'sixth', 'seventh', 'eighth', 'ninth',
+                  'tenth', 'eleventh', 'twelfth', 'thirteenth', 'fourteenth', 'fifteenth', 'sixteenth',
+                  'seventeenth', 'eighteenth', 'nineteenth']
+_CARDINAL_TENS = {2: 'twenty', 3: 'thirty', 4: 'forty', 5: 'fifty'}
+_ORDINAL_TENS = {2: 'twentieth', 3: 'thirtieth', 4: 'fortieth', 5: 'fiftieth'}
+
+def _ordinal_words(number):
+    """Spelled-out ordinal tokens for 1-59 (e.g. 23 -> ['twenty', 'third']), as the crash data writes them"""
+    if number < 20:
+        return [_ORDINAL_UNITS[number]]
+    tens, units = divmod(number, 10)
+    if units == 0:
+        return [_ORDINAL_TENS[tens]]
+    return [_CARDINAL_TENS[tens], _ORDINAL_UNITS[units]]
+
+def normalize_street(text, partial=False):
+    """
+    Normalize a street name to crash-data tokens
+
+    Lowercases, drops punctuation, house numbers and leading directions,
+    spells out ordinals ("1st" -> "first") and abbreviates street types
+    ("Avenue" -> "av").
+
+    Args:
+        text: Street name as typed
+        partial: Leave the last token alone (it may be an unfinished word)
+
+    Returns:
+        List of tokens
+    """
+    tokens = re.sub(r"[^a-z0-9/ ]+", " ", str(text).lower().replace("'", "")).split()
+    if len(tokens) > 1 and tokens[0].isdigit():
+        tokens = tokens[1:]
+    if len(tokens) > 1 and tokens[0] in DIRECTIONS:
+        tokens = tokens[1:]
+
+    normalized = []
+    for i, token in enumerate(tokens):
+        last = i == len(tokens) - 1
+        ordinal = re.fullmatch(r'(\d+)(st|nd|rd|th)', token)
+        if ordinal and 0 < int(ordinal.group(1)) < 60 and not (partial and last):
+            normalized.extend(_ordinal_words(int(ordinal.group(1))))
+        elif i > 0 and token in SUFFIX_ALIASES and not (partial and last):
+            normalized.append(SUFFIX_ALIASES[token])
+        else:
+            normalized.append(token)
+    return normalized
+
+def _trigrams(key):
+    """Character trigrams of a normalized name, padded so word starts count"""
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def _display_name(name):
+    """Title-case an upper-case crash-data street name"""
+    return re.sub(r"[A-Za-z]+", lambda match: match.group(0).capitalize(), str(name))
+
+class _TrieNode:
+    __slots__ = ('children', 'top')
+
+    def __init__(self):
+        self.children = {}
+        self.top = []
+
+class OfflineGeocoder:
+    """
+    Street and intersection lookup built from the crash records
+
+    Streets are indexed by their normalized name, by their name without the
+    street type, by every word-start suffix in a prefix trie (each node keeps
+    its busiest streets for type-ahead) and by character trigrams for fuzzy
+    matches. Intersections are keyed by their pair of street ids.
+    """
+    def __init__(self, street_names, street_counts, pair_a, pair_b, lat, lng, counts, landmarks=None):
+        self.street_names = list(street_names)
+        self.street_counts = np.asarray(street_counts, dtype=np.int64)
+        self.pair_a = np.asarray(pair_a, dtype=np.int64)
+        self.pair_b = np.asarray(pair_b, dtype=np.int64)
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lng = np.asarray(lng, dtype=np.float64)
+        self.counts = np.asarray(counts, dtype=np.int64)
+        self.landmarks = dict(LANDMARKS if landmarks is None else landmarks)
+        self._build_indexes()
+
+    @classmethod
+    def from_frame(cls, df):
+        """
+        Build the geocoder from a crash dataframe
+
+        Args:
+            df: Crash dataframe with AStreetName, BStreetName, IntersectionNumber,
+                Latitude and Longitude columns
+
+        Returns:
+            OfflineGeocoder instance
+        """
+        located = valid_coordinates(df['Latitude'].to_numpy(), df['Longitude'].to_numpy())
+        frame = pd.DataFrame({
+            'a': df['AStreetName'].astype(object).to_numpy()[located],
+            'b': df['BStreetName'].astype(object).to_numpy()[located],
+            'number': df['IntersectionNumber'].to_numpy()[located],
+            'lat': df['Latitude'].to_numpy(dtype=np.float64)[located],
+            'lng': df['Longitude'].to_numpy(dtype=np.float64)[located]
+        })
+        frame = frame[frame['a'].notna() & frame['b'].notna()]
+
+        # One row per intersection number, busiest first
+        intersections = frame.groupby('number', sort=False).agg(
+            a=('a', 'first'), b=('b', 'first'), lat=('lat', 'first'), lng=('lng', 'first'), count=('a', 'size'))
+        intersections = intersections.sort_values('count', ascending=False, kind='stable')
+
+        street_codes, street_names = pd.factorize(pd.concat([intersections['a'], intersections['b']]).to_numpy())
+        n = len(intersections)
+        pair_a, pair_b = street_codes[:n], street_codes[n:]
+        street_counts = np.bincount(np.concatenate([pair_a, pair_b]),
+                                    weights=np.tile(intersections['count'].to_numpy(), 2), minlength=len(street_names))
+
+        geocoder = cls(street_names, street_counts, pair_a, pair_b, intersections['lat'].to_numpy(),
+                       intersections['lng'].to_numpy(), intersections['count'].to_numpy())
+        logger.info(f"Built offline geocoder over {len(street_names)} streets and {n} intersections")
+        return geocoder
+
+    def _build_indexes(self):
+        """Build the name, core-name, trie, trigram and intersection-pair indexes"""
+        self.street_keys = [" ".join(normalize_street(name)) for name in self.street_names]
+        self._by_key = {}
+        self._by_core = {}
+        self._trigram_postings = {}
+        self._trigram_counts = np.zeros(len(self.street_keys), dtype=np.int64)
+        self._trie = _TrieNode()
+
+        # Busiest streets first, so each trie node's first SUGGESTION_LIMIT entries are its best ones
+        for street in np.argsort(-self.street_counts, kind='stable'):
+            street = int(street)
+            key = self.street_keys[street]
+            self._by_key.setdefault(key, street)
+            tokens = key.split()
+            core = " ".join(tokens[:-1]) if len(tokens) > 1 and tokens[-1] in SUFFIX_ALIASES.values() else key
+            self._by_core.setdefault(core, []).append(street)
+
+            grams = _trigrams(key)
+            self._trigram_counts[street] = len(grams)
+            for gram in grams:
+                self._trigram_postings.setdefault(gram, []).append(street)
+
+            # Index every word start so "hill" finds "blossom hill rd"
+            for start in range(len(tokens)):
+                self._insert(" ".join(tokens[start:]), street)
+
+        self._trigram_postings = {gram: np.asarray(ids, dtype=np.int64) for gram, ids in self._trigram_postings.items()}
+
+        # Intersections ordered by crash count, so the first match for a street pair is the busiest
+        self._by_pair = {}
+        self._street_intersections = {}
+        for i, (a, b) in enumerate(zip(self.pair_a.tolist(), self.pair_b.tolist())):
+            self._by_pair.setdefault((min(a, b), max(a, b)), i)
+            self._street_intersections.setdefault(a, []).append(i)
+            self._street_intersections.setdefault(b, []).append(i)
+
+        self._landmark_keys = sorted(self.landmarks, key=len, reverse=True)
+
+    def _insert(self, key, street):
+        node = self._trie
+        for char in key:
+            node = node.children.setdefault(char, _TrieNode())
+            if len(node.top) < SUGGESTION_LIMIT and street not in node.top:
+                node.top.append(street)
+
+    def _prefix_streets(self, prefix):
+        """Busiest streets with a word starting with prefix, from the trie"""
+        node = self._trie
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return []
+        return list(node.top)
+
+    def fuzzy_streets(self, text, limit=3):
+        """
+        Streets whose names are most similar to text by trigram Dice similarity
+
+        Args:
+            text: Street name as typed
+            limit: Number of streets to return
+
+        Returns:
+            List of (street id, score) pairs, best first, above FUZZY_MIN_SCORE
+        """
+        query = _trigrams(" ".join(normalize_street(text)))
+        postings = [self._trigram_postings[gram] for gram in query if gram in self._trigram_postings]
+        if not postings:
+            return []
+        shared = np.bincount(np.concatenate(postings), minlength=len(self.street_keys))
+        scores = 2.0 * shared / (len(query) + self._trigram_counts)
+        # Rank by score, then by crash count (scores differ by far more than 1e-8)
+        rank = scores * 1e8 + self.street_counts
+        limit = min(limit, len(rank))
+        best = np.argpartition(-rank, limit - 1)[:limit]
+        best = best[np.argsort(-rank[best], kind='stable')]
+        return [(int(street), float(scores[street])) for street in best if scores[street] >= FUZZY_MIN_SCORE]
+
+    def street_candidates(self, text, fuzzy=True):
+        """
+        Street ids a typed street name could refer to, best first
+
+        Exact normalized names win, then streets with the same name but a
+        different or missing street type, then fuzzy matches.
+
+        Args:
+            text: Street name as typed
+            fuzzy: Fall back to trigram matching when no name matches exactly
+
+        Returns:
+            List of street ids (empty when nothing matches)
+        """
+        tokens = normalize_street(text)
+        if not tokens:
+            return []
+        key = " ".join(tokens)
+        candidates = []
+        if key in self._by_key:
+            candidates.append(self._by_key[key])
+        core = " ".join(tokens[:-1]) if len(tokens) > 1 and tokens[-1] in SUFFIX_ALIASES.values() else key
+        candidates.extend(street for street in self._by_core.get(core, []) if street not in candidates)
+        if not candidates and fuzzy:
+            candidates = [street for street, _ in self.fuzzy_streets(text)]
+        return candidates
+
+    def _intersection_result(self, i, kind='intersection'):
+        a, b = self.street_names[self.pair_a[i]], self.street_names[self.pair_b[i]]
+        return {
+            'lat': float(self.lat[i]),
+            'lng': float(self.lng[i]),
+            'name': f"{_display_name(a)} & {_display_name(b)}",
+            'kind': kind,
+            'crash_count': int(self.counts[i])
+        }
+
+    def _street_anchor(self, street):
+        """Intersection on a street closest to the crash-weighted middle of the street"""
+        rows = np.asarray(self._street_intersections.get(street, []), dtype=np.int64)
+        weights = self.counts[rows]
+        x, y = project(self.lat[rows], self.lng[rows])
+        cx, cy = np.average(x, weights=weights), np.average(y, weights=weights)
+        return int(rows[np.argmin(np.hypot(x - cx, y - cy))])
+
+    def geocode_intersection(self, first, second, fuzzy=True):
+        """
+        Resolve two street names to their intersection
+
+        When the streets never meet in the data, the intersection on the first
+        street closest to the second street is returned instead.
+
+        Args:
+            first: First street name as typed
+            second: Second street name as typed
+            fuzzy: Allow misspelled street names
+
+        Returns:
+            Result dict (lat, lng, name, kind, crash_count), or None
+        """
+        first_streets = self.street_candidates(first, fuzzy)
+        second_streets = self.street_candidates(second, fuzzy)
+        for a in first_streets:
+            for b in second_streets:
+                i = self._by_pair.get((min(a, b), max(a, b)))
+                if i is not None:
+                    return self._intersection_result(i)
+
+        if not first_streets or not second_streets:
+            return None
+        rows_a = np.asarray(self._street_intersections[first_streets[0]], dtype=np.int64)
+        rows_b = np.asarray(self._street_intersections[second_streets[0]], dtype=np.int64)
+        ax, ay = project(self.lat[rows_a], self.lng[rows_a])
+        bx, by = project(self.lat[rows_b], self.lng[rows_b])
+        nearest = np.argmin(np.min(np.hypot(ax[:, None] - bx, ay[:, None] - by), axis=1))
+        return self._intersection_result(int(rows_a[nearest]), kind='near_intersection')
+
+    def geocode(self, text):
+        """
+        Resolve a place, intersection or street to coordinates
+
+        Comma-separated parts (e.g. ", San Jose, CA 95113") are tried in order
+        until one resolves, first by exact names only and then allowing
+        misspellings, so a business name before the street does not win
+        through a loose fuzzy match.
+
+        Args:
+            text: Location as typed
+
+        Returns:
+            Result dict with lat, lng, name, kind ('landmark', 'intersection',
+            'near_intersection' or 'street') and crash_count, or None
+        """
+        parts = [part.strip() for part in str(text).split(',')]
+        for fuzzy in (False, True):
+            for part in parts:
+                result = self._geocode_part(part, fuzzy)
+                if result is not None:
+                    return result
+        return None
+
+    def _landmark_result(self, landmark):
+        """Result dict for a landmark key"""
+        lat, lng = self.landmarks[landmark]
+        return {'lat': lat, 'lng': lng, 'name': landmark.title(), 'kind': 'landmark', 'crash_count': None}
+
+    def _geocode_part(self, part, fuzzy):
+        key = " ".join(re.sub(r"[^a-z0-9 ]+", " ", part.lower()).split())
+        if not key or key in ('san jose', 'ca') or re.fullmatch(r'(ca )?\d{5}', key):
+            return None
+
+        if key in self.landmarks:
+            return self._landmark_result(key)
+
+        streets = [s for s in INTERSECTION_SEPARATOR.split(part) if s.strip()]
+        if len(streets) >= 2:
+            return self.geocode_intersection(streets[0], streets[1], fuzzy)
+
+        candidates = self.street_candidates(part, fuzzy)
+        if not candidates:
+            # Loose landmark matches ("near Santana Row") only once no street matches,
+            # so street names containing a place name ("Willow Glen Way") stay streets
+            if fuzzy:
+                for landmark in self._landmark_keys:
+                    if landmark in key or (len(key) >= 4 and key in landmark):
+                        return self._landmark_result(landmark)
+            return None
+        result = self._intersection_result(self._street_anchor(candidates[0]), kind='street')
+        result['name'] = _display_name(self.street_names[candidates[0]])
+        result['crash_count'] = int(self.street_counts[candidates[0]])
+        return result
+
+    def suggest(self, text, limit=SUGGESTION_LIMIT):
+        """
+        Type-ahead suggestions for a partly typed street, intersection or place
+
+        "Blossom Hi" suggests streets; "Blossom Hill Rd & Mon" suggests the
+        cross streets of Blossom Hill Rd starting with "mon".
+
+        Args:
+            text: Text typed so far
+            limit: Maximum number of suggestions
+
+        Returns:
+            List of display strings, best first
+        """
+        parts = INTERSECTION_SEPARATOR.split(str(text), maxsplit=1)
+        if len(parts) == 2 and parts[0].strip():
+            return self._suggest_cross_streets(parts[0], parts[1], limit)
+
+        prefix = " ".join(normalize_street(text, partial=True))
+        if not prefix:
+            return []
+        suggestions = [landmark.title() for landmark in self.landmarks if landmark.startswith(prefix)]
+        streets = (self._prefix_streets(prefix) or self._prefix_streets(" ".join(normalize_street(text)))
+                   or [street for street, _ in self.fuzzy_streets(text, limit)])
+        suggestions.extend(_display_name(self.street_names[street]) for street in streets)
+        return suggestions[:limit]
+
+    def _suggest_cross_streets(self, first, partial, limit):
+        candidates = self.street_candidates(first)
+        if not candidates:
+            return []
+        street = candidates[0]
+        prefix = " ".join(normalize_street(partial, partial=True))
+        suggestions = []
+        for i in self._street_intersections.get(street, []):
+            other = int(self.pair_b[i] if self.pair_a[i] == street else self.pair_a[i])
+            other_key = self.street_keys[other]
+            if prefix and not (other_key.startswith(prefix) or f" {prefix}" in f" {other_key}"):
+                continue
+            name = f"{_display_name(self.street_names[street])} & {_display_name(self.street_names[other])}"
+            if name not in suggestions:
+                suggestions.append(name)
+            if len(suggestions) >= limit:
+                break
+        return suggestions
@@ -0,0 +1,339 @@
+"""
+Precomputed prediction table for San Jose Safe Commute
+Every input the Home page can send the safety and risk models is discrete, so
+both models are evaluated once, in batch, over the full grid of inputs and
+the answers are kept in compact arrays. Online predictions become a dict
+lookup per feature plus an array index, falling back to the live models for
+inputs outside the grid
+"""
+
+import numpy as np
+import pandas as pd
+import hashlib
+import itertools
+import json
+import logging
+import os
+import sys
+import threading
+from pathlib import Path
+
+# Add parent directory to import path
+parent_dir = str(Path(__file__).parent.parent)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+import ml_models
+from ml_models import generate_time_predictions
+from utils.crash_store import CACHE_DIR
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Bump when the cached table layout changes so old files are rebuilt
+TABLE_FORMAT_VERSION = 1
+
+# Periods scored by generate_time_predictions, so the safety timeline is served from the table too
+TIMELINE_PERIODS = [
+    "Early Morning (5-7 AM)",
+    "Morning Rush (7-9 AM)",
+    "Mid-Day (9 AM-4 PM)",
+    "Evening Rush (4-7 PM)",
+    "Evening (7-10 PM)",
+    "Late Night (10 PM-5 AM)"
+]
+
+# Every value the app sends for each model feature
+TABLE_AXES = {
+    'time_of_day': ["Current Time", "Morning Commute (7-9 AM)", "Midday (11 AM-1 PM)",
+                    "Evening Commute (4-6 PM)", "Late Night (10 PM-12 AM)"] + TIMELINE_PERIODS,
+    'weather': ["Clear", "Cloudy", "Rainy", "Foggy"],
+    'traffic_density': list(range(11)),
+    'transport_mode': ["driving", "transit", "walking", "bicycling"],
+    'day_of_week': ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+}
+
+# Home page option values that stand for a grid value (the selectbox sends "Car", the models know "driving")
+FEATURE_ALIASES = {
+    'transport_mode': {"Car": "driving", "Public Transit": "transit", "Walking": "walking", "Cycling": "bicycling"}
+}
+
+# Features the fallback heuristics read
+FALLBACK_COLUMNS = ['time_of_day', 'weather', 'traffic_density', 'day_of_week']
+
+def _model_columns(model):
+    """Input columns a fitted model's preprocessor reads, or None for the fallback heuristics"""
+    if model.model is None or model.preprocessor is None:
+        return None
+    return list(getattr(model.preprocessor, 'feature_names_in_', []))
+
+def canonical_features(features):
+    """Feature dict with Home page option values replaced by the grid values they stand for"""
+    aliased = {column: aliases[features[column]] for column, aliases in FEATURE_ALIASES.items()
+               if isinstance(features.get(column), str) and features[column] in aliases}
+    return dict(features, **aliased) if aliased else features
+
+def _models_stamp(safety_model, risk_classifier):
+    """Model versions the table was built from, so a retrained or reloaded model invalidates it"""
+    return (safety_model.model_version, risk_classifier.model_version)
+
+class PredictionTable:
+    """
+    Safety scores and risk class probabilities for every combination of the table's columns
+
+    Arrays have one axis per column (in TABLE_AXES order), plus a class axis
+    for the risk probabilities. Features the models do not read are left out
+    of the grid, so the table only grows with the inputs that matter.
+    """
+    def __init__(self, columns, scores, risk_levels, risk_probabilities, risk_classes, stamp=None):
+        self.columns = list(columns)
+        self.scores = scores
+        self.risk_levels = risk_levels
+        self.risk_probabilities = risk_probabilities
+        self.risk_classes = list(risk_classes)
+        self.stamp = stamp
+        self._positions = []
+        for column in self.columns:
+            positions = {value: i for i, value in enumerate(TABLE_AXES[column])}
+            positions.update({alias: positions[value] for alias, value in FEATURE_ALIASES.get(column, {}).items()})
+            self._positions.append(positions)
+
+    def __len__(self):
+        return int(self.scores.size)
+
+    @classmethod
+    def build(cls, safety_model, risk_classifier):
+        """
+        Evaluate both models over the full input grid in batch
+
+        Args:
+            safety_model: SafetyScorePredictor instance
+            risk_classifier: IncidentRiskClassifier instance
+
+        Returns:
+            PredictionTable instance, or None if a model reads features outside the grid
+        """
+        used = set()
+        for model in (safety_model, risk_classifier):
+            columns = _model_columns(model)
+            used.update(FALLBACK_COLUMNS if columns is None else columns)
+        if not used.issubset(TABLE_AXES):
+            logger.info(f"Prediction table skipped: models read {sorted(used - set(TABLE_AXES))}")
+            return None
+
+        columns = [column for column in TABLE_AXES if column in used]
+        shape = tuple(len(TABLE_AXES[column]) for column in columns)
+        grid = pd.DataFrame(list(itertools.product(*(TABLE_AXES[column] for column in columns))),
+                            columns=columns).astype({c: object for c in columns if c != 'traffic_density'})
+
+        scores = safety_model.predict_batch(grid).astype(np.float64).reshape(shape)
+        risk_levels, risk_probabilities = risk_classifier.predict_risk_batch(grid)
+        classes = list(risk_classifier.classes)
+        level_codes = np.array([classes.index(level) for level in risk_levels], dtype=np.int8).reshape(shape)
+        risk_probabilities = risk_probabilities.astype(np.float64).reshape(shape + (len(classes),))
+        return cls(columns, scores, level_codes, risk_probabilities, classes,
+                   stamp=_models_stamp(safety_model, risk_classifier))
+
+    def save(self, path):
+        """
+        Write the table to an .npz file (atomically)
+
+        Args:
+            path: Destination file path
+        """
+        path = Path(path)
+        tmp_path = path.with_name(path.name + '.tmp')
+        header = json.dumps({'version': TABLE_FORMAT_VERSION, 'columns': self.columns, 'risk_classes': self.risk_classes})
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, header=np.array(header), scores=self.scores, risk_levels=self.risk_levels,
+                     risk_probabilities=self.risk_probabilities)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, stamp=None):
+        """
+        Read a table written by save
+
+        Args:
+            path: Table file path
+            stamp: Model versions to attach to the loaded table
+
+        Returns:
+            PredictionTable instance, or None if the file is from another format version
+        """
+        with np.load(path) as data:
+            header = json.loads(str(data['header']))
+            if header['version'] != TABLE_FORMAT_VERSION:
+                return None
+            return cls(header['columns'], data['scores'], data['risk_levels'], data['risk_probabilities'],
+                       header['risk_classes'], stamp=stamp)
+
+    def _position(self, features):
+        """Array index of a feature dict, or None if any table feature is missing or outside the grid"""
+        position = []
+        for column, positions in zip(self.columns, self._positions):
+            try:
+                position.append(positions[features[column]])
+            except (KeyError, TypeError):
+                return None
+        return tuple(position)
+
+    def predict(self, features):
+        """
+        Look up the safety score for a feature dict
+
+        Args:
+            features: Dict with feature values
+
+        Returns:
+            Safety score (float), or None if the inputs are outside the grid
+        """
+        position = self._position(features)
+        return None if position is None else float(self.scores[position])
+
+    def predict_risk(self, features):
+        """
+        Look up the incident risk for a feature dict
+
+        Args:
+            features: Dict with feature values
+
+        Returns:
+            Dict with risk level and probabilities (as IncidentRiskClassifier.predict_risk),
+            or None if the inputs are outside the grid
+        """
+        position = self._position(features)
+        if position is None:
+            return None
+        probabilities = self.risk_probabilities[position]
+        return {
+            'risk_level': self.risk_classes[int(self.risk_levels[position])],
+            'probability': float(probabilities.max()),
+            'class_probabilities': {cls: float(prob) for cls, prob in zip(self.risk_classes, probabilities)}
+        }
+
+def _table_key(safety_model, risk_classifier):
+    """Content hash of the model files a table is built from"""
+    digest = hashlib.sha256(f"{TABLE_FORMAT_VERSION}{json.dumps(TABLE_AXES)}".encode())
+    for model in (safety_model, risk_classifier):
+        with open(model.model_path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:32]
+
+def load_prediction_table(safety_model, risk_classifier, cache_dir=None):
+    """
+    Load the cached table for the loaded models, building and saving it on a miss
+
+    Tables for the fallback heuristics are cheap to build and are not cached.
+
+    Args:
+        safety_model: SafetyScorePredictor instance
+        risk_classifier: IncidentRiskClassifier instance
+        cache_dir: Optional cache directory (defaults to the crash store's CACHE_DIR)
+
+    Returns:
+        PredictionTable instance, or None if the models read features outside the grid
+    """
+    stamp = _models_stamp(safety_model, risk_classifier)
+    fitted = _model_columns(safety_model) is not None and _model_columns(risk_classifier) is not None
+    if not fitted:
+        return PredictionTable.build(safety_model, risk_classifier)
+
+    cache_dir = Path(cache_dir or CACHE_DIR)
+    path = cache_dir / f"prediction-table-{_table_key(safety_model, risk_classifier)}.npz"
+    if path.exists():
+        try:
+            table = PredictionTable.load(path, stamp=stamp)
+            if table is not None:
+                return table
+        except Exception as e:
+            logger.error(f"Error reading prediction table: {str(e)}")
+
+    table = PredictionTable.build(safety_model, risk_classifier)
+    if table is None:
+        return None
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        table.save(path)
+        for stale in cache_dir.glob("prediction-table-*.npz"):
+            if stale != path:
+                stale.unlink(missing_ok=True)
+        logger.info(f"Prediction table cached to {path}")
+    except OSError as e:
+        logger.error(f"Error writing prediction table: {str(e)}")
+    return table
+
+_table = None
+_table_lock = threading.Lock()
+
+def get_prediction_table():
+    """
+    Prediction table for the process-wide models (rebuilt after they are retrained or reloaded)
+
+    Returns:
+        PredictionTable instance, or None if the models cannot be tabulated
+    """
+    global _table
+    stamp = _models_stamp(ml_models.safety_model, ml_models.risk_classifier)
+    table = _table
+    if table is None or table.stamp != stamp:
+        with _table_lock:
+            if _table is None or _table.stamp != stamp:
+                try:
+                    _table = load_prediction_table(ml_models.safety_model, ml_models.risk_classifier) or \
+                        PredictionTable([], None, None, None, [], stamp=stamp)
+                except Exception as e:
+                    logger.error(f"Error building prediction table: {str(e)}")
+                    _table = PredictionTable([], None, None, None, [], stamp=stamp)
+            table = _table
+    return table if table.scores is not None else None
+
+def predict_safety(features):
+    """
+    Safety score for a feature dict from the table, or the live model for inputs outside it
+
+    Args:
+        features: Dict with feature values
+
+    Returns:
+        Safety score (float)
+    """
+    features = canonical_features(features)
+    table = get_prediction_table()
+    score = table.predict(features) if table is not None else None
+    return score if score is not None else ml_models.safety_model.predict(features)
+
+def predict_risk(features):
+    """
+    Incident risk for a feature dict from the table, or the live model for inputs outside it
+
+    Args:
+        features: Dict with feature values
+
+    Returns:
+        Dict with risk level and probabilities
+    """
+    features = canonical_features(features)
+    table = get_prediction_table()
+    risk = table.predict_risk(features) if table is not None else None
+    return risk if risk is not None else ml_models.risk_classifier.predict_risk(features)
+
+def predict_time_periods(base_features, safety_score):
+    """
+    Safety scores for each timeline period from the table, or one live batch for inputs outside it
+
+    Args:
+        base_features: Base feature values
+        safety_score: Current safety score (for the heuristic fallback)
+
+    Returns:
+        Dict mapping time periods to predicted safety scores
+    """
+    base_features = canonical_features(base_features)
+    table = get_prediction_table()
+    if table is not None:
+        scores = [table.predict(dict(base_features, time_of_day=period)) for period in TIMELINE_PERIODS]
+        if all(score is not None for score in scores):
+            return dict(zip(TIMELINE_PERIODS, scores))
+    return generate_time_predictions(ml_models.safety_model, base_features, safety_score)
@@ -0,0 +1,362 @@
+"""
+Road network graph for San Jose Safe Commute
+Derives a street graph from the crash records: nodes are intersections
+(IntersectionNumber) and edges join consecutive intersections along the same
+street. The graph is stored as compact CSR arrays with per-edge length and
+crash statistics and cached as a binary file
+"""
+
+import numpy as np
+import pandas as pd
+import hashlib
+import logging
+import os
+import sys
+from pathlib import Path
+
+# Add parent directory to import path
+parent_dir = str(Path(__file__).parent.parent)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from utils.crash_spatial_index import CrashSpatialIndex, project, valid_coordinates
+from utils.crash_store import CACHE_DIR
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Bump when the cached graph layout changes so old files are rebuilt
+GRAPH_FORMAT_VERSION = 1
+
+# Consecutive intersections further apart than this are treated as separate stretches of a street
+MAX_EDGE_M = 3000.0
+
+# Crash records give mid-block distances in feet
+FEET_TO_M = 0.3048
+
+# Unit vectors (east, north) for DirectionFromIntersection values
+COMPASS_VECTORS = {
+    'North Of': (0.0, 1.0),
+    'South Of': (0.0, -1.0),
+    'East Of': (1.0, 0.0),
+    'West Of': (-1.0, 0.0)
+}
+
+# Columns a graph is built from (the cache key hashes these)
+GRAPH_COLUMNS = ['IntersectionNumber', 'AStreetName', 'BStreetName', 'Latitude', 'Longitude',
+                 'severity', 'Distance', 'DirectionFromIntersection']
+
+# Array attributes saved to and loaded from the cache file
+GRAPH_ARRAYS = ['node_number', 'node_lat', 'node_lon', 'node_crashes', 'node_severity', 'node_severe',
+                'edge_u', 'edge_v', 'edge_street', 'edge_length', 'edge_crashes', 'edge_severity', 'edge_severe',
+                'indptr', 'indices', 'arc_edge', 'street_names']
+
+def _split_streets(names):
+    """Street names of a crash-data street field ('FIRST ST/MARKET ST' names two streets)"""
+    return [part.strip() for part in str(names).split('/') if part.strip()]
+
+class RoadGraph:
+    """
+    Undirected street graph in CSR form
+
+    Node i is intersection node_number[i] at (node_lat[i], node_lon[i]). Edge
+    e joins edge_u[e] and edge_v[e] along street_names[edge_street[e]] and is
+    edge_length[e] meters long. The neighbours of node i are
+    indices[indptr[i]:indptr[i + 1]], reached through edges
+    arc_edge[indptr[i]:indptr[i + 1]].
+
+    Crashes recorded at an intersection count towards its node; crashes
+    recorded some distance north/south/east/west of it count towards the
+    edge leaving the intersection in that direction.
+    """
+    def __init__(self, **arrays):
+        for name in GRAPH_ARRAYS:
+            setattr(self, name, arrays[name])
+        self._node_index = None
+        self._spatial_index = None
+
+    @property
+    def n_nodes(self):
+        return len(self.node_number)
+
+    @property
+    def n_edges(self):
+        return len(self.edge_u)
+
+    @classmethod
+    def from_frame(cls, df, max_edge_m=MAX_EDGE_M):
+        """
+        Build the graph from a processed crash dataframe
+
+        Args:
+            df: Processed crash dataframe (needs the GRAPH_COLUMNS)
+            max_edge_m: Longest gap between consecutive intersections still joined by an edge
+
+        Returns:
+            RoadGraph instance
+        """
+        lat = df['Latitude'].to_numpy(dtype=np.float64)
+        lon = df['Longitude'].to_numpy(dtype=np.float64)
+        located = valid_coordinates(lat, lon)
+        crashes = pd.DataFrame({
+            'number': df['IntersectionNumber'].to_numpy()[located],
+            'a': df['AStreetName'].astype(object).to_numpy()[located],
+            'b': df['BStreetName'].astype(object).to_numpy()[located],
+            'lat': lat[located],
+            'lon': lon[located],
+            'severity': df['severity'].to_numpy(dtype=np.float64)[located],
+            'distance': df['Distance'].to_numpy(dtype=np.float64, na_value=0.0)[located],
+            'direction': df['DirectionFromIntersection'].astype(object).to_numpy()[located]
+        })
+
+        # Nodes: one per intersection number, at the mean of its crash coordinates
+        node_codes, node_number = pd.factorize(crashes['number'], sort=True)
+        n_nodes = len(node_number)
+        counts = np.bincount(node_codes, minlength=n_nodes)
+        node_lat = np.bincount(node_codes, weights=crashes['lat'], minlength=n_nodes) / counts
+        node_lon = np.bincount(node_codes, weights=crashes['lon'], minlength=n_nodes) / counts
+        first_rows = np.unique(node_codes, return_index=True)[1]
+        x, y = project(node_lat, node_lon)
+
+        # Street memberships (street, node), splitting compound street names
+        memberships = pd.DataFrame({
+            'node': np.concatenate([np.arange(n_nodes), np.arange(n_nodes)]),
+            'names': np.concatenate([crashes['a'].to_numpy()[first_rows], crashes['b'].to_numpy()[first_rows]])
+        }).dropna()
+        memberships['street'] = memberships['names'].map(_split_streets)
+        memberships = memberships.explode('street').dropna(subset=['street']).drop_duplicates(['street', 'node'])
+        street_codes, street_names = pd.factorize(memberships['street'], sort=True)
+        member_nodes = memberships['node'].to_numpy()
+        edge_u, edge_v, edge_street = cls._street_edges(street_codes, member_nodes, x, y, len(street_names))
+
+        # Drop long gaps and duplicate edges between the same pair of intersections
+        edge_length = np.hypot(x[edge_u] - x[edge_v], y[edge_u] - y[edge_v])
+        keep = (edge_length <= max_edge_m) & (edge_u != edge_v)
+        edge_u, edge_v, edge_street, edge_length = edge_u[keep], edge_v[keep], edge_street[keep], edge_length[keep]
+        low, high = np.minimum(edge_u, edge_v), np.maximum(edge_u, edge_v)
+        _, unique_edges = np.unique(low * n_nodes + high, return_index=True)
+        unique_edges.sort()
+        edge_u, edge_v = low[unique_edges], high[unique_edges]
+        edge_street, edge_length = edge_street[unique_edges], edge_length[unique_edges]
+
+        # CSR adjacency over both directions of every edge
+        n_edges = len(edge_u)
+        arc_src = np.concatenate([edge_u, edge_v])
+        arc_dst = np.concatenate([edge_v, edge_u])
+        arc_edge = np.concatenate([np.arange(n_edges), np.arange(n_edges)])
+        order = np.argsort(arc_src, kind='stable')
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(arc_src, minlength=n_nodes))])
+
+        graph = cls(
+            node_number=np.asarray(node_number, dtype=np.int64),
+            node_lat=node_lat, node_lon=node_lon,
+            node_crashes=np.zeros(n_nodes), node_severity=np.zeros(n_nodes), node_severe=np.zeros(n_nodes),
+            edge_u=edge_u.astype(np.int32), edge_v=edge_v.astype(np.int32), edge_street=edge_street.astype(np.int32),
+            edge_length=edge_length.astype(np.float32),
+            edge_crashes=np.zeros(n_edges), edge_severity=np.zeros(n_edges), edge_severe=np.zeros(n_edges),
+            indptr=indptr.astype(np.int64), indices=arc_dst[order].astype(np.int32),
+            arc_edge=arc_edge[order].astype(np.int32), street_names=np.asarray(street_names, dtype=str)
+        )
+        graph._attribute_crashes(crashes, node_codes, street_names, x, y)
+        logger.info(f"Built road graph with {graph.n_nodes} intersections and {graph.n_edges} street segments")
+        return graph
+
+    @staticmethod
+    def _street_edges(street_codes, member_nodes, x, y, n_streets):
+        """
+        Join consecutive intersections along each street
+
+        Each street's intersections are ordered by their position along the
+        street's principal axis (from per-street coordinate moments), so the
+        ordering is one lexsort over all streets.
+
+        Returns:
+            Tuple of (edge_u, edge_v, edge_street) arrays
+        """
+        px, py = x[member_nodes], y[member_nodes]
+        n = np.bincount(street_codes, minlength=n_streets).astype(np.float64)
+        mean_x = np.bincount(street_codes, weights=px, minlength=n_streets) / np.maximum(n, 1)
+        mean_y = np.bincount(street_codes, weights=py, minlength=n_streets) / np.maximum(n, 1)
+        dx, dy = px - mean_x[street_codes], py - mean_y[street_codes]
+        sxx = np.bincount(street_codes, weights=dx * dx, minlength=n_streets)
+        syy = np.bincount(street_codes, weights=dy * dy, minlength=n_streets)
+        sxy = np.bincount(street_codes, weights=dx * dy, minlength=n_streets)
+        angle = 0.5 * np.arctan2(2.0 * sxy, sxx - syy)
+        along = dx * np.cos(angle[street_codes]) + dy * np.sin(angle[street_codes])
+
+        order = np.lexsort((along, street_codes))
+        streets, nodes = street_codes[order], member_nodes[order]
+        same_street = streets[1:] == streets[:-1]
+        return nodes[:-1][same_street], nodes[1:][same_street], streets[:-1][same_street]
+
+    def _attribute_crashes(self, crashes, node_codes, street_names, x, y):
+        """Add each crash to its intersection, or to the street segment it happened on"""
+        severity = crashes['severity'].to_numpy()
+        severe = (severity >= 4).astype(np.float64)
+
+        # Mid-block crashes: on the A street, some distance in a compass direction from the intersection
+        direction = crashes['direction'].to_numpy()
+        midblock = (crashes['distance'].to_numpy() > 0) & np.isin(direction, list(COMPASS_VECTORS))
+        street_lookup = pd.Index(street_names)
+        a_street = street_lookup.get_indexer([_split_streets(a)[0] if isinstance(a, str) and _split_streets(a) else None
+                                              for a in crashes['a'].to_numpy()])
+        midblock &= a_street >= 0
+
+        rows = np.flatnonzero(midblock)
+        arcs = pd.DataFrame({
+            'node': np.repeat(np.arange(self.n_nodes), np.diff(self.indptr)),
+            'edge': self.arc_edge,
+            'street': self.edge_street[self.arc_edge]
+        })
+        other = self.indices
+        arcs['ux'] = x[other] - x[arcs['node']]
+        arcs['uy'] = y[other] - y[arcs['node']]
+        wanted = pd.DataFrame({'row': rows, 'node': node_codes[rows], 'street': a_street[rows],
+                               'dir_x': [COMPASS_VECTORS[d][0] for d in direction[rows]],
+                               'dir_y': [COMPASS_VECTORS[d][1] for d in direction[rows]]})
+        matches = wanted.merge(arcs, on=['node', 'street'])
+        matches['alignment'] = ((matches['ux'] * matches['dir_x'] + matches['uy'] * matches['dir_y'])
+                                / np.maximum(np.hypot(matches['ux'], matches['uy']), 1e-9))
+        matches = matches[matches['alignment'] > 0].sort_values('alignment', ascending=False, kind='stable')
+        matches = matches.drop_duplicates('row')
+
+        edge_rows = matches['row'].to_numpy()
+        edges = matches['edge'].to_numpy()
+        self.edge_crashes = np.bincount(edges, minlength=self.n_edges).astype(np.float64)
+        self.edge_severity = np.bincount(edges, weights=severity[edge_rows], minlength=self.n_edges)
+        self.edge_severe = np.bincount(edges, weights=severe[edge_rows], minlength=self.n_edges)
+
+        at_node = np.ones(len(severity), dtype=bool)
+        at_node[edge_rows] = False
+        codes = node_codes[at_node]
+        self.node_crashes = np.bincount(codes, minlength=self.n_nodes).astype(np.float64)
+        self.node_severity = np.bincount(codes, weights=severity[at_node], minlength=self.n_nodes)
+        self.node_severe = np.bincount(codes, weights=severe[at_node], minlength=self.n_nodes)
+
+    def save(self, path):
+        """
+        Write the graph arrays to an .npz file (atomically)
+
+        Args:
+            path: Destination file path
+        """
+        path = Path(path)
+        tmp_path = path.with_name(path.name + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, version=np.array(GRAPH_FORMAT_VERSION), **{name: getattr(self, name) for name in GRAPH_ARRAYS})
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Read a graph written by save
+
+        Args:
+            path: Graph file path
+
+        Returns:
+            RoadGraph instance, or None if the file is from another format version
+        """
+        with np.load(path) as data:
+            if int(data['version']) != GRAPH_FORMAT_VERSION:
+                return None
+            return cls(**{name: data[name] for name in GRAPH_ARRAYS})
+
+    def neighbors(self, node):
+        """
+        Neighbouring intersections of a node
+
+        Args:
+            node: Node index
+
+        Returns:
+            Tuple of (neighbour node indices, edge indices)
+        """
+        start, stop = self.indptr[node], self.indptr[node + 1]
+        return self.indices[start:stop], self.arc_edge[start:stop]
+
+    def node_for_number(self, number):
+        """
+        Node index of an IntersectionNumber
+
+        Args:
+            number: IntersectionNumber from the crash data
+
+        Returns:
+            Node index, or None if the intersection is not in the graph
+        """
+        if self._node_index is None:
+            self._node_index = pd.Index(self.node_number)
+        position = self._node_index.get_indexer([number])[0]
+        return int(position) if position >= 0 else None
+
+    def nearest_node(self, lat, lon):
+        """
+        Intersection closest to a point
+
+        Args:
+            lat: Latitude in degrees
+            lon: Longitude in degrees
+
+        Returns:
+            Tuple of (node index, distance in meters)
+        """
+        if self._spatial_index is None:
+            self._spatial_index = CrashSpatialIndex.from_coordinates(self.node_lat, self.node_lon)
+        positions, distances = self._spatial_index.query_knn(lat, lon, 1)
+        return int(positions[0]), float(distances[0])
+
+    def path_coords(self, nodes):
+        """
+        Coordinates of a node path
+
+        Args:
+            nodes: Sequence of node indices
+
+        Returns:
+            List of [lat, lng] points
+        """
+        nodes = np.asarray(nodes, dtype=np.int64)
+        return np.column_stack([self.node_lat[nodes], self.node_lon[nodes]]).round(6).tolist()
+
+def _graph_key(df):
+    """Content hash of the crash columns a graph is built from"""
+    digest = hashlib.sha256(str(GRAPH_FORMAT_VERSION).encode())
+    hashes = pd.util.hash_pandas_object(df[GRAPH_COLUMNS], index=False)
+    digest.update(hashes.to_numpy().tobytes())
+    return digest.hexdigest()[:32]
+
+def load_road_graph(df, cache_dir=None):
+    """
+    Load the cached road graph for a crash dataframe, building and saving it on a miss
+
+    Args:
+        df: Processed crash dataframe
+        cache_dir: Optional cache directory (defaults to the crash store's CACHE_DIR)
+
+    Returns:
+        RoadGraph instance
+    """
+    cache_dir = Path(cache_dir or CACHE_DIR)
+    path = cache_dir / f"road-graph-{_graph_key(df)}.npz"
+
+    if path.exists():
+        try:
+            graph = RoadGraph.load(path)
+            if graph is not None:
+                return graph
+        except Exception as e:
+            logger.error(f"Error reading road graph: {str(e)}")
+
+    graph = RoadGraph.from_frame(df)
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        graph.save(path)
+        for stale in cache_dir.glob("road-graph-*.npz"):
+            if stale != path:
+                stale.unlink(missing_ok=True)
+        logger.info(f"Road graph cached to {path}")
+    except OSError as e:
+        logger.error(f"Error writing road graph: {str(e)}")
+    return graph
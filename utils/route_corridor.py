@@ -0,0 +1,157 @@
+"""
+Route corridor crash analysis for San Jose Safe Commute
+Finds the historical crashes within a set distance of a route polyline and
+turns them into route-level statistics and map hotspots
+"""
+
+import pandas as pd
+import numpy as np
+import logging
+import sys
+from pathlib import Path
+
+# Add parent directory to import path
+parent_dir = str(Path(__file__).parent.parent)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from utils.crash_dataset import crash_dataset
+from utils.crash_spatial_index import project
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Corridor half-width around the route in meters
+DEFAULT_BUFFER_M = 100.0
+
+# Length of the route stretches crashes are grouped into for hotspots
+HOTSPOT_BIN_M = 250.0
+
+# Crashes per km of route above which the corridor is flagged (roughly the top quarter of city routes)
+HIGH_CRASH_DENSITY_PER_KM = 65.0
+
+# Columns copied from the crash frame for each corridor crash
+CORRIDOR_COLUMNS = ['Latitude', 'Longitude', 'severity', 'location', 'datetime', 'weather']
+
+def route_length_m(route):
+    """
+    Length of a route polyline in meters
+
+    Args:
+        route: List of [lat, lng] points
+
+    Returns:
+        Length in meters
+    """
+    route = np.asarray(route, dtype=np.float64).reshape(-1, 2)
+    x, y = project(route[:, 0], route[:, 1])
+    return float(np.hypot(np.diff(x), np.diff(y)).sum())
+
+def crashes_near_route(route, buffer_m=DEFAULT_BUFFER_M, dataset=None):
+    """
+    Find historical crashes within buffer_m of a route
+
+    Args:
+        route: List of [lat, lng] points
+        buffer_m: Corridor half-width in meters
+        dataset: SharedCrashDataset to query (defaults to the process-wide one)
+
+    Returns:
+        DataFrame of crashes ordered along the route, with distance_m (to the
+        route), along_m (from the start of the route) and segment columns
+    """
+    dataset = dataset or crash_dataset
+    route = np.asarray(route, dtype=np.float64).reshape(-1, 2)
+    positions, distances, along, segments = dataset.get_spatial_index().query_corridor(
+        route[:, 0], route[:, 1], buffer_m)
+
+    frame = dataset.get_frame()
+    columns = [column for column in CORRIDOR_COLUMNS if column in frame.columns]
+    crashes = frame.iloc[positions][columns].reset_index(drop=True)
+    crashes['distance_m'] = distances
+    crashes['along_m'] = along
+    crashes['segment'] = segments
+    return crashes
+
+def summarize_route_crashes(crashes, route_length, buffer_m=DEFAULT_BUFFER_M):
+    """
+    Summarize corridor crashes for a route
+
+    Args:
+        crashes: DataFrame returned by crashes_near_route
+        route_length: Route length in meters
+        buffer_m: Corridor half-width used for the query
+
+    Returns:
+        Dictionary of route crash statistics
+    """
+    count = len(crashes)
+    length_km = max(route_length / 1000.0, 0.1)
+    severity = crashes['severity'].to_numpy(dtype=np.float64) if count else np.empty(0)
+    return {
+        'crash_count': count,
+        'crashes_per_km': round(count / length_km, 1),
+        'severe_crashes': int((severity >= 4).sum()),
+        'mean_severity': round(float(severity.mean()), 2) if count else 0.0,
+        'route_length_km': round(route_length / 1000.0, 2),
+        'buffer_m': buffer_m,
+        'high_density': count / length_km >= HIGH_CRASH_DENSITY_PER_KM
+    }
+
+def route_hotspots(crashes, bin_m=HOTSPOT_BIN_M, top=5):
+    """
+    Find the route stretches with the most crashes
+
+    Args:
+        crashes: DataFrame returned by crashes_near_route
+        bin_m: Length of each route stretch in meters
+        top: Number of hotspots to return
+
+    Returns:
+        List of hotspot dicts (lat, lng, intensity 1-10, description) like generate_sample_hotspots
+    """
+    if crashes.empty:
+        return []
+
+    bins = (crashes['along_m'].to_numpy() // bin_m).astype(np.int64)
+    counts = np.bincount(bins)
+    lat_sum = np.bincount(bins, weights=crashes['Latitude'].to_numpy(dtype=np.float64))
+    lng_sum = np.bincount(bins, weights=crashes['Longitude'].to_numpy(dtype=np.float64))
+    severity_sum = np.bincount(bins, weights=crashes['severity'].to_numpy(dtype=np.float64))
+
+    busiest = np.argsort(-counts, kind='stable')[:top]
+    busiest = busiest[counts[busiest] > 0]
+    hotspots = []
+    for b in busiest:
+        count = int(counts[b])
+        locations = crashes['location'][bins == b] if 'location' in crashes.columns else pd.Series(dtype=object)
+        place = locations.mode().iloc[0] if not locations.empty else f"{b * bin_m / 1000:.1f} km along the route"
+        hotspots.append({
+            'lat': round(float(lat_sum[b] / count), 6),
+            'lng': round(float(lng_sum[b] / count), 6),
+            'intensity': round(float(1.0 + 9.0 * count / counts.max()), 1),
+            'description': f"{count} past crashes near {place}",
+            'crash_count': count,
+            'mean_severity': round(float(severity_sum[b] / count), 2),
+            'along_m': round(float(b * bin_m), 1)
+        })
+    return hotspots
+
+def analyze_route_crashes(route, buffer_m=DEFAULT_BUFFER_M, dataset=None):
+    """
+    Run the corridor query for a route and summarize it
+
+    Args:
+        route: List of [lat, lng] points
+        buffer_m: Corridor half-width in meters
+        dataset: SharedCrashDataset to query (defaults to the process-wide one)
+
+    Returns:
+        Dictionary with 'summary' and 'hotspots'
+    """
+    crashes = crashes_near_route(route, buffer_m, dataset)
+    return {
+        'summary': summarize_route_crashes(crashes, route_length_m(route), buffer_m),
+        'hotspots': route_hotspots(crashes)
+    }
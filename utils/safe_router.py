@@ -0,0 +1,554 @@
+"""
+Safety-weighted router for San Jose Safe Commute
+Finds routes over the crash-derived intersection graph with A*, where each
+segment costs its length plus a penalty for the crashes recorded on it and
+at the intersection it leads into, scaled by how much the user prioritizes
+safety over speed. Also finds the Pareto frontier of (travel time, crash
+risk) routes between two points, so the safety slider can pick among them
+without searching again, and answers routes for a few fixed slider settings
+from precomputed contraction hierarchies.
+"""
+
+import numpy as np
+import heapq
+import logging
+import math
+import sys
+import threading
+from pathlib import Path
+
+# Add parent directory to import path
+parent_dir = str(Path(__file__).parent.parent)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from utils.contraction_hierarchy import load_contraction_hierarchy
+from utils.crash_spatial_index import CrashSpatialIndex, project
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Detour in meters one severity-weighted crash (over the 2011-2021 record) is worth at full safety priority
+RISK_COST_M = 10.0
+
+# Top of the "Safety vs. Speed Balance" slider
+MAX_SAFETY_PRIORITY = 10
+
+# Average door-to-door speeds in meters per second, including stops
+MODE_SPEEDS_MPS = {
+    'driving': 8.3,
+    'transit': 5.5,
+    'bicycling': 4.2,
+    'walking': 1.4
+}
+
+# UI mode names -> MODE_SPEEDS_MPS key
+MODE_ALIASES = {
+    'car': 'driving',
+    'public transit': 'transit',
+    'cycling': 'bicycling',
+    'walking': 'walking'
+}
+
+# Route risk per km relative to the network average -> safety label
+SAFETY_LEVELS = [(0.75, "High"), (1.25, "Medium"), (float('inf'), "Lower")]
+
+METERS_PER_MILE = 1609.344
+
+# Most routes kept on a Pareto frontier
+MAX_FRONTIER_ROUTES = 12
+
+# Risk improvement (severity points) a label needs to count as non-dominated
+RISK_RESOLUTION = 2.0
+
+# Slider settings served from contraction hierarchies (7 is the slider's default)
+HIERARCHY_PRIORITIES = (0, 5, 7, 10)
+
+# Alternative routes: cost multiplier applied to segments of routes already found,
+# the most of an alternative's length it may share with another route, how much
+# costlier than the best route it may be, and how many searches to spend
+ALTERNATIVE_PENALTY = 1.4
+MAX_ALTERNATIVE_OVERLAP = 0.6
+MAX_ALTERNATIVE_STRETCH = 1.4
+ALTERNATIVE_ATTEMPTS_PER_ROUTE = 4
+
+def safety_weight(prioritize_safety):
+    """
+    Blend weight for the crash penalty from the safety slider
+
+    Args:
+        prioritize_safety: Slider value (0 = fastest, MAX_SAFETY_PRIORITY = safest)
+
+    Returns:
+        Weight between 0 and 1
+    """
+    return min(max(float(prioritize_safety) / MAX_SAFETY_PRIORITY, 0.0), 1.0)
+
+def _largest_component(graph):
+    """Boolean mask of the nodes in the graph's largest connected component"""
+    labels = np.full(graph.n_nodes, -1, dtype=np.int64)
+    indptr, indices = graph.indptr, graph.indices
+    sizes = []
+    for start in range(graph.n_nodes):
+        if labels[start] >= 0:
+            continue
+        label = len(sizes)
+        labels[start] = label
+        stack, size = [start], 0
+        while stack:
+            node = stack.pop()
+            size += 1
+            for neighbour in indices[indptr[node]:indptr[node + 1]]:
+                if labels[neighbour] < 0:
+                    labels[neighbour] = label
+                    stack.append(neighbour)
+        sizes.append(size)
+    return labels == int(np.argmax(sizes)) if sizes else np.zeros(0, dtype=bool)
+
+def _lower_hull(points):
+    """Indices of the lower-left convex hull of (length, risk) points sorted by length"""
+    hull = []
+    for i, (x, y) in enumerate(points):
+        while len(hull) >= 2:
+            (x1, y1), (x2, y2) = points[hull[-2]], points[hull[-1]]
+            if (x2 - x1) * (y - y1) - (y2 - y1) * (x - x1) > 0:
+                break
+            hull.pop()
+        hull.append(i)
+    return hull
+
+def _thin_frontier(points, max_routes):
+    """
+    Pick at most max_routes of a Pareto frontier, keeping both extremes
+
+    Hull points come first since they are the only ones a weighted blend of
+    time and risk can select; the rest are spread evenly along the frontier.
+    """
+    if len(points) <= max_routes:
+        return list(range(len(points)))
+    hull = _lower_hull(points)
+    if len(hull) >= max_routes:
+        positions = np.linspace(0, len(hull) - 1, max_routes).round().astype(int)
+        return [hull[i] for i in sorted(set(positions))]
+    rest = [i for i in range(len(points)) if i not in set(hull)]
+    slots = max_routes - len(hull)
+    positions = ((np.arange(slots) + 0.5) * len(rest) / slots).astype(int)
+    return sorted(set(hull) | {rest[i] for i in positions})
+
+def choose_route(frontier, prioritize_safety):
+    """
+    Pick the route on a Pareto frontier for a safety slider setting
+
+    Uses the same length + weight * RISK_COST_M * risk blend as SafeRouter.route,
+    so on a complete frontier it selects the route A* would have found.
+
+    Args:
+        frontier: Route dictionaries from SafeRouter.route_frontier
+        prioritize_safety: "Safety vs. Speed Balance" slider value (0-10)
+
+    Returns:
+        Route dictionary, or None for an empty frontier
+    """
+    if not frontier:
+        return None
+    risk_cost = safety_weight(prioritize_safety) * RISK_COST_M
+    return min(frontier, key=lambda route: route['distance_m'] + risk_cost * route['risk'])
+
+class SafeRouter:
+    """
+    A* router over a RoadGraph
+
+    Arc costs are length + weight * RISK_COST_M * risk, where risk is the
+    severity-weighted crashes on the segment plus those at the intersection
+    it enters. Costs never drop below the straight-line length, so the
+    straight-line distance to the target is an admissible heuristic. Slider
+    settings listed in hierarchy_priorities are answered from a contraction
+    hierarchy persisted under cache_dir instead.
+    """
+    def __init__(self, graph, hierarchy_priorities=(), cache_dir=None):
+        self.graph = graph
+        self.hierarchy_priorities = tuple(hierarchy_priorities)
+        self.cache_dir = cache_dir
+        self._hierarchies = {}
+        self._hierarchy_lock = threading.Lock()
+        x, y = project(graph.node_lat, graph.node_lon)
+        self._x, self._y = x.tolist(), y.tolist()
+        self._indptr = graph.indptr.tolist()
+        self._indices = graph.indices.tolist()
+        arc_edge = graph.arc_edge
+        self._arc_length = graph.edge_length[arc_edge].astype(np.float64).tolist()
+        self._arc_risk = (graph.edge_severity[arc_edge] + graph.node_severity[graph.indices]).tolist()
+        # Risk of the opposite arc (entering this arc's source), for searches run backwards from the target
+        sources = np.repeat(np.arange(graph.n_nodes), np.diff(graph.indptr))
+        self._reverse_arc_risk = (graph.edge_severity[arc_edge] + graph.node_severity[sources]).tolist()
+
+        # Snap only to the main network so every snapped pair is connected
+        self._routable = np.flatnonzero(_largest_component(graph))
+        self._snap_index = CrashSpatialIndex.from_coordinates(graph.node_lat[self._routable],
+                                                              graph.node_lon[self._routable])
+
+        total_risk = graph.edge_severity.sum() + graph.node_severity.sum()
+        self.reference_risk_per_km = float(total_risk / max(graph.edge_length.sum() / 1000.0, 1e-9))
+
+    def arc_costs(self, weight):
+        """
+        Cost of every arc for a crash penalty blend weight
+
+        Args:
+            weight: Crash penalty blend weight (0-1)
+
+        Returns:
+            Array of arc costs in CSR order
+        """
+        return np.asarray(self._arc_length) + weight * RISK_COST_M * np.asarray(self._arc_risk)
+
+    def hierarchy(self, prioritize_safety):
+        """
+        Contraction hierarchy for a slider setting (loaded or built on first use)
+
+        Args:
+            prioritize_safety: "Safety vs. Speed Balance" slider value (0-10)
+
+        Returns:
+            ContractionHierarchy instance, or None if the setting has no hierarchy
+        """
+        if prioritize_safety not in self.hierarchy_priorities:
+            return None
+        if prioritize_safety not in self._hierarchies:
+            with self._hierarchy_lock:
+                if prioritize_safety not in self._hierarchies:
+                    self._hierarchies[prioritize_safety] = load_contraction_hierarchy(
+                        self.graph.indptr, self.graph.indices, self.arc_costs(safety_weight(prioritize_safety)),
+                        f"route-hierarchy-p{prioritize_safety:02d}", self.cache_dir
+                    )
+        return self._hierarchies[prioritize_safety]
+
+    def snap(self, lat, lon):
+        """
+        Nearest routable intersection to a point
+
+        Args:
+            lat: Latitude in degrees
+            lon: Longitude in degrees
+
+        Returns:
+            Tuple of (node index, distance in meters)
+        """
+        positions, distances = self._snap_index.query_knn(lat, lon, 1)
+        return int(self._routable[positions[0]]), float(distances[0])
+
+    def shortest_path(self, source, target, weight=0.0, arc_costs=None):
+        """
+        Cheapest path between two nodes
+
+        Args:
+            source: Start node index
+            target: End node index
+            weight: Crash penalty blend weight (0-1)
+            arc_costs: Optional per-arc cost list (each at least the arc's length) used instead of the blend
+
+        Returns:
+            Tuple of (node list, arc index list), or (None, None) if unreachable
+        """
+        risk_cost = weight * RISK_COST_M
+        x, y = self._x, self._y
+        indptr, indices = self._indptr, self._indices
+        lengths, risks = self._arc_length, self._arc_risk
+        if arc_costs is not None:
+            lengths, risk_cost = arc_costs, 0.0
+        tx, ty = x[target], y[target]
+        # Edge lengths are float32, so shave the heuristic to keep it a strict lower bound
+        shrink = 1.0 - 1e-6
+
+        best = {source: 0.0}
+        previous = {}
+        heap = [(math.hypot(x[source] - tx, y[source] - ty) * shrink, 0.0, source)]
+        while heap:
+            _, cost, node = heapq.heappop(heap)
+            if node == target:
+                break
+            if cost > best[node]:
+                continue
+            for arc in range(indptr[node], indptr[node + 1]):
+                neighbour = indices[arc]
+                new_cost = cost + lengths[arc] + risk_cost * risks[arc]
+                if new_cost < best.get(neighbour, math.inf):
+                    best[neighbour] = new_cost
+                    previous[neighbour] = (node, arc)
+                    estimate = new_cost + math.hypot(x[neighbour] - tx, y[neighbour] - ty) * shrink
+                    heapq.heappush(heap, (estimate, new_cost, neighbour))
+        else:
+            if target != source:
+                return None, None
+
+        nodes, arcs = [target], []
+        while nodes[-1] != source:
+            node, arc = previous[nodes[-1]]
+            nodes.append(node)
+            arcs.append(arc)
+        return nodes[::-1], arcs[::-1]
+
+    def _costs_to(self, target, arc_costs):
+        """Cheapest cost from every node to target under per-arc costs (Dijkstra run backwards)"""
+        indptr, indices = self._indptr, self._indices
+        best = [math.inf] * len(self._x)
+        best[target] = 0.0
+        heap = [(0.0, target)]
+        while heap:
+            cost, node = heapq.heappop(heap)
+            if cost > best[node]:
+                continue
+            for arc in range(indptr[node], indptr[node + 1]):
+                neighbour = indices[arc]
+                new_cost = cost + arc_costs[arc]
+                if new_cost < best[neighbour]:
+                    best[neighbour] = new_cost
+                    heapq.heappush(heap, (new_cost, neighbour))
+        return best
+
+    def pareto_paths(self, source, target, max_routes=MAX_FRONTIER_ROUTES, resolution=RISK_RESOLUTION):
+        """
+        Pareto-optimal (length, risk) paths between two nodes
+
+        Multi-objective label-setting search: labels leave the queue in order
+        of length plus exact remaining length, so a label is dominated exactly
+        when its node (or, with the remaining-risk lower bound, the target)
+        already holds a label with no more risk.
+
+        Args:
+            source: Start node index
+            target: End node index
+            max_routes: Most paths to return
+            resolution: Risk a label must save over an earlier one to be kept
+
+        Returns:
+            List of (length, risk, node list, arc list) tuples sorted from shortest to safest
+        """
+        indptr, indices = self._indptr, self._indices
+        lengths, risks = self._arc_length, self._arc_risk
+        length_to_go = self._costs_to(target, lengths)
+        risk_to_go = self._costs_to(target, self._reverse_arc_risk)
+        if length_to_go[source] == math.inf:
+            return []
+
+        # Labels are (parent label, node); node_risk holds the least risk settled at each node
+        labels = []
+        node_risk = [math.inf] * len(self._x)
+        found = []
+        target_risk = math.inf
+        heap = [(length_to_go[source], 0.0, 0.0, source, -1, -1)]
+        while heap:
+            _, length, risk, node, parent, arc = heapq.heappop(heap)
+            if risk >= node_risk[node] - resolution or risk + risk_to_go[node] >= target_risk - resolution:
+                continue
+            node_risk[node] = risk
+            labels.append((parent, node, arc))
+            label = len(labels) - 1
+            if node == target:
+                found.append((length, risk, label))
+                target_risk = risk
+                continue
+            for arc in range(indptr[node], indptr[node + 1]):
+                neighbour = indices[arc]
+                new_risk = risk + risks[arc]
+                if (new_risk >= node_risk[neighbour] - resolution
+                        or new_risk + risk_to_go[neighbour] >= target_risk - resolution):
+                    continue
+                new_length = length + lengths[arc]
+                heapq.heappush(heap, (new_length + length_to_go[neighbour], new_length, new_risk, neighbour, label, arc))
+
+        paths = []
+        for i in _thin_frontier([(length, risk) for length, risk, _ in found], max_routes):
+            length, risk, label = found[i]
+            nodes, arcs = [], []
+            while label >= 0:
+                label, node, arc = labels[label]
+                nodes.append(node)
+                arcs.append(arc)
+            paths.append((length, risk, nodes[::-1], arcs[-2::-1]))
+        return paths
+
+    def describe(self, nodes, arcs, origin, destination, mode='driving'):
+        """
+        Summarize a node path as a route dictionary
+
+        Args:
+            nodes: Node indices along the route
+            arcs: Arc indices along the route
+            origin: [lat, lng] of the trip start
+            destination: [lat, lng] of the trip end
+            mode: Transportation mode (UI or API name), for the ETA
+
+        Returns:
+            Dictionary with path, distance, ETA, crash exposure and safety level
+        """
+        graph = self.graph
+        arcs = np.asarray(arcs, dtype=np.int64)
+        edges = graph.arc_edge[arcs]
+        entered = graph.indices[arcs]
+
+        # Walk from the trip ends to the snapped intersections in a straight line
+        (ox, dx), (oy, dy) = project([origin[0], destination[0]], [origin[1], destination[1]])
+        access_m = (math.hypot(ox - self._x[nodes[0]], oy - self._y[nodes[0]])
+                    + math.hypot(dx - self._x[nodes[-1]], dy - self._y[nodes[-1]]))
+        distance_m = float(graph.edge_length[edges].sum()) + access_m
+
+        risk = float(graph.edge_severity[edges].sum() + graph.node_severity[entered].sum())
+        crashes = int(round(graph.edge_crashes[edges].sum() + graph.node_crashes[entered].sum()))
+        risk_per_km = risk / max(distance_m / 1000.0, 0.1)
+        relative_risk = risk_per_km / self.reference_risk_per_km if self.reference_risk_per_km else 0.0
+        safety_level = next(label for limit, label in SAFETY_LEVELS if relative_risk <= limit)
+
+        mode = MODE_ALIASES.get(str(mode).lower(), str(mode).lower())
+        speed = MODE_SPEEDS_MPS.get(mode, MODE_SPEEDS_MPS['driving'])
+
+        streets = []
+        for street in graph.edge_street[edges]:
+            name = str(graph.street_names[street])
+            if not streets or streets[-1] != name:
+                streets.append(name)
+
+        return {
+            'path': [list(origin)] + graph.path_coords(nodes) + [list(destination)],
+            'nodes': [int(node) for node in nodes],
+            'arcs': arcs.tolist(),
+            'distance_m': round(distance_m, 1),
+            'distance_miles': round(distance_m / METERS_PER_MILE, 1),
+            'eta_minutes': max(int(round(distance_m / speed / 60.0)), 1),
+            'risk': round(risk, 1),
+            'crashes': crashes,
+            'risk_per_km': round(risk_per_km, 1),
+            'relative_risk': round(relative_risk, 2),
+            'safety_level': safety_level,
+            'streets': streets
+        }
+
+    def route(self, origin, destination, prioritize_safety=5, mode='driving'):
+        """
+        Route between two points for a safety slider setting
+
+        Args:
+            origin: [lat, lng] of the trip start
+            destination: [lat, lng] of the trip end
+            prioritize_safety: "Safety vs. Speed Balance" slider value (0-10)
+            mode: Transportation mode (UI or API name)
+
+        Returns:
+            Route dictionary (see describe), or None if no route was found
+        """
+        source, _ = self.snap(*origin)
+        target, _ = self.snap(*destination)
+        hierarchy = self.hierarchy(prioritize_safety)
+        if hierarchy is not None:
+            _, arcs = hierarchy.query(source, target)
+            nodes = None if arcs is None else [source] + self.graph.indices[arcs].tolist()
+        else:
+            nodes, arcs = self.shortest_path(source, target, safety_weight(prioritize_safety))
+        if nodes is None:
+            return None
+        return self.describe(nodes, arcs, origin, destination, mode)
+
+    def alternative_routes(self, origin, destination, prioritize_safety=5, mode='driving', k=3, first=None):
+        """
+        Up to k genuinely different routes between two points (penalty method)
+
+        Finds the best route for the slider setting, then repeatedly makes the
+        segments of every route found so far more expensive and searches again.
+        A new route is kept if it shares at most MAX_ALTERNATIVE_OVERLAP of its
+        length with each kept route and costs at most MAX_ALTERNATIVE_STRETCH
+        times the best route under the real (unpenalized) costs.
+
+        Args:
+            origin: [lat, lng] of the trip start
+            destination: [lat, lng] of the trip end
+            prioritize_safety: "Safety vs. Speed Balance" slider value (0-10)
+            mode: Transportation mode (UI or API name)
+            k: Most routes to return
+            first: Route dictionary to start from (e.g. the frontier pick) instead of searching for it
+
+        Returns:
+            List of route dictionaries (see describe), best first
+        """
+        graph = self.graph
+        source, _ = self.snap(*origin)
+        target, _ = self.snap(*destination)
+        weight = safety_weight(prioritize_safety)
+        costs = self.arc_costs(weight)
+        if first is not None:
+            nodes, arcs = first['nodes'], first['arcs']
+        else:
+            nodes, arcs = self.shortest_path(source, target, weight)
+        if nodes is None:
+            return []
+        if len(nodes) == 1:
+            return [self.describe(nodes, arcs, origin, destination, mode)]
+
+        best_cost = float(costs[arcs].sum())
+        kept = [(nodes, arcs, set(graph.arc_edge[arcs].tolist()))]
+        edge_factor = np.ones(graph.n_edges)
+        edge_factor[graph.arc_edge[arcs]] *= ALTERNATIVE_PENALTY
+        for _ in range(k * ALTERNATIVE_ATTEMPTS_PER_ROUTE):
+            if len(kept) >= k:
+                break
+            nodes, arcs = self.shortest_path(source, target, arc_costs=(costs * edge_factor[graph.arc_edge]).tolist())
+            edges = graph.arc_edge[arcs]
+            edge_factor[edges] *= ALTERNATIVE_PENALTY
+            if float(costs[arcs].sum()) > MAX_ALTERNATIVE_STRETCH * best_cost:
+                break
+            length = float(graph.edge_length[edges].sum())
+            edge_set = set(edges.tolist())
+            if all(graph.edge_length[list(edge_set & other)].sum() <= MAX_ALTERNATIVE_OVERLAP * length
+                   for _, _, other in kept):
+                kept.append((nodes, arcs, edge_set))
+        routes = [self.describe(nodes, arcs, origin, destination, mode) for nodes, arcs, _ in kept[1:]]
+        return [first or self.describe(*kept[0][:2], origin, destination, mode)] + routes
+
+    def route_frontier(self, origin, destination, mode='driving', max_routes=MAX_FRONTIER_ROUTES):
+        """
+        Pareto frontier of (travel time, crash risk) routes between two points
+
+        Args:
+            origin: [lat, lng] of the trip start
+            destination: [lat, lng] of the trip end
+            mode: Transportation mode (UI or API name)
+            max_routes: Most routes to keep on the frontier
+
+        Returns:
+            List of route dictionaries (see describe) from fastest to safest
+        """
+        source, _ = self.snap(*origin)
+        target, _ = self.snap(*destination)
+        if source == target:
+            return [self.describe([source], [], origin, destination, mode)]
+        return [self.describe(nodes, arcs, origin, destination, mode)
+                for _, _, nodes, arcs in self.pareto_paths(source, target, max_routes)]
+
+    def route_options(self, origin, destination, prioritize_safety=5, mode='driving', frontier=None):
+        """
+        Recommended (slider setting), safest and fastest routes between two points
+
+        Slider settings with a contraction hierarchy get their recommended
+        route from a hierarchy query; other settings pick it from the frontier.
+
+        Args:
+            origin: [lat, lng] of the trip start
+            destination: [lat, lng] of the trip end
+            prioritize_safety: "Safety vs. Speed Balance" slider value (0-10)
+            mode: Transportation mode (UI or API name)
+            frontier: Routes from route_frontier for this trip, to pick from without searching again
+
+        Returns:
+            Dictionary of 'recommended', 'safest' and 'fastest' route dictionaries
+        """
+        if frontier is None:
+            frontier = self.route_frontier(origin, destination, mode)
+        recommended = None
+        if prioritize_safety in self.hierarchy_priorities:
+            # Exact optimum from the contraction hierarchy; the frontier may be thinned
+            recommended = self.route(origin, destination, prioritize_safety, mode)
+        return {
+            'recommended': recommended or choose_route(frontier, prioritize_safety),
+            'safest': frontier[-1] if frontier else None,
+            'fastest': frontier[0] if frontier else None
+        }
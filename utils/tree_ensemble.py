@@ -0,0 +1,187 @@
+"""
+Flattened tree ensembles for San Jose Safe Commute
+Exports the fitted trees of the safety forest and the incident risk booster
+into contiguous NumPy node arrays and evaluates every tree for a whole batch
+at once, one tree level per vectorized step, without sklearn's per-call validation
+"""
+
+import numpy as np
+import logging
+from scipy.special import expit, softmax
+from sklearn.dummy import DummyClassifier
+from sklearn.ensemble import RandomForestRegressor, GradientBoostingClassifier
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# sklearn marks leaves with this feature index
+TREE_LEAF = -2
+
+class FlatTreeEnsemble:
+    """
+    Node arrays for many decision trees, concatenated
+
+    Child indices are global and interleaved (children[2 * node] is the left
+    child, children[2 * node + 1] the right one), so a step is one gather per
+    array. Leaves point back to themselves with an infinite threshold, so
+    every sample takes max_depth steps from its tree's root and ends up on
+    its leaf.
+    """
+    def __init__(self, feature, threshold, children, missing_left, value, roots, max_depth):
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.missing_left = missing_left
+        self.value = value
+        self.roots = roots
+        self.max_depth = max_depth
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @classmethod
+    def from_trees(cls, trees):
+        """
+        Flatten fitted sklearn Tree objects (estimator.tree_)
+
+        Args:
+            trees: Sequence of sklearn Tree objects with single-output values
+
+        Returns:
+            FlatTreeEnsemble instance
+        """
+        features, thresholds, children, missing_lefts, values, roots = [], [], [], [], [], []
+        offset = 0
+        for tree in trees:
+            nodes = np.arange(tree.node_count)
+            leaf = tree.feature == TREE_LEAF
+            features.append(np.where(leaf, 0, tree.feature))
+            thresholds.append(np.where(leaf, np.inf, tree.threshold))
+            children.append(np.column_stack([np.where(leaf, nodes, tree.children_left),
+                                             np.where(leaf, nodes, tree.children_right)]).ravel() + offset)
+            missing_left = getattr(tree, 'missing_go_to_left', None)
+            missing_lefts.append(np.zeros(tree.node_count, dtype=bool) if missing_left is None else missing_left.astype(bool))
+            values.append(tree.value[:, 0, 0])
+            roots.append(offset)
+            offset += tree.node_count
+        return cls(
+            feature=np.concatenate(features).astype(np.intp),
+            threshold=np.concatenate(thresholds).astype(np.float64),
+            children=np.concatenate(children).astype(np.intp),
+            missing_left=np.concatenate(missing_lefts),
+            value=np.concatenate(values).astype(np.float64),
+            roots=np.array(roots, dtype=np.intp),
+            max_depth=max(tree.max_depth for tree in trees)
+        )
+
+    def leaf_values(self, X):
+        """
+        Leaf value of every tree for every sample
+
+        Args:
+            X: Feature matrix (n_samples, n_features), as the model was fitted on
+
+        Returns:
+            NumPy array of shape (n_trees, n_samples)
+        """
+        if hasattr(X, 'toarray'):
+            X = X.toarray()
+        # sklearn trees compare float32 features against float64 thresholds
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n_samples, n_features = X.shape
+        values = X.ravel()
+        row_offsets = np.arange(n_samples) * n_features
+        has_missing = bool(np.isnan(values).any())
+        nodes = np.repeat(self.roots[:, None], n_samples, axis=1)
+        for _ in range(self.max_depth):
+            x = values[row_offsets + self.feature[nodes]]
+            if has_missing:
+                # Missing values go right unless the split learned otherwise
+                go_right = ~((x <= self.threshold[nodes]) | (np.isnan(x) & self.missing_left[nodes]))
+            else:
+                go_right = x > self.threshold[nodes]
+            nodes = self.children[2 * nodes + go_right]
+        return self.value[nodes]
+
+class FlatForestRegressor:
+    """RandomForestRegressor evaluated from flattened trees"""
+    def __init__(self, model):
+        self.trees = FlatTreeEnsemble.from_trees([estimator.tree_ for estimator in model.estimators_])
+
+    def predict(self, X):
+        """
+        Predict regression targets (the mean over the trees)
+
+        Args:
+            X: Feature matrix
+
+        Returns:
+            NumPy array of predictions
+        """
+        # Summing over the tree axis adds the trees in order, as the forest does
+        return self.trees.leaf_values(X).sum(axis=0) / self.trees.n_trees
+
+class FlatGradientBoostingClassifier:
+    """GradientBoostingClassifier (prior init) evaluated from flattened trees"""
+    def __init__(self, model):
+        self.classes_ = model.classes_
+        self.learning_rate = model.learning_rate
+        self.n_stages, self.n_outputs = model.estimators_.shape
+        self.trees = FlatTreeEnsemble.from_trees([estimator.tree_ for estimator in model.estimators_.ravel()])
+        # The prior init gives every sample the same starting raw prediction
+        self.init_raw = np.asarray(model._raw_predict_init(np.zeros((1, model.n_features_in_), dtype=np.float32)),
+                                   dtype=np.float64)[0]
+
+    def decision_function(self, X):
+        """
+        Raw boosting scores
+
+        Args:
+            X: Feature matrix
+
+        Returns:
+            NumPy array of shape (n_samples, n_outputs)
+        """
+        leaves = self.trees.leaf_values(X)
+        stages = leaves.reshape(self.n_stages, self.n_outputs, -1).transpose(0, 2, 1) * self.learning_rate
+        raw = np.broadcast_to(self.init_raw, stages.shape[1:])
+        return np.concatenate([raw[None], stages]).sum(axis=0)
+
+    def predict_proba(self, X):
+        """
+        Class probabilities, in classes_ order
+
+        Args:
+            X: Feature matrix
+
+        Returns:
+            NumPy array of shape (n_samples, n_classes)
+        """
+        raw = self.decision_function(X)
+        if self.n_outputs == 1:
+            positive = expit(raw[:, 0])
+            return np.column_stack([1.0 - positive, positive])
+        return softmax(raw, axis=1)
+
+def compile_tree_model(model):
+    """
+    Flattened evaluator for a fitted forest or booster
+
+    Args:
+        model: Fitted RandomForestRegressor or GradientBoostingClassifier
+
+    Returns:
+        FlatForestRegressor or FlatGradientBoostingClassifier instance, or None if the
+        model is of another kind (multi-output, custom init estimator, ...)
+    """
+    try:
+        if isinstance(model, RandomForestRegressor) and model.n_outputs_ == 1:
+            return FlatForestRegressor(model)
+        if isinstance(model, GradientBoostingClassifier) and \
+                (isinstance(model.init_, str) and model.init_ == 'zero' or isinstance(model.init_, DummyClassifier)):
+            return FlatGradientBoostingClassifier(model)
+    except (AttributeError, ValueError) as e:
+        logger.info(f"Flat tree backend unavailable: {str(e)}")
+    return None